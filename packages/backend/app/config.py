@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.lower() in ("1", "true", "yes", "on") if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Micro-batching of model inference
+BATCH_MAX_SIZE = _env_int("PET_HEALTH_BATCH_MAX_SIZE", 8)
+BATCH_MAX_WAIT_MS = _env_float("PET_HEALTH_BATCH_MAX_WAIT_MS", 2.0)
+
+# Deadline-aware scheduling: X-Deadline-Ms and X-Priority headers, or these defaults
+REQUEST_DEADLINE_MS = _env_float("PET_HEALTH_REQUEST_DEADLINE_MS", 30000)  # 0 = no deadline
+LOAD_SHEDDING = _env_bool("PET_HEALTH_LOAD_SHEDDING", True)  # drop work that would miss its deadline
+
+# CPU-bound request stages and admission control
+WORKER_POOL_KIND = os.getenv("PET_HEALTH_WORKER_POOL", "thread")  # "thread" or "process"
+WORKER_POOL_SIZE = _env_int("PET_HEALTH_WORKER_POOL_SIZE", min(4, os.cpu_count() or 1))
+MAX_PENDING_REQUESTS = _env_int("PET_HEALTH_MAX_PENDING_REQUESTS", 32)
+INPUT_BUFFERS = _env_int("PET_HEALTH_INPUT_BUFFERS", 2 * MAX_PENDING_REQUESTS)  # pooled model inputs, 0 = none
+RETRY_AFTER_SECONDS = _env_int("PET_HEALTH_RETRY_AFTER_SECONDS", 1)
+
+# Analysis result cache
+CACHE_MAX_ENTRIES = _env_int("PET_HEALTH_CACHE_MAX_ENTRIES", 1024)
+CACHE_TTL_SECONDS = _env_float("PET_HEALTH_CACHE_TTL_SECONDS", 3600)
+CACHE_DISK_PATH = os.getenv("PET_HEALTH_CACHE_DISK_PATH") or None  # SQLite file, disabled when unset
+CACHE_DISK_FLUSH_SECONDS = _env_float("PET_HEALTH_CACHE_DISK_FLUSH_SECONDS", 0.5)  # disk writes are committed in batches
+
+# Pooled backbone embeddings, so switching analysis type only reruns the heads
+FEATURE_CACHE_MAX_ENTRIES = _env_int("PET_HEALTH_FEATURE_CACHE_MAX_ENTRIES", 4096)
+
+# Per-pet history of embeddings and general head outputs, for trends without re-inference
+HISTORY_PATH = os.getenv("PET_HEALTH_HISTORY_PATH") or None  # binary store, disabled when unset
+HISTORY_CONDITION_THRESHOLD = _env_float("PET_HEALTH_HISTORY_CONDITION_THRESHOLD", 0.5)
+
+# Similar-case retrieval: IVF-PQ index over the history's full-model embeddings
+SIMILAR_CASES_PATH = os.getenv("PET_HEALTH_SIMILAR_CASES_PATH") or None  # index directory, needs HISTORY_PATH
+SIMILAR_CASES_NLIST = _env_int("PET_HEALTH_SIMILAR_CASES_NLIST", 1024)
+SIMILAR_CASES_SUBVECTORS = _env_int("PET_HEALTH_SIMILAR_CASES_SUBVECTORS", 32)
+SIMILAR_CASES_NPROBE = _env_int("PET_HEALTH_SIMILAR_CASES_NPROBE", 64)  # cells searched per query
+
+# Near-duplicate detection of burst uploads for the same pet
+NEAR_DUPLICATE_ENABLED = _env_bool("PET_HEALTH_NEAR_DUPLICATE_ENABLED", True)
+NEAR_DUPLICATE_MAX_DISTANCE = _env_int("PET_HEALTH_NEAR_DUPLICATE_MAX_DISTANCE", 6)  # bits of 64
+NEAR_DUPLICATE_TTL_SECONDS = _env_float("PET_HEALTH_NEAR_DUPLICATE_TTL_SECONDS", 600)
+NEAR_DUPLICATE_MAX_ENTRIES = _env_int("PET_HEALTH_NEAR_DUPLICATE_MAX_ENTRIES", 100000)
+
+# Batch analysis endpoint
+BATCH_ENDPOINT_MAX_IMAGES = _env_int("PET_HEALTH_BATCH_ENDPOINT_MAX_IMAGES", 64)
+BATCH_ENDPOINT_CONCURRENCY = _env_int("PET_HEALTH_BATCH_ENDPOINT_CONCURRENCY", 2 * BATCH_MAX_SIZE)
+MAX_UPLOAD_BYTES = _env_int("PET_HEALTH_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+MAX_ARCHIVE_BYTES = _env_int("PET_HEALTH_MAX_ARCHIVE_BYTES", 100 * 1024 * 1024)  # zip uploads to the batch endpoint
+
+# Asynchronous jobs: a durable SQLite queue drained by a fixed number of workers
+JOBS_DB_PATH = os.getenv("PET_HEALTH_JOBS_DB_PATH") or None  # SQLite file, job endpoints disabled when unset
+JOBS_WORKERS = _env_int("PET_HEALTH_JOBS_WORKERS", BATCH_MAX_SIZE)  # jobs analyzed concurrently per process
+JOBS_MAX_QUEUED = _env_int("PET_HEALTH_JOBS_MAX_QUEUED", 10000)  # submits beyond this get 503
+JOBS_LEASE_SECONDS = _env_float("PET_HEALTH_JOBS_LEASE_SECONDS", 60)  # a running job is retried after this
+JOBS_MAX_ATTEMPTS = _env_int("PET_HEALTH_JOBS_MAX_ATTEMPTS", 3)
+JOBS_RESULT_TTL_SECONDS = _env_float("PET_HEALTH_JOBS_RESULT_TTL_SECONDS", 86400)
+JOBS_POLL_SECONDS = _env_float("PET_HEALTH_JOBS_POLL_SECONDS", 1.0)  # also picks up other processes' jobs
+
+# Upload validation, checked from the image header before decoding
+MAX_IMAGE_PIXELS = _env_int("PET_HEALTH_MAX_IMAGE_PIXELS", 50_000_000)  # decompression bomb limit
+ALLOWED_IMAGE_FORMATS = tuple(
+    os.getenv("PET_HEALTH_ALLOWED_IMAGE_FORMATS", "JPEG,MPO,PNG,WEBP,BMP,GIF").upper().split(",")
+)
+QUALITY_MIN_SHARPNESS = _env_float("PET_HEALTH_QUALITY_MIN_SHARPNESS", 10.0)  # blur gate, 0 disables
+
+# Model startup
+MODEL_FRAMEWORK = os.getenv("PET_HEALTH_MODEL_FRAMEWORK", "torch")  # see app.models.frameworks
+MODEL_DIR = os.getenv("PET_HEALTH_MODEL_DIR") or None  # defaults to app/models/pretrained
+# Where new weights arrive when MODEL_DIR is an exported snapshot (set by serve.py); reloads re-export from it
+MODEL_SOURCE_DIR = os.getenv("PET_HEALTH_MODEL_SOURCE_DIR") or None
+MODEL_PRELOAD = _env_bool("PET_HEALTH_MODEL_PRELOAD", True)  # load and warm up at startup, else on first request
+MODEL_WARMUP_BATCHES = _env_int("PET_HEALTH_MODEL_WARMUP_BATCHES", 2)
+MODEL_WARMUP_BATCH_SIZE = _env_int("PET_HEALTH_MODEL_WARMUP_BATCH_SIZE", BATCH_MAX_SIZE)
+MODEL_ALLOW_DOWNLOAD = _env_bool("PET_HEALTH_MODEL_ALLOW_DOWNLOAD", False)  # ImageNet backbone when no weights exist
+
+# Hot reload: new weights are loaded and warmed up in the background, then swapped in between batches
+MODEL_RELOAD_POLL_SECONDS = _env_float("PET_HEALTH_MODEL_RELOAD_POLL_SECONDS", 0)  # watch MODEL_SOURCE_DIR or MODEL_DIR, 0 = admin trigger only
+MODEL_RELOAD_SHADOW = _env_bool("PET_HEALTH_MODEL_RELOAD_SHADOW", False)  # watched weights are shadowed until promoted
+MODEL_SHADOW_SAMPLE_RATE = _env_float("PET_HEALTH_MODEL_SHADOW_SAMPLE_RATE", 0.1)  # batches also run on the candidate
+ADMIN_TOKEN = os.getenv("PET_HEALTH_ADMIN_TOKEN") or None  # X-Admin-Token for /api/v1/admin, disabled when unset
+
+# Inference backend for the backbone: "eager", "torchscript" or "int8"
+INFERENCE_BACKEND = os.getenv("PET_HEALTH_INFERENCE_BACKEND", "eager")
+INFERENCE_THREADS = _env_int("PET_HEALTH_INFERENCE_THREADS", 0)  # torch intra-op threads, 0 = torch default
+INFERENCE_INTEROP_THREADS = _env_int("PET_HEALTH_INFERENCE_INTEROP_THREADS", 0)
+CPU_SETS = os.getenv("PET_HEALTH_CPU_SETS") or None  # e.g. "0-3;4-7": each worker pins itself to a free set
+CPU_LOCK_DIR = os.getenv("PET_HEALTH_CPU_LOCK_DIR") or None  # where workers claim sets, set by serve.py
+
+# Model cascade: a small first-stage model answers confident images, the full model the rest
+CASCADE_ENABLED = _env_bool("PET_HEALTH_CASCADE_ENABLED", False)
+CASCADE_THRESHOLD = _env_float("PET_HEALTH_CASCADE_THRESHOLD", 0.8)  # escalate below this confidence
+CASCADE_ESCALATE_ON_CONDITIONS = _env_bool("PET_HEALTH_CASCADE_ESCALATE_ON_CONDITIONS", True)
+
+# Logging: records are queued on the request path and written by a background listener
+LOG_DIR = os.getenv("PET_HEALTH_LOG_DIR") or None  # defaults to app/logs
+LOG_ASYNC = _env_bool("PET_HEALTH_LOG_ASYNC", True)
+LOG_FORMAT = os.getenv("PET_HEALTH_LOG_FORMAT", "text")  # "text" or "json" (JSON lines)
+LOG_ROTATE_WHEN = os.getenv("PET_HEALTH_LOG_ROTATE_WHEN", "midnight")  # TimedRotatingFileHandler interval
+LOG_MAX_BYTES = _env_int("PET_HEALTH_LOG_MAX_BYTES", 0)  # rotate by size instead of time when set
+LOG_BACKUP_COUNT = _env_int("PET_HEALTH_LOG_BACKUP_COUNT", 14)
+# api.<pid>.log and error.<pid>.log, so server processes never rotate one shared file;
+# on by default in worker processes (uvicorn --workers, serve.py)
+LOG_PER_PROCESS = _env_bool("PET_HEALTH_LOG_PER_PROCESS", multiprocessing.parent_process() is not None)
+
+# Metrics
+SERVER_TIMING = _env_bool("PET_HEALTH_SERVER_TIMING", False)  # per-request stage timings in a Server-Timing header
@@ -0,0 +1,145 @@
+import copy
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+INFERENCE_BACKENDS = ('eager', 'torchscript', 'int8')
+
+
+class FeatureExtractor(nn.Module):
+    """The backbone part of PetHealthModel as a standalone module, for tracing and quantization"""
+
+    def __init__(self, model):
+        super(FeatureExtractor, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.extract_features(x)
+
+
+class EagerBackend:
+    """Plain PyTorch, optionally in channels_last memory format"""
+
+    name = 'eager'
+
+    def __init__(self, model, channels_last=True):
+        self.channels_last = channels_last
+        self.module = FeatureExtractor(model).eval()
+        if channels_last:
+            self.module = self.module.to(memory_format=torch.channels_last)
+
+    def prepare_input(self, x):
+        if self.channels_last:
+            return x.contiguous(memory_format=torch.channels_last)
+        return x.contiguous()
+
+    @torch.no_grad()
+    def __call__(self, x):
+        return self.module(self.prepare_input(x))
+
+
+class TorchScriptBackend(EagerBackend):
+    """Traced, frozen and inference-optimized TorchScript graph (fused conv/bn, no Python dispatch)"""
+
+    name = 'torchscript'
+
+    def __init__(self, model, channels_last=True, input_size=(224, 224)):
+        super().__init__(model, channels_last)
+        width, height = input_size
+        example = self.prepare_input(torch.zeros(1, 3, height, width))
+        with torch.no_grad(), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            traced = torch.jit.trace(self.module, example)
+            self.module = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+
+class Int8Backend(EagerBackend):
+    """
+    Static int8 quantization of the backbone through FX graph mode.
+
+    Activation ranges are calibrated on calibration_batches; convolutions run
+    as int8 kernels and the pooled features come out as float, so the heads
+    are unchanged. CPU only.
+    """
+
+    name = 'int8'
+
+    def __init__(self, model, calibration_batches, channels_last=True):
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        engine = _quantized_engine()
+        torch.backends.quantized.engine = engine
+
+        super().__init__(copy.deepcopy(model).cpu(), channels_last=False)
+        example = (calibration_batches[0],)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            prepared = prepare_fx(self.module, get_default_qconfig_mapping(engine), example)
+            with torch.no_grad():
+                for batch in calibration_batches:
+                    prepared(batch)
+            self.module = convert_fx(prepared)
+        self.channels_last = channels_last
+
+
+def _quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError("No quantized engine available")
+
+
+def synthetic_calibration_images(count=32, input_size=(224, 224), seed=0):
+    """Smooth, photo-like uint8 images for calibration when no real photos are given"""
+    rng = np.random.default_rng(seed)
+    width, height = input_size
+    y, x = np.mgrid[:height, :width].astype(np.float32)
+    images = []
+    for _ in range(count):
+        channels = []
+        for _ in range(3):
+            fx, fy = rng.uniform(0.005, 0.08, size=2)
+            phase = rng.uniform(0, 2 * np.pi)
+            base = rng.uniform(40, 200)
+            channel = base + rng.uniform(20, 60) * np.sin(fx * x + fy * y + phase)
+            channels.append(channel + rng.normal(0, 8, size=channel.shape))
+        images.append(np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8))
+    return images
+
+
+def configure_threads(num_threads=0, interop_threads=0):
+    """Set torch intra-op and inter-op thread counts; 0 keeps torch's default"""
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only allowed before any inter-op parallel work has started
+            print("Warning: torch inter-op threads already initialized, keeping current setting")
+
+
+def build_backend(name, model, preprocess_batch=None, calibration_images=None,
+                  channels_last=True, input_size=(224, 224), calibration_batch_size=8):
+    """
+    Build an inference backend for the backbone of model.
+
+    preprocess_batch turns a list of uint8 images into a model input batch;
+    it is only needed for int8 calibration.
+    """
+    if name == 'eager':
+        return EagerBackend(model, channels_last)
+    if name == 'torchscript':
+        return TorchScriptBackend(model, channels_last, input_size)
+    if name == 'int8':
+        images = calibration_images or synthetic_calibration_images(input_size=input_size)
+        batches = [
+            preprocess_batch(images[i:i + calibration_batch_size]).cpu()
+            for i in range(0, len(images), calibration_batch_size)
+        ]
+        return Int8Backend(model, batches, channels_last)
+    raise ValueError(f"Unknown inference backend: {name}")
@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Callable, List, Optional
+
+from app.utils.metrics import REGISTRY
+
+# Priority classes, most urgent first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+SHED_REQUESTS = REGISTRY.counter(
+    "pet_health_shed_total", "Requests dropped because their deadline could not be met",
+    ("stage", "priority")
+)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline has passed or can no longer be met"""
+
+    def __init__(self, stage: str, retry_after: int = 1):
+        super().__init__(f"Deadline cannot be met ({stage})")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class InferenceBatcher:
+    """
+    Gather concurrent inference requests into a single batched call.
+
+    Callers ``await submit(item)``; a background task drains the queue into
+    batches of at most ``max_batch_size`` items, waiting no longer than
+    ``max_wait_ms`` for stragglers, runs ``batch_fn`` once per batch and fans
+    the results back out to each caller in order.
+
+    Items carry a priority class and an optional deadline (``loop.time()``
+    seconds). Batches take higher priorities first and, within a class, the
+    earliest deadline. With ``shed`` set, work that cannot finish in time
+    is dropped with ``DeadlineExceeded`` instead of using the model: at
+    submit when the queue ahead of it already needs longer than its
+    deadline allows, and when a batch is formed for items that expired
+    while waiting. Both estimates use a moving average of batch duration.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 2.0,
+        executor=None,
+        shed: bool = True,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        self.executor = executor
+        self.shed = shed
+        # Moving average of batch duration; 0 until the first batch has run
+        self.batch_seconds = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._heap: list = []
+        self._arrived: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sequence = itertools.count()
+        self._busy_until = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Items waiting for a batch"""
+        return len(self._heap)
+
+    async def submit(self, item: Any, priority: int = PRIORITIES["normal"],
+                     deadline: Optional[float] = None) -> Any:
+        """Queue an item for inference and wait for its result"""
+        self._ensure_started()
+        if self.shed and deadline is not None and self._finish_estimate(priority) > deadline:
+            SHED_REQUESTS.inc("admission", PRIORITY_NAMES.get(priority, str(priority)))
+            raise DeadlineExceeded("admission", self._retry_after())
+        future = self._loop.create_future()
+        entry = (priority, deadline if deadline is not None else float("inf"), next(self._sequence), item, future)
+        heapq.heappush(self._heap, entry)
+        self._arrived.set()
+        return await future
+
+    async def close(self):
+        """Stop the background batching task"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        self._heap = []
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._heap = []
+            self._arrived = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    def _finish_estimate(self, priority: int) -> float:
+        """When a new item of this priority would finish, from the work queued at or above it"""
+        ahead = sum(1 for entry in self._heap if entry[0] <= priority)
+        batches = ahead // self.max_batch_size + 1
+        start = max(self._loop.time(), self._busy_until)
+        return start + batches * self.batch_seconds
+
+    def _retry_after(self) -> int:
+        backlog = (len(self._heap) / self.max_batch_size + 1) * self.batch_seconds
+        return max(1, int(backlog + 0.999))
+
+    async def _collect(self) -> list:
+        while not self._heap:
+            self._arrived.clear()
+            await self._arrived.wait()
+
+        # Give concurrent requests a short window to join, unless the batch is already full
+        deadline = self._loop.time() + self.max_wait
+        while len(self._heap) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+        # Most urgent first; drop callers that gave up and, when shedding, work that would finish late
+        batch = []
+        finish = self._loop.time() + self.batch_seconds
+        while self._heap and len(batch) < self.max_batch_size:
+            priority, item_deadline, _, item, future = heapq.heappop(self._heap)
+            if future.done():
+                continue
+            if self.shed and item_deadline < finish:
+                SHED_REQUESTS.inc("queue", PRIORITY_NAMES.get(priority, str(priority)))
+                future.set_exception(DeadlineExceeded("queue", self._retry_after()))
+                continue
+            batch.append((item, future))
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            started = time.perf_counter()
+            self._busy_until = self._loop.time() + self.batch_seconds
+            try:
+                results = await self._loop.run_in_executor(
+                    self.executor, self.batch_fn, items
+                )
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                self.batch_seconds = elapsed if not self.batch_seconds else 0.8 * self.batch_seconds + 0.2 * elapsed
+                self._busy_until = 0.0
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,109 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional, Tuple
+
+from app.utils.memory import process_memory
+from app.utils.metrics import REGISTRY
+
+
+class Framework(NamedTuple):
+    loader: str  # "module:Class" of its model loader
+    modules: Tuple[str, ...]  # heavy modules the loader needs, imported on first model load
+    extra: Optional[str] = None  # setup.py extra that installs them
+
+
+# Model loaders by framework. Selecting one only imports its loader module;
+# loaders call import_framework() when they first load a model.
+FRAMEWORKS = {
+    "torch": Framework("app.models.model_loader:PetHealthModelLoader", ("torch", "torchvision")),
+    "tensorflow": Framework(
+        "ml_service.models.model_loader:PetHealthModelLoader", ("tensorflow", "tensorflow_hub"), "tensorflow"
+    ),
+}
+
+# What the API calls on its model loader
+SERVING_INTERFACE = (
+    "ensure_loaded", "check_weights", "startup", "extract_features_batch", "analyze_features", "answered_by",
+    "version_of", "embedding", "full_features", "history_record", "reload", "promote",
+    "discard_candidate", "shadow_report", "weights_changed",
+)
+
+_imports = {}
+_import_lock = threading.Lock()
+
+REGISTRY.callback(
+    "pet_health_framework_import_seconds", "Time taken to import each model framework on first use",
+    lambda: {(name,): cost["seconds"] for name, cost in _imports.items()}, ("framework",)
+)
+
+
+def register_framework(name: str, loader: str, modules=(), extra: Optional[str] = None):
+    """Make a model loader selectable by name, e.g. from PET_HEALTH_MODEL_FRAMEWORK"""
+    FRAMEWORKS[name] = Framework(loader, tuple(modules), extra)
+
+
+def _framework(name: str) -> Framework:
+    try:
+        return FRAMEWORKS[name]
+    except KeyError:
+        raise ValueError(f"Unknown model framework {name!r}, expected one of {', '.join(FRAMEWORKS)}")
+
+
+def is_available(name: str) -> bool:
+    """Whether a framework's modules are installed, without importing them"""
+    return all(importlib.util.find_spec(module) is not None for module in _framework(name).modules)
+
+
+def import_framework(name: str):
+    """
+    Import a framework's modules once, recording how long that took and
+    how much resident memory it added for import_report()
+    """
+    framework = _framework(name)
+    with _import_lock:
+        if name in _imports:
+            return
+        missing = [module for module in framework.modules if importlib.util.find_spec(module) is None]
+        if missing:
+            hint = f", install with: pip install pet-health-ai[{framework.extra}]" if framework.extra else ""
+            raise ImportError(f"Model framework {name!r} needs {', '.join(missing)}{hint}")
+        rss_before = process_memory().get("rss")
+        started = time.perf_counter()
+        for module in framework.modules:
+            importlib.import_module(module)
+        rss_after = process_memory().get("rss")
+        _imports[name] = {
+            "seconds": time.perf_counter() - started,
+            "rss_mib": rss_after - rss_before if rss_before is not None else None,
+        }
+
+
+def loader_class(name: str):
+    """A framework's model loader class; imports the loader module, not the framework"""
+    module, _, attr = _framework(name).loader.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def create_model_loader(name: str, **options):
+    """Model loader for the API; raises ValueError when the framework's loader cannot serve it"""
+    cls = loader_class(name)
+    missing = [method for method in SERVING_INTERFACE if not callable(getattr(cls, method, None))]
+    if missing:
+        raise ValueError(f"The {name} model loader cannot serve the API, it lacks {', '.join(missing)}")
+    return cls(**options)
+
+
+def import_report() -> dict:
+    """Frameworks imported by this process so far, with their cost, and which are installed"""
+    return {
+        name: {
+            "installed": is_available(name),
+            "imported": all(module in sys.modules for module in framework.modules),
+            "import_seconds": _imports.get(name, {}).get("seconds"),
+            "import_rss_mib": _imports.get(name, {}).get("rss_mib"),
+        }
+        for name, framework in FRAMEWORKS.items()
+    }
@@ -0,0 +1,27 @@
+# Output labels and analysis types, kept free of framework imports so the
+# API can describe results before (or without) loading a model
+
+# Analysis types with their own heads; "general" uses the main heads
+ANALYSIS_REGIONS = ('skin', 'eyes', 'ears', 'mouth')
+
+# Output labels, in head output order
+HEALTH_STATUSES = (
+    'healthy',
+    'minor_issues',
+    'attention_needed',
+    'requires_vet',
+    'emergency'
+)
+
+CONDITIONS = (
+    'skin_infection',
+    'eye_problem',
+    'ear_infection',
+    'dental_issue',
+    'weight_concern',
+    'mobility_issue',
+    'respiratory_problem',
+    'digestive_issue',
+    'behavioral_concern',
+    'other'
+)
@@ -1,50 +1,576 @@
-import numpy as np
-from PIL import Image
+import fcntl
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 
 from pathlib import Path
-from .pet_health_model import PetHealthPredictor
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from app.utils.metrics import REGISTRY
+from .frameworks import import_framework
+
+if TYPE_CHECKING:
+    import torch
+    from .pet_health_model import PetHealthPredictor
+
+CASCADE_IMAGES = REGISTRY.counter(
+    "pet_health_cascade_images_total", "Images answered by each cascade stage", ("stage",)
+)
+
+def _escalation_ratio():
+    fast, full = CASCADE_IMAGES.value("fast"), CASCADE_IMAGES.value("full")
+    return {(): full / (fast + full) if fast + full else None}
+
+REGISTRY.callback(
+    "pet_health_cascade_escalation_ratio", "Fraction of images escalated to the full model", _escalation_ratio
+)
+MODEL_RELOADS = REGISTRY.counter(
+    "pet_health_model_reloads_total", "Model reloads by outcome", ("outcome",)
+)
+SHADOW_IMAGES = REGISTRY.counter(
+    "pet_health_shadow_images_total",
+    "Images shadowed through the candidate model, by whether it agreed with the active one", ("outcome",)
+)
+SHADOW_BATCH_SECONDS = REGISTRY.histogram(
+    "pet_health_shadow_batch_seconds", "Backbone time of shadowed batches on each model", ("model",)
+)
+
+# Where weights are read from unless a model_dir is given
+DEFAULT_MODEL_DIR = Path(__file__).parent / 'pretrained'
+
+
+def _model_module():
+    """app.models.pet_health_model, importing torch the first time a model is loaded"""
+    import_framework("torch")
+    from . import pet_health_model
+    return pet_health_model
+
+class ReloadInProgress(Exception):
+    """Raised when a reload is requested while another one is loading"""
+
+class LoadedModel(NamedTuple):
+    """One set of loaded weights: the full model, the cascade's first stage and their version"""
+    predictor: Optional["PetHealthPredictor"]
+    fast_predictor: Optional["PetHealthPredictor"]
+    version: Optional[str]
+    source: Optional[Path]  # weights file, None for the untrained fallback
+
+class ModelFeatures(NamedTuple):
+    """Embedding from extract_features_batch, tagged with the stage and the model that produced it"""
+    stage: str  # "fast" or "full"
+    features: "torch.Tensor"
+    model: LoadedModel
 
 class PetHealthModelLoader:
-    def __init__(self):
-        self.model_dir = Path(__file__).parent / 'pretrained'
+    """
+    Loads the health model and runs it, optionally as a two-stage cascade.
+    
+    In cascade mode a small MobileNetV3 model (pet_health_fast.pt) sees
+    every image first. Only images whose general health prediction is less
+    confident than cascade_threshold, or that show any condition when
+    cascade_escalate_on_conditions is set, also run through the full
+    EfficientNet model. Results report which stage answered.
+    
+    New weights can be swapped in while serving: ``reload`` loads and warms
+    them up in the calling thread and then replaces the active model in one
+    assignment, so a running batch finishes on the old model and the next
+    batch uses the new one. Embeddings carry the model that produced them,
+    so their heads always match their backbone across a swap. A reload in
+    shadow mode keeps the new weights as a candidate instead: a sample of
+    batches also runs through it, off the request path, to compare latency
+    and answers with the active model until it is promoted or discarded.
+    Weights are memory-mapped, so new ones must be renamed over the old
+    file (as save_model_bundle does), never rewritten in place.
+    
+    When model_dir is a snapshot shared by several server processes (see
+    serve.py), source_dir is where new weights arrive: changes are detected
+    there, and a reload first exports them into model_dir, once for all
+    processes sharing it, then loads them from there.
+    """
+    
+    def __init__(self, model_dir=None, lazy=False, allow_download=False,
+                 backend='eager', num_threads=0, interop_threads=0,
+                 cascade=False, cascade_threshold=0.8, cascade_escalate_on_conditions=True,
+                 shadow_sample_rate=0.1, source_dir=None):
+        self.model_dir = Path(model_dir) if model_dir else DEFAULT_MODEL_DIR
+        self.source_dir = Path(source_dir) if source_dir else None
+        # Self-contained bundle (see save_model_bundle), preferred for fast startup
+        self.bundle_path = self.model_dir / 'pet_health_model.pt'
+        # Legacy state dict
         self.model_path = self.model_dir / 'pet_health_model.pth'
-        self.predictor = None
-        self._initialize_models()
+        # First-stage model of the cascade
+        self.fast_bundle_path = self.model_dir / 'pet_health_fast.pt'
+        self.cascade = cascade
+        self.cascade_threshold = cascade_threshold
+        self.cascade_escalate_on_conditions = cascade_escalate_on_conditions
+        self.allow_download = allow_download
+        # Inference backend for the backbone, see app.models.backends
+        self.backend = backend
+        self.num_threads = num_threads
+        self.interop_threads = interop_threads
+        self.active = LoadedModel(None, None, None, None)
+        self.load_seconds = None
+        self.ready = False
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._weights_signature = None
+        # Shadow mode: a candidate model compared against the active one on sampled batches
+        self.candidate: Optional[LoadedModel] = None
+        self.shadow_sample_rate = shadow_sample_rate
+        self._shadow_stats = None
+        self._shadow_lock = threading.Lock()
+        self._shadow_busy = False
+        self._shadow_executor = None
+        if not lazy:
+            self._initialize_models()
+        
+    @property
+    def predictor(self):
+        return self.active.predictor
+    
+    @property
+    def fast_predictor(self):
+        return self.active.fast_predictor
+    
+    @property
+    def model_version(self):
+        return self.active.version
+    
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+    
+    def ensure_loaded(self):
+        """Load the model on first use"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._initialize_models()
+    
+    def startup(self, warmup_batches=2, warmup_batch_size=8):
+        """Load the model and warm it up; the loader reports ready afterwards"""
+        self.ensure_loaded()
+        self.warmup(warmup_batches, warmup_batch_size)
+        self.ready = True
+    
+    def warmup(self, batches=2, batch_size=8, model=None):
+        """Run dummy batches so allocator and kernel caches are populated before real traffic"""
+        model = model or self.active
+        if model.predictor is None or batches <= 0:
+            return
+        width, height = model.predictor.input_size
+        images = [np.zeros((height, width, 3), dtype=np.uint8)] * batch_size
+        for _ in range(batches):
+            for predictor in (model.predictor, model.fast_predictor):
+                if predictor is not None:
+                    predictor.extract_features_batch(images)
         
     def _initialize_models(self):
         """Initialize the pet health model"""
+        start = time.perf_counter()
+        import_framework("torch")
+        from .backends import configure_threads
+        configure_threads(self.num_threads, self.interop_threads)
+        # Taken before loading, so weights replaced meanwhile still count as new
+        self._weights_signature = self.weights_signature()
+        self.active = self._load_models()
+        self.load_seconds = time.perf_counter() - start
+        self._loaded = True
+    
+    def check_weights(self):
+        """Raise FileNotFoundError when the configuration needs a weights file the model directory lacks"""
+        if self.cascade and not self.fast_bundle_path.exists():
+            raise FileNotFoundError(
+                f"The cascade is enabled but its first-stage model {self.fast_bundle_path} is missing; "
+                "train it or disable the cascade (PET_HEALTH_CASCADE_ENABLED=false)"
+            )
+    
+    def _load_models(self) -> LoadedModel:
+        """Load the weights currently on disk, without touching the active model"""
+        # An untrained first stage would answer every image it is "confident" about at random
+        self.check_weights()
+        predictor = fast_predictor = version = source = None
+        PetHealthPredictor = _model_module().PetHealthPredictor
         try:
             # Try to load the real model if it exists
-            if self.model_path.exists():
-                self.predictor = PetHealthPredictor(str(self.model_path))
+            if self.bundle_path.exists():
+                predictor = PetHealthPredictor(str(self.bundle_path))
+                version = predictor.version or self._weights_version(self.bundle_path)
+                source = self.bundle_path
+            elif self.model_path.exists():
+                predictor = PetHealthPredictor(str(self.model_path))
+                version = self._weights_version(self.model_path)
+                source = self.model_path
             else:
                 # Fall back to the model without pretrained weights
-                self.predictor = PetHealthPredictor()
+                predictor = PetHealthPredictor(pretrained_backbone=self.allow_download)
+                version = "untrained"
                 print("Warning: Using untrained model - predictions will be random")
         except Exception as e:
             print(f"Error loading model: {str(e)}")
-            self.predictor = None
+            return LoadedModel(None, None, None, None)
+        if self.cascade:
+            fast_predictor, version = self._load_fast_model(version)
+        return self._apply_backend(LoadedModel(predictor, fast_predictor, version, source))
         
-    def analyze_health(self, image_array):
+    def _load_fast_model(self, version):
+        """The first-stage model of the cascade and the combined version; without one the cascade is off"""
+        PetHealthPredictor = _model_module().PetHealthPredictor
+        try:
+            fast_predictor = PetHealthPredictor(str(self.fast_bundle_path))
+            fast_version = fast_predictor.version or self._weights_version(self.fast_bundle_path)
+        except Exception as e:
+            print(f"Error loading first-stage model, cascade disabled: {str(e)}")
+            return None, version
+        # Which stage answers depends on the threshold, so it is part of the version
+        return fast_predictor, f"{version}+cascade-{fast_version}@{self.cascade_threshold:g}"
+    
+    def _apply_backend(self, model: LoadedModel) -> LoadedModel:
+        if self.backend == 'eager':
+            return model
+        try:
+            model.predictor.set_backend(self.backend)
+            if model.fast_predictor is not None:
+                model.fast_predictor.set_backend(self.backend)
+            # Optimized backends can differ slightly from fp32, keep their cached results apart
+            return model._replace(version=f"{model.version}+{self.backend}")
+        except Exception as e:
+            print(f"Warning: could not build {self.backend} backend, using eager: {str(e)}")
+            return model
+    
+    def weights_signature(self):
         """
-        Analyze pet health from image
+        Size and modification time of each weights file the loader reads, or
+        of their counterparts in source_dir when set, to notice new ones
+        """
+        paths = [self.bundle_path, self.model_path] + ([self.fast_bundle_path] if self.cascade else [])
+        if self.source_dir is not None:
+            paths = [self.source_dir / path.name for path in paths]
+        signature = []
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            signature.append((path.name, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+    
+    def weights_changed(self):
+        """Whether the weights on disk differ from those last loaded"""
+        return self._loaded and self.weights_signature() != self._weights_signature
+    
+    def reload(self, warmup_batches=2, warmup_batch_size=8, shadow=False):
         """
+        Load and warm up the weights on disk, then swap them in or, with
+        shadow set, keep them as the candidate. Blocks the calling thread
+        for the whole load; requests keep using the active model meanwhile.
+        
+        Returns the loaded version. Raises ReloadInProgress while another
+        reload is loading, and RuntimeError when no usable weights were
+        found, leaving the active model in place.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise ReloadInProgress("A model reload is already in progress")
+        try:
+            self.ensure_loaded()
+            # Recorded even when loading fails, so a broken file is not retried until replaced
+            self._weights_signature = self.weights_signature()
+            try:
+                if self.source_dir is not None:
+                    self.export_from_source(self._weights_signature)
+                model = self._load_models()
+            except FileNotFoundError:
+                MODEL_RELOADS.inc("failed")
+                raise
+            if model.predictor is None or model.source is None:
+                MODEL_RELOADS.inc("failed")
+                raise RuntimeError(f"No usable weights in {self.model_dir}, keeping model {self.model_version}")
+            current = self.candidate if shadow and self.candidate is not None else self.active
+            if model.version == current.version:
+                MODEL_RELOADS.inc("unchanged")
+                return model.version
+            self.warmup(warmup_batches, warmup_batch_size, model)
+            if shadow:
+                with self._shadow_lock:
+                    self._shadow_stats = {"batches": 0, "images": 0, "agreed": 0,
+                                          "active_seconds": 0.0, "candidate_seconds": 0.0}
+                    self.candidate = model
+                MODEL_RELOADS.inc("shadowed")
+            else:
+                self.active = model
+                MODEL_RELOADS.inc("promoted")
+            return model.version
+        finally:
+            self._reload_lock.release()
+    
+    def promote(self):
+        """Make the shadowed candidate the active model; returns its version"""
+        with self._shadow_lock:
+            candidate, self.candidate = self.candidate, None
+        if candidate is None:
+            raise RuntimeError("No candidate model to promote")
+        self.active = candidate
+        MODEL_RELOADS.inc("promoted")
+        return candidate.version
+    
+    def discard_candidate(self):
+        """Stop shadowing and drop the candidate model"""
+        with self._shadow_lock:
+            self.candidate = None
+    
+    def shadow_report(self):
+        """Agreement and mean batch latency of the candidate against the active model, or None"""
+        with self._shadow_lock:
+            if self.candidate is None:
+                return None
+            stats = dict(self._shadow_stats)
+            version = self.candidate.version
+        batches = stats["batches"]
+        return {
+            "candidate_version": version,
+            "batches": batches,
+            "images": stats["images"],
+            "agreement": stats["agreed"] / stats["images"] if stats["images"] else None,
+            "active_batch_ms": stats["active_seconds"] / batches * 1000 if batches else None,
+            "candidate_batch_ms": stats["candidate_seconds"] / batches * 1000 if batches else None,
+        }
+        
+    def export_bundle(self, path=None):
+        """Write the loaded model as a self-contained bundle, by default next to the legacy weights"""
+        self.ensure_loaded()
         if self.predictor is None:
+            raise RuntimeError("No model loaded")
+        path = Path(path) if path else self.bundle_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        save_model_bundle = _model_module().save_model_bundle
+        # Each bundle keeps the version of its own weights; a loader of the
+        # exported files derives the cascade and backend parts again
+        source = self.active.source
+        version = self.predictor.version or (self._weights_version(source) if source else "untrained")
+        if self.fast_predictor is not None:
+            # First, so a watcher of the directory never sees a new full model beside an old first stage
+            save_model_bundle(
+                self.fast_predictor.model, path.parent / self.fast_bundle_path.name,
+                version=self.fast_predictor.version or self._weights_version(self.fast_bundle_path)
+            )
+        save_model_bundle(self.predictor.model, path, version=version)
+        return path
+        
+    def export_from_source(self, signature=None, allow_untrained=False):
+        """
+        Export the weights in source_dir as bundles into model_dir, unless
+        they were already exported there. Processes sharing model_dir take
+        turns under a file lock, so only the first one of them exports.
+        Without usable weights in source_dir this raises RuntimeError, or
+        with allow_untrained exports the untrained model.
+        """
+        signature = repr(signature or self.weights_signature())
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        marker = self.model_dir / 'source-signature'
+        with open(self.model_dir / 'export.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if marker.exists() and marker.read_text() == signature:
+                return
+            exporter = PetHealthModelLoader(
+                model_dir=self.source_dir, cascade=self.cascade,
+                cascade_threshold=self.cascade_threshold,
+                cascade_escalate_on_conditions=self.cascade_escalate_on_conditions,
+            )
+            if exporter.active.source is None and not allow_untrained:
+                raise RuntimeError(f"No usable weights in {self.source_dir}, keeping model {self.model_version}")
+            exporter.export_bundle(self.bundle_path)
+            tmp_path = marker.with_name(f'{marker.name}.{os.getpid()}.tmp')
+            tmp_path.write_text(signature)
+            os.replace(tmp_path, marker)
+    
+    @staticmethod
+    def _weights_version(path):
+        """Short content hash of a weights file, used to key cached results"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+        
+    def analyze_health(self, image_array, analysis_type='general'):
+        """
+        Analyze pet health from image
+        """
+        return self.analyze_health_batch([image_array], analysis_type)[0]
+    
+    def analyze_health_batch(self, image_arrays, analysis_type='general'):
+        """
+        Analyze pet health for a batch of images in one forward pass
+        """
+        return [
+            self.analyze_features(features, analysis_type)
+            for features in self.extract_features_batch(image_arrays)
+        ]
+    
+    def extract_features_batch(self, image_arrays):
+        """
+        Pooled backbone embeddings for a batch of images, one tensor per image.
+        Entries are None when the model is unavailable.
+        """
+        self.ensure_loaded()
+        # One model for the whole batch, even if a reload swaps it meanwhile
+        model = self.active
+        if model.predictor is None:
+            return [None for _ in image_arrays]
+            
+        try:
+            started = time.perf_counter()
+            features = self._extract_features(model, image_arrays)
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            print(f"Error during feature extraction: {str(e)}")
+            return [None for _ in image_arrays]
+        
+        candidate = self.candidate
+        if candidate is None or random.random() >= self.shadow_sample_rate:
+            return features
+        # Batches finish on several worker threads; at most one shadow run at a time
+        with self._shadow_lock:
+            if self._shadow_busy:
+                return features
+            self._shadow_busy = True
+            if self._shadow_executor is None:
+                self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        # The arrays may be pooled buffers, lent to other requests once this batch returns
+        image_arrays = [np.array(image, copy=True) for image in image_arrays]
+        self._shadow_executor.submit(self._compare_candidate, candidate, image_arrays, features, elapsed)
+        return features
+    
+    def _extract_features(self, model, image_arrays, count_stages=True):
+        if model.fast_predictor is not None:
+            return self._cascade_features_batch(model, image_arrays, count_stages)
+        features = model.predictor.extract_features_batch(image_arrays)
+        # Clone rows so cached embeddings don't pin the whole batch
+        return [ModelFeatures('full', row.clone(), model) for row in features]
+    
+    def _cascade_features_batch(self, model, image_arrays, count_stages=True):
+        """First-stage embeddings for confident images, full-model embeddings for the rest"""
+        fast_features = model.fast_predictor.extract_features_batch(image_arrays)
+        gate = model.fast_predictor.predict_from_features(fast_features, 'general')
+        results = [ModelFeatures('fast', row.clone(), model) for row in fast_features]
+        
+        escalate = [
+            i for i, result in enumerate(gate)
+            if result['confidence'] < self.cascade_threshold
+            or (self.cascade_escalate_on_conditions and result['conditions_detected'])
+        ]
+        if escalate:
+            full_features = model.predictor.extract_features_batch([image_arrays[i] for i in escalate])
+            for i, row in zip(escalate, full_features):
+                results[i] = ModelFeatures('full', row.clone(), model)
+        
+        if count_stages:
+            CASCADE_IMAGES.inc('fast', amount=len(image_arrays) - len(escalate))
+            CASCADE_IMAGES.inc('full', amount=len(escalate))
+        return results
+    
+    def _compare_candidate(self, candidate, image_arrays, features, active_seconds):
+        """Run a batch the active model answered through the candidate and record how they compare"""
+        try:
+            started = time.perf_counter()
+            candidate_features = self._extract_features(candidate, image_arrays, count_stages=False)
+            candidate_seconds = time.perf_counter() - started
+            agreed = sum(
+                self._same_answer(self.analyze_features(a), self.analyze_features(c))
+                for a, c in zip(features, candidate_features)
+            )
+            with self._shadow_lock:
+                if self.candidate is not candidate:
+                    return
+                stats = self._shadow_stats
+                stats["batches"] += 1
+                stats["images"] += len(image_arrays)
+                stats["agreed"] += agreed
+                stats["active_seconds"] += active_seconds
+                stats["candidate_seconds"] += candidate_seconds
+            SHADOW_BATCH_SECONDS.observe(active_seconds, "active")
+            SHADOW_BATCH_SECONDS.observe(candidate_seconds, "candidate")
+            SHADOW_IMAGES.inc("agree", amount=agreed)
+            SHADOW_IMAGES.inc("disagree", amount=len(image_arrays) - agreed)
+        except Exception as e:
+            print(f"Error during shadow comparison: {str(e)}")
+        finally:
+            with self._shadow_lock:
+                self._shadow_busy = False
+    
+    @staticmethod
+    def _same_answer(a, b):
+        """Both models gave the same general health status and detected the same conditions"""
+        return (a['health_status'] == b['health_status']
+                and {c['condition'] for c in a['conditions_detected']}
+                == {c['condition'] for c in b['conditions_detected']})
+    
+    @staticmethod
+    def answered_by(features):
+        """Which stage produced an embedding: "fast", "full", or None without a model"""
+        if features is None:
+            return None
+        return features.stage
+    
+    @staticmethod
+    def version_of(features):
+        """Version of the model that produced an embedding, or None without a model"""
+        if features is None:
+            return None
+        return features.model.version
+    
+    def analyze_features(self, features, analysis_type='general'):
+        """
+        Run the heads for one analysis type on an embedding from extract_features_batch
+        """
+        if features is None:
             # Return mock results if model failed to load
-            return {
-                'health_status': np.array([0.8, 0.1, 0.05, 0.03, 0.02]),
-                'conditions': np.array([0.1, 0.1, 0.1, 0.1, 0.1]),
-            }
+            return self._mock_results()
             
         try:
-            # Use the real model for prediction
-            results = self.predictor.predict(image_array)
-            return results
+            predictor = features.model.fast_predictor if features.stage == 'fast' else features.model.predictor
+            return predictor.predict_from_features(features.features, analysis_type)[0]
         except Exception as e:
             print(f"Error during prediction: {str(e)}")
             # Return mock results on error
-            return {
-                'health_status': np.array([0.8, 0.1, 0.05, 0.03, 0.02]),
-                'conditions': np.array([0.1, 0.1, 0.1, 0.1, 0.1]),
-            }
+            return self._mock_results()
+    
+    @staticmethod
+    def embedding(features):
+        """An embedding from extract_features_batch as a NumPy vector"""
+        return features.features.cpu().numpy().ravel()
+    
+    def full_features(self, image_array, model=None):
+        """Full-model embedding for one preprocessed image, bypassing the cascade"""
+        self.ensure_loaded()
+        model = model or self.active
+        return ModelFeatures('full', model.predictor.extract_features_batch([image_array])[0].clone(), model)
+    
+    def history_record(self, features):
+        """
+        (embedding, health probabilities, condition probabilities) of the
+        general heads for one embedding, as NumPy arrays, or None without a model
+        """
+        if features is None:
+            return None
+        predictor = features.model.fast_predictor if features.stage == 'fast' else features.model.predictor
+        health_probs, condition_probs = predictor.probabilities_from_features(features.features)
+        return features.features.cpu().numpy(), health_probs[0], condition_probs[0]
+    
+    @staticmethod
+    def _mock_results():
+        return {
+            'health_status': 'healthy',
+            'confidence': 0.8,
+            'conditions_detected': [],
+        }
+
+
+if __name__ == "__main__":
+    # Convert pretrained/pet_health_model.pth into the self-contained bundle:
+    #   python -m app.models.model_loader
+    print(f"Model bundle written to {PetHealthModelLoader().export_bundle()}")
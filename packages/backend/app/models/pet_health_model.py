@@ -1,24 +1,88 @@
+import os
+import threading
 import torch
 import torch.nn as nn
 import torchvision.models as models
-import torchvision.transforms as transforms
 from PIL import Image
 import numpy as np
 from pathlib import Path
+from app.models.backends import EagerBackend, build_backend
+from app.models.labels import ANALYSIS_REGIONS, CONDITIONS, HEALTH_STATUSES
+from app.utils.image_processing import MODEL_INPUT_SIZE, preprocess_image
+from app.utils.metrics import BATCH_SIZE, stage_timer
+
+# Marks a self-contained model file: config, version and weights together
+BUNDLE_FORMAT = 'pet-health-model/1'
+
+# Backbones PetHealthModel can be built on; the small one serves as the
+# first stage of the cascade (see PetHealthModelLoader)
+BACKBONES = {
+    'efficientnet_b0': models.efficientnet_b0,
+    'mobilenet_v3_small': models.mobilenet_v3_small,
+}
+
+def load_weights(path, map_location='cpu'):
+    """
+    Load a state dict or model bundle from disk.
+    
+    Weights are memory-mapped where torch supports it (2.1+), so pages are
+    read lazily and shared through the page cache instead of copied.
+    """
+    try:
+        return torch.load(path, map_location=map_location, mmap=True, weights_only=True)
+    except TypeError:
+        print(f"Warning: torch {torch.__version__} can't memory-map weights (needs 2.1+), "
+              f"this process holds a private copy of {path}")
+        return torch.load(path, map_location=map_location)
+
+def save_model_bundle(model, path, version=None):
+    """
+    Save a model as a single self-contained file for offline startup.
+    
+    The file is written beside path and renamed over it, so a server that
+    memory-mapped the previous weights keeps reading them until it reloads.
+    """
+    path = Path(path)
+    # Unique per process, as several workers may export to one directory at once
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    torch.save({
+        'format': BUNDLE_FORMAT,
+        'version': version,
+        'config': {
+            'num_health_classes': model.num_health_classes,
+            'num_conditions': model.num_conditions,
+            'architecture': model.architecture,
+        },
+        'state_dict': model.state_dict(),
+    }, tmp_path)
+    os.replace(tmp_path, path)
+
+def is_model_bundle(state):
+    return isinstance(state, dict) and state.get('format') == BUNDLE_FORMAT
 
 class PetHealthModel(nn.Module):
-    def __init__(self, num_health_classes=5, num_conditions=10):
+    def __init__(self, num_health_classes=5, num_conditions=10, pretrained_backbone=False,
+                 architecture='efficientnet_b0'):
         super(PetHealthModel, self).__init__()
+        if architecture not in BACKBONES:
+            raise ValueError(f"Unknown backbone architecture: {architecture}")
+        self.num_health_classes = num_health_classes
+        self.num_conditions = num_conditions
+        self.architecture = architecture
         
-        # Load pre-trained EfficientNet model
-        self.backbone = models.efficientnet_b0(pretrained=True)
+        # EfficientNet (or MobileNetV3) backbone; ImageNet weights are only
+        # downloaded when asked for, since trained checkpoints overwrite them anyway
+        weights = 'IMAGENET1K_V1' if pretrained_backbone else None
+        self.backbone = BACKBONES[architecture](weights=weights)
         
         # Freeze backbone layers
         for param in self.backbone.features.parameters():
             param.requires_grad = False
             
         # Modify classifier for our specific tasks
-        num_features = self.backbone.classifier[1].in_features
+        num_features = next(
+            m for m in self.backbone.classifier.modules() if isinstance(m, nn.Linear)
+        ).in_features
         
         # Multi-head classifiers
         self.health_classifier = nn.Sequential(
@@ -31,8 +95,24 @@ class PetHealthModel(nn.Module):
             nn.Linear(num_features, num_conditions)
         )
         
+        # Per-region heads sharing the same pooled backbone features
+        self.region_heads = nn.ModuleDict({
+            region: nn.ModuleDict({
+                'health_classifier': nn.Sequential(
+                    nn.Dropout(p=0.2),
+                    nn.Linear(num_features, num_health_classes)
+                ),
+                'condition_classifier': nn.Sequential(
+                    nn.Dropout(p=0.2),
+                    nn.Linear(num_features, num_conditions)
+                )
+            })
+            for region in ANALYSIS_REGIONS
+        })
+        
         # Initialize weights
         self._initialize_weights()
+        self.reset_region_heads()
         
     def _initialize_weights(self):
         for m in self.modules():
@@ -40,99 +120,238 @@ class PetHealthModel(nn.Module):
                 nn.init.kaiming_normal_(m.weight)
                 nn.init.constant_(m.bias, 0)
     
-    def forward(self, x):
-        # Extract features
+    def reset_region_heads(self):
+        """Start every region head from the general heads, e.g. for checkpoints without them"""
+        for heads in self.region_heads.values():
+            heads['health_classifier'].load_state_dict(self.health_classifier.state_dict())
+            heads['condition_classifier'].load_state_dict(self.condition_classifier.state_dict())
+    
+    def extract_features(self, x):
+        """Pooled backbone embeddings, shape (N, num_features)"""
         features = self.backbone.features(x)
         features = self.backbone.avgpool(features)
-        features = torch.flatten(features, 1)
-        
-        # Multi-task predictions
-        health_output = self.health_classifier(features)
-        condition_output = self.condition_classifier(features)
+        return torch.flatten(features, 1)
+    
+    def classify(self, features, analysis_type='general'):
+        """Run the heads for one analysis type on pooled features"""
+        if analysis_type == 'general':
+            health_classifier = self.health_classifier
+            condition_classifier = self.condition_classifier
+        else:
+            heads = self.region_heads[analysis_type]
+            health_classifier = heads['health_classifier']
+            condition_classifier = heads['condition_classifier']
         
         return {
-            'health_status': health_output,
-            'conditions': condition_output
+            'health_status': health_classifier(features),
+            'conditions': condition_classifier(features)
         }
+    
+    def forward(self, x):
+        # Extract features, then multi-task predictions
+        return self.classify(self.extract_features(x))
 
 class PetHealthPredictor:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, pretrained_backbone=False, architecture='efficientnet_b0'):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = PetHealthModel().to(self.device)
+        self.version = None
         
+        state = None
         if model_path and Path(model_path).exists():
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+            state = load_weights(model_path, map_location=self.device)
+        
+        if is_model_bundle(state):
+            self.version = state.get('version')
+            self.model = self._model_from_bundle(state)
+        else:
+            self.model = PetHealthModel(
+                pretrained_backbone=pretrained_backbone, architecture=architecture
+            ).to(self.device)
+            if state is not None:
+                self._load_weights(state)
         
         self.model.eval()
+        self.backend = EagerBackend(self.model)
         
-        # Define image transformations
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                              std=[0.229, 0.224, 0.225])
-        ])
+        # ImageNet normalization folded into a single scale and shift
+        # applied to uint8 pixels: (x / 255 - mean) / std
+        self.input_size = MODEL_INPUT_SIZE
+        mean = torch.tensor([0.485, 0.456, 0.406])
+        std = torch.tensor([0.229, 0.224, 0.225])
+        self.input_scale = (1.0 / (255.0 * std)).view(1, 3, 1, 1)
+        self.input_shift = (-mean / std).view(1, 3, 1, 1)
+        # Model input reused by every batch (see extract_features_batch)
+        self._input_buffer = None
+        self._input_lock = threading.Lock()
         
         # Define class mappings
-        self.health_status_map = {
-            0: 'healthy',
-            1: 'minor_issues',
-            2: 'attention_needed',
-            3: 'requires_vet',
-            4: 'emergency'
-        }
-        
-        self.condition_map = {
-            0: 'skin_infection',
-            1: 'eye_problem',
-            2: 'ear_infection',
-            3: 'dental_issue',
-            4: 'weight_concern',
-            5: 'mobility_issue',
-            6: 'respiratory_problem',
-            7: 'digestive_issue',
-            8: 'behavioral_concern',
-            9: 'other'
-        }
+        self.health_status_map = dict(enumerate(HEALTH_STATUSES))
+        self.condition_map = dict(enumerate(CONDITIONS))
+        self.condition_threshold = 0.5
+    
+    def set_backend(self, name, calibration_images=None, channels_last=True):
+        """
+        Switch how the backbone runs: 'eager', 'torchscript' or 'int8'
+        (see app.models.backends). The heads always run in eager fp32.
+        """
+        if name == 'int8' and self.device.type != 'cpu':
+            raise ValueError("int8 inference is only supported on CPU")
+        self.backend = build_backend(
+            name,
+            self.model,
+            preprocess_batch=self.preprocess_batch,
+            calibration_images=calibration_images,
+            channels_last=channels_last,
+            input_size=self.input_size,
+        )
+    
+    def _model_from_bundle(self, bundle):
+        """Build the model straight from bundle weights without initializing it first"""
+        config = bundle.get('config', {})
+        try:
+            # Parameters start on the meta device (no allocation or random
+            # init) and are then replaced by the loaded, possibly mmap'd, tensors
+            with torch.device('meta'):
+                model = PetHealthModel(**config)
+            model.load_state_dict(bundle['state_dict'], assign=True)
+        except (AttributeError, TypeError):
+            # torch < 2.1: no meta device context or assign
+            print(f"Warning: torch {torch.__version__} can't load weights in place (needs 2.1+), "
+                  "this process copies them into a freshly initialized model")
+            model = PetHealthModel(**config)
+            model.load_state_dict(bundle['state_dict'])
+        return model.to(self.device)
+    
+    def _load_weights(self, state_dict):
+        missing, unexpected = self.model.load_state_dict(state_dict, strict=False)
+        if unexpected or any(not key.startswith('region_heads.') for key in missing):
+            raise RuntimeError(
+                f"Incompatible weights - missing: {missing}, unexpected: {unexpected}"
+            )
+        if missing:
+            # Checkpoints from before the region heads existed
+            self.model.reset_region_heads()
     
     def preprocess_image(self, image):
         """Preprocess image for model input"""
-        if isinstance(image, np.ndarray):
-            image = Image.fromarray(image)
-        return self.transform(image).unsqueeze(0)
+        return self.preprocess_batch([image])
     
-    @torch.no_grad()
-    def predict(self, image):
-        """Run prediction on an image"""
-        # Preprocess image
-        x = self.preprocess_image(image).to(self.device)
+    def preprocess_batch(self, images, out=None):
+        """
+        Build a normalized NCHW float batch from PIL images or HxWx3 uint8 arrays.
         
-        # Get model predictions
-        outputs = self.model(x)
+        Arrays already at the model input size (see
+        app.utils.image_processing.preprocess_image) are used as is; anything
+        else is resized once. Pixels go straight from uint8 into the float
+        batch and are normalized in place, with no intermediate copies. The
+        batch is built in out, an (N, H, W, 3) float tensor, when given.
+        """
+        width, height = self.input_size
+        if out is None:
+            out = torch.empty((len(images), height, width, 3))
+        pixels = out.numpy()
         
-        # Process health status
-        health_probs = torch.softmax(outputs['health_status'], dim=1)
-        health_idx = torch.argmax(health_probs, dim=1).item()
-        health_confidence = health_probs[0][health_idx].item()
+        for i, image in enumerate(images):
+            if isinstance(image, np.ndarray):
+                if image.shape != (height, width, 3) or image.dtype != np.uint8:
+                    image = preprocess_image(Image.fromarray(image), self.input_size)
+            else:
+                image = preprocess_image(image, self.input_size)
+            # Converts to float while copying
+            pixels[i] = image
         
-        # Process conditions
+        # NHWC -> NCHW view (channels_last strides), normalized in place
+        x = out.permute(0, 3, 1, 2)
+        return x.mul_(self.input_scale).add_(self.input_shift)
+    
+    @torch.no_grad()
+    def predict(self, image, analysis_type='general'):
+        """Run prediction on an image"""
+        return self.predict_batch([image], analysis_type)[0]
+    
+    @torch.no_grad()
+    def predict_batch(self, images, analysis_type='general'):
+        """Run prediction on a list of images in a single forward pass"""
+        if not images:
+            return []
+        return self.predict_from_features(self.extract_features_batch(images), analysis_type)
+    
+    @torch.no_grad()
+    def extract_features_batch(self, images):
+        """Pooled backbone embeddings for a list of images, shape (N, num_features)"""
+        BATCH_SIZE.observe(len(images))
+        # Batches run one at a time on the inference thread, so the lock is
+        # uncontended while serving; it guards the shared input buffer
+        with self._input_lock:
+            # Preprocess images into one batch, in a buffer kept across batches
+            with stage_timer("tensor"):
+                x = self.preprocess_batch(images, self._batch_input(len(images))).to(self.device)
+            with stage_timer("forward"):
+                return self.backend(x)
+    
+    def _batch_input(self, batch_size):
+        """The first batch_size rows of the input buffer, growing it for a larger batch"""
+        if self._input_buffer is None or len(self._input_buffer) < batch_size:
+            width, height = self.input_size
+            self._input_buffer = torch.empty((batch_size, height, width, 3))
+        return self._input_buffer[:batch_size]
+    
+    @torch.no_grad()
+    def predict_from_features(self, features, analysis_type='general', top_k=None):
+        """Run only the heads for analysis_type on precomputed embeddings"""
+        if features.dim() == 1:
+            features = features.unsqueeze(0)
+        with stage_timer("classify"):
+            outputs = self.model.classify(features.to(self.device), analysis_type)
+        with stage_timer("postprocess"):
+            return self.postprocess(outputs, top_k)
+    
+    @torch.no_grad()
+    def probabilities_from_features(self, features, analysis_type='general'):
+        """Health status (softmax) and condition (sigmoid) probabilities as NumPy arrays, (N, classes)"""
+        if features.dim() == 1:
+            features = features.unsqueeze(0)
+        outputs = self.model.classify(features.to(self.device), analysis_type)
+        return (
+            torch.softmax(outputs['health_status'], dim=1).cpu().numpy(),
+            torch.sigmoid(outputs['conditions']).cpu().numpy(),
+        )
+    
+    def postprocess(self, outputs, top_k=None):
+        """
+        Turn raw head outputs for N images into labelled results.
+        
+        Softmax, argmax, thresholding and top-k run as whole-batch tensor ops
+        and everything is copied to Python in one transfer. Each result is
+        {'health_status', 'confidence', 'conditions_detected'}, with detected
+        conditions sorted by confidence and limited to top_k when given.
+        """
+        health_confidence, health_idx = torch.softmax(outputs['health_status'], dim=1).max(dim=1)
         condition_probs = torch.sigmoid(outputs['conditions'])
-        condition_threshold = 0.5
-        detected_conditions = []
         
-        for idx, prob in enumerate(condition_probs[0]):
-            if prob.item() > condition_threshold:
-                detected_conditions.append({
-                    'condition': self.condition_map[idx],
-                    'confidence': prob.item()
-                })
+        k = condition_probs.shape[1] if top_k is None else min(top_k, condition_probs.shape[1])
+        condition_conf, condition_idx = condition_probs.topk(k, dim=1)
+        detected = condition_conf > self.condition_threshold
         
-        return {
-            'health_status': self.health_status_map[health_idx],
-            'confidence': health_confidence,
-            'conditions_detected': detected_conditions,
-        }
+        health_idx, health_confidence, condition_idx, condition_conf, detected = (
+            t.cpu().tolist() for t in
+            (health_idx, health_confidence, condition_idx, condition_conf, detected)
+        )
+        
+        return [
+            {
+                'health_status': HEALTH_STATUSES[health_idx[i]],
+                'confidence': health_confidence[i],
+                'conditions_detected': [
+                    {'condition': CONDITIONS[idx], 'confidence': conf}
+                    for idx, conf, hit in zip(condition_idx[i], condition_conf[i], detected[i])
+                    if hit
+                ],
+            }
+            for i in range(len(health_idx))
+        ]
 
 # Usage example:
 # predictor = PetHealthPredictor('path/to/model.pth')
 # result = predictor.predict(image)
+# results = predictor.predict_batch([image1, image2])
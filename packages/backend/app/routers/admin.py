@@ -0,0 +1,122 @@
+from fastapi import APIRouter, HTTPException, Header, Query
+from typing import Optional
+import asyncio
+import hmac
+from app import config
+from app.models.model_loader import ReloadInProgress
+from app.routers.health_analysis import feature_cache, model_loader
+from app.schemas.health import ModelStatus
+from app.utils.logging import get_logger
+
+router = APIRouter()
+logger = get_logger("admin")
+_watcher: Optional[asyncio.Task] = None
+
+def _require_admin(token: Optional[str]):
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are not enabled")
+    if not hmac.compare_digest((token or "").encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _model_status():
+    return {
+        "model_version": model_loader.model_version,
+        "reloading": model_loader.reloading,
+        "candidate": model_loader.shadow_report(),
+    }
+
+async def reload_model(shadow: bool = False) -> str:
+    """Load and warm up the weights on disk off the event loop, then swap them in or shadow them"""
+    previous = model_loader.model_version
+    version = await asyncio.get_running_loop().run_in_executor(
+        None, model_loader.reload, config.MODEL_WARMUP_BATCHES, config.MODEL_WARMUP_BATCH_SIZE, shadow
+    )
+    if model_loader.model_version != previous:
+        # Cached embeddings belong to the old model and would keep it in memory
+        feature_cache.clear()
+        logger.info(f"Model {previous} replaced by {model_loader.model_version}")
+    elif shadow and version != previous:
+        logger.info(f"Shadowing model {version} against {previous}")
+    return version
+
+async def _watch_weights():
+    while True:
+        await asyncio.sleep(config.MODEL_RELOAD_POLL_SECONDS)
+        if not model_loader.ready or not model_loader.weights_changed():
+            continue
+        try:
+            await reload_model(shadow=config.MODEL_RELOAD_SHADOW)
+        except ReloadInProgress:
+            pass
+        except Exception as e:
+            logger.error(f"Model reload failed: {str(e)}")
+
+def start_weights_watcher():
+    """Reload whenever new weights appear in the model directory, if polling is enabled"""
+    global _watcher
+    if config.MODEL_RELOAD_POLL_SECONDS > 0:
+        _watcher = asyncio.ensure_future(_watch_weights())
+
+async def stop_weights_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        await asyncio.gather(_watcher, return_exceptions=True)
+        _watcher = None
+
+@router.get("/model", response_model=ModelStatus)
+async def get_model_status(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Active model version and, in shadow mode, how the candidate compares to it
+    """
+    _require_admin(x_admin_token)
+    return _model_status()
+
+@router.post("/model/reload", response_model=ModelStatus)
+async def reload_model_weights(
+    shadow: bool = Query(default=False),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Load the weights currently in the model directory without a restart
+
+    Requests keep being served by the active model while the new weights
+    load and warm up; the swap happens between batches.
+
+    Parameters:
+    - shadow: Keep the new weights as a candidate that runs on a sample of
+      batches alongside the active model, until promoted or discarded
+    """
+    _require_admin(x_admin_token)
+    try:
+        await reload_model(shadow)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Model reload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return _model_status()
+
+@router.post("/model/promote", response_model=ModelStatus)
+async def promote_candidate(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Make the shadowed candidate the active model
+    """
+    _require_admin(x_admin_token)
+    previous = model_loader.model_version
+    try:
+        version = model_loader.promote()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    feature_cache.clear()
+    logger.info(f"Model {previous} replaced by shadowed candidate {version}")
+    return _model_status()
+
+@router.delete("/model/candidate", response_model=ModelStatus)
+async def discard_candidate(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Stop shadowing and drop the candidate model
+    """
+    _require_admin(x_admin_token)
+    model_loader.discard_candidate()
+    return _model_status()
@@ -1,26 +1,390 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query
-from PIL import Image
-import io
-from typing import Optional
-from app.models.model_loader import PetHealthModelLoader
-from app.utils.image_processing import preprocess_image, detect_image_issues, format_results
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import asyncio
+import json
+import time
+import uuid
+from app import config
+from app.models.batching import PRIORITIES, PRIORITY_NAMES, SHED_REQUESTS, DeadlineExceeded, InferenceBatcher
+from app.models.frameworks import create_model_loader
+from app.models.labels import CONDITIONS, HEALTH_STATUSES
+from app.utils.image_processing import (
+    MODEL_INPUT_SIZE, prepare_image, format_results, is_zip_archive, extract_zip_images
+)
+from app.utils.buffer_pool import BufferPool
+from app.utils.workers import WorkerPool, ServerBusy
+from app.utils.cache import AnalysisCache
+from app.utils.near_duplicates import NearDuplicateIndex
+from app.utils.embedding_store import EmbeddingStore, compare_history
+from app.utils.similar_cases import SimilarCases
+from app.utils.uploads import UploadRejected, read_upload, check_image_header
 from app.schemas.health import (
     AnalysisType,
     AnalysisResponse,
     AnalysisTypesResponse,
-    AnalysisTypeInfo
+    AnalysisTypeInfo,
+    HistoryResponse,
+    SimilarCasesResponse
 )
-from app.utils.logging import get_logger
+from app.utils.logging import get_logger, set_request_context
+from app.utils.metrics import REGISTRY, STAGE_SECONDS
 
 router = APIRouter()
-model_loader = PetHealthModelLoader()
+# Loaded by the startup hook in main.py, or on first use; the framework is imported then too
+model_loader = create_model_loader(
+    config.MODEL_FRAMEWORK,
+    model_dir=config.MODEL_DIR,
+    source_dir=config.MODEL_SOURCE_DIR,
+    lazy=True,
+    allow_download=config.MODEL_ALLOW_DOWNLOAD,
+    backend=config.INFERENCE_BACKEND,
+    num_threads=config.INFERENCE_THREADS,
+    interop_threads=config.INFERENCE_INTEROP_THREADS,
+    cascade=config.CASCADE_ENABLED,
+    cascade_threshold=config.CASCADE_THRESHOLD,
+    cascade_escalate_on_conditions=config.CASCADE_ESCALATE_ON_CONDITIONS,
+    shadow_sample_rate=config.MODEL_SHADOW_SAMPLE_RATE,
+)
+worker_pool = WorkerPool(
+    kind=config.WORKER_POOL_KIND,
+    max_workers=config.WORKER_POOL_SIZE,
+    max_pending=config.MAX_PENDING_REQUESTS,
+    retry_after=config.RETRY_AFTER_SECONDS,
+)
+# Decoded model inputs, from prepare_image until their batch has run
+input_buffers = BufferPool((MODEL_INPUT_SIZE[1], MODEL_INPUT_SIZE[0], 3), size=config.INPUT_BUFFERS)
+result_cache = AnalysisCache(
+    max_entries=config.CACHE_MAX_ENTRIES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+    disk_path=config.CACHE_DISK_PATH,
+    disk_flush_seconds=config.CACHE_DISK_FLUSH_SECONDS,
+)
+near_duplicates = NearDuplicateIndex(
+    max_distance=config.NEAR_DUPLICATE_MAX_DISTANCE,
+    ttl_seconds=config.NEAR_DUPLICATE_TTL_SECONDS,
+    max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+)
+feature_cache = AnalysisCache(
+    max_entries=config.FEATURE_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.CACHE_TTL_SECONDS,
+)
+history = EmbeddingStore(
+    config.HISTORY_PATH, num_health_classes=len(HEALTH_STATUSES), num_conditions=len(CONDITIONS)
+) if config.HISTORY_PATH else None
+similar_cases = SimilarCases(
+    history,
+    config.SIMILAR_CASES_PATH,
+    nlist=config.SIMILAR_CASES_NLIST,
+    m=config.SIMILAR_CASES_SUBVECTORS,
+    nprobe=config.SIMILAR_CASES_NPROBE,
+) if history is not None and config.SIMILAR_CASES_PATH else None
+# History appends and reads, index inserts and searches run one at a time, in
+# order and off the event loop, so a read sees every analysis recorded before it
+similar_cases_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similar-cases")
+# Batches only run the shared backbone; per-type heads run on the embeddings
+batcher = InferenceBatcher(
+    model_loader.extract_features_batch,
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    # Batches run one at a time; torch parallelises inside the forward pass
+    executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference"),
+    shed=config.LOAD_SHEDDING,
+)
 logger = get_logger("health_analysis")
 
+# Read from the components above whenever /metrics is scraped
+REGISTRY.callback(
+    "pet_health_queue_depth", "Requests admitted and images waiting for a batch",
+    lambda: {("admitted",): worker_pool.pending, ("batcher",): batcher.queue_depth}, ("queue",)
+)
+REGISTRY.callback(
+    "pet_health_cache_lookups_total", "Cache lookups by cache and outcome",
+    lambda: {
+        **{(name, outcome): cache.stats()[outcome]
+           for name, cache in (("result", result_cache), ("feature", feature_cache))
+           for outcome in ("hits", "disk_hits", "misses")},
+        ("near_duplicate", "hits"): near_duplicates.hits,
+        ("near_duplicate", "misses"): near_duplicates.misses,
+    },
+    ("cache", "outcome"), kind="counter"
+)
+REGISTRY.callback(
+    "pet_health_cache_hit_ratio", "Fraction of lookups answered by each cache",
+    lambda: {
+        ("result",): result_cache.stats()["hit_rate"],
+        ("feature",): feature_cache.stats()["hit_rate"],
+    },
+    ("cache",)
+)
+REGISTRY.callback(
+    "pet_health_input_buffers", "Pooled model input buffers by state",
+    lambda: {("in_use",): input_buffers.in_use, ("free",): input_buffers.size - input_buffers.in_use},
+    ("state",)
+)
+REGISTRY.callback(
+    "pet_health_input_buffer_misses_total", "Model inputs allocated because every pooled buffer was in use",
+    lambda: {(): input_buffers.misses}, kind="counter"
+)
+REGISTRY.callback(
+    "pet_health_model_load_seconds", "Time taken to load the model",
+    lambda: {(): model_loader.load_seconds}
+)
+REGISTRY.callback(
+    "pet_health_model_ready", "1 once the model is loaded and warmed up",
+    lambda: {(): int(model_loader.ready)}
+)
+REGISTRY.callback(
+    "pet_health_model_version", "Versions of the active model and of a shadowed candidate",
+    lambda: {
+        (role, model.version): 1
+        for role, model in (("active", model_loader.active), ("candidate", model_loader.candidate))
+        if model is not None and model.version is not None
+    },
+    ("role", "version")
+)
+
+def _success_response(pet_id, analysis_type, results, cached=False, model_version=None):
+    """Response body; for the "all" analysis type results maps each type to its results"""
+    body = {
+        "status": "success",
+        "pet_id": pet_id,
+        "analysis_type": analysis_type,
+        "results": results,
+        "cached": cached,
+        # Cached results are looked up under the active version
+        "model_version": model_version or model_loader.model_version
+    }
+    if analysis_type == AnalysisType.ALL:
+        body["results"] = results[AnalysisType.GENERAL.value]
+        body["results_by_type"] = results
+    return body
+
+async def _lookup_cache(contents: bytes, analysis_type: AnalysisType):
+    """Return (content_digest, cached_results); cached_results is None on a miss"""
+    digest = AnalysisCache.content_digest(contents)
+    if model_loader.model_version is None:
+        return digest, None
+    cache_key = AnalysisCache.make_key(contents, model_loader.model_version, analysis_type.value, digest)
+    return digest, await result_cache.get_async(cache_key)
+
+def _record_stage(stages: dict, stage: str, started: float):
+    """Add a stage's duration to the latency histogram and to the request's timings"""
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, stage)
+    stages[f"{stage}_ms"] = round(elapsed * 1000, 3)
+
+def _finish_timing(response: Response, stages: dict, request_started: float):
+    """Record the whole request and, if enabled, report every stage in a Server-Timing header"""
+    _record_stage(stages, "request", request_started)
+    if config.SERVER_TIMING:
+        response.headers["Server-Timing"] = ", ".join(
+            f"{name[:-len('_ms')]};dur={value}" for name, value in stages.items()
+        )
+
+def _issues_response(issues, quality=None):
+    logger.warning(f"Image quality issues detected: {issues}")
+    body = {
+        "status": "error",
+        "message": "Image quality issues detected",
+        "issues": issues
+    }
+    if quality is not None:
+        body["quality"] = quality
+    return body
+
+async def _read_image(upload: UploadFile, allow_archive=False):
+    """Read an upload in chunks, rejecting it from its header where possible; returns (contents, issues)"""
+    try:
+        return await read_upload(
+            upload,
+            max_bytes=config.MAX_UPLOAD_BYTES,
+            max_pixels=config.MAX_IMAGE_PIXELS,
+            allowed_formats=config.ALLOWED_IMAGE_FORMATS,
+            max_archive_bytes=config.MAX_ARCHIVE_BYTES if allow_archive else None,
+        )
+    except UploadRejected as e:
+        logger.warning(f"Rejected upload {upload.filename}: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def _scheduling(x_priority: Optional[str], x_deadline_ms: Optional[float]):
+    """(priority, deadline) of a request from its X-Priority and X-Deadline-Ms headers"""
+    priority = PRIORITIES.get((x_priority or "normal").lower())
+    if priority is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown priority {x_priority!r}, expected one of {', '.join(PRIORITIES)}"
+        )
+    budget_ms = config.REQUEST_DEADLINE_MS if x_deadline_ms is None else x_deadline_ms
+    deadline = asyncio.get_running_loop().time() + budget_ms / 1000 if budget_ms > 0 else None
+    return priority, deadline
+
+def _shed(e: DeadlineExceeded):
+    """503 for a request dropped because its deadline cannot be met"""
+    logger.warning(f"Shedding request, deadline cannot be met ({e.stage})")
+    return HTTPException(
+        status_code=503,
+        detail="Request deadline cannot be met, please retry later",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def _admit():
+    """Reserve an admission slot or reject the request with 503"""
+    try:
+        return worker_pool.admit()
+    except ServerBusy as e:
+        logger.warning(f"Rejecting analysis request, {worker_pool.pending} requests pending")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def _run_heads(features, analysis_type: AnalysisType):
+    """Formatted results from the heads alone, without touching the backbone"""
+    stage = model_loader.answered_by(features)
+    
+    def run(head_type):
+        results = format_results(model_loader.analyze_features(features, head_type.value))
+        results["stage"] = stage
+        return results
+    
+    if analysis_type == AnalysisType.ALL:
+        return {
+            head_type.value: run(head_type)
+            for head_type in AnalysisType
+            if head_type != AnalysisType.ALL
+        }
+    return run(analysis_type)
+
+def _record_history(pet_id, features):
+    """Append a fresh backbone run to the pet's history; reused embeddings were recorded already"""
+    record = model_loader.history_record(features)
+    if record is None:
+        return
+    stage = model_loader.answered_by(features)
+    space = f"{model_loader.version_of(features)}/{stage}"
+    # The append writes to disk, so it runs in the background like the index insert after it
+    asyncio.get_running_loop().run_in_executor(
+        similar_cases_executor, _record_case, pet_id, space, record, stage
+    )
+
+def _record_case(pet_id, space, record, stage):
+    try:
+        case_id = history.append(pet_id, space, *record)
+    except Exception as e:
+        # History is best effort; the analysis itself succeeded
+        logger.error(f"Failed to record history - Pet ID: {pet_id}: {str(e)}")
+        return
+    # Only full-model embeddings are comparable across every case
+    if similar_cases is not None and stage == "full":
+        try:
+            similar_cases.add(case_id, record[0], space)
+        except Exception as e:
+            logger.error(f"Failed to index case {case_id}: {str(e)}")
+
+async def _prepare(contents: bytes):
+    """
+    Run prepare_image on the worker pool, into a pooled buffer with thread
+    workers (process workers send back their own array). Returns (buffer,
+    prepare_image result); release the buffer once the model has read it.
+    """
+    buffer = input_buffers.acquire() if worker_pool.kind == "thread" else None
+    task = asyncio.ensure_future(worker_pool.run(prepare_image, contents, config.QUALITY_MIN_SHARPNESS, buffer))
+    try:
+        return buffer, await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # The worker may still be writing into the buffer; lend it out again once it's done
+        task.add_done_callback(lambda _: input_buffers.release(buffer))
+        raise
+    except Exception:
+        input_buffers.release(buffer)
+        raise
+
+async def _analyze_contents(contents: bytes, pet_id, analysis_type: AnalysisType, digest=None, stages=None,
+                            priority=PRIORITIES["normal"], deadline=None) -> dict:
+    """
+    Decode, validate and analyze one uploaded image, returning the response body.
+    
+    Stage durations in milliseconds are added to stages when given. Raises
+    DeadlineExceeded when deadline (loop time) passes before inference.
+    """
+    model_version = model_loader.model_version
+    digest = digest or AnalysisCache.content_digest(contents)
+    stages = {} if stages is None else stages
+    
+    # An image seen before only needs its heads run on the cached embedding
+    features = duplicate_key = phash = None
+    if model_version is not None:
+        features = feature_cache.get(f"{digest}:{model_version}")
+    
+    if features is None:
+        # Nothing left to save once the caller has given up
+        if config.LOAD_SHEDDING and deadline is not None and asyncio.get_running_loop().time() > deadline:
+            SHED_REQUESTS.inc("pipeline", PRIORITY_NAMES[priority])
+            raise DeadlineExceeded("pipeline")
+        
+        # Decode, validate and preprocess off the event loop
+        started = time.perf_counter()
+        pixels, (issues, processed_image, phash, quality) = await _prepare(contents)
+        _record_stage(stages, "prepare", started)
+        
+        try:
+            # Check for image issues
+            if issues:
+                return _issues_response(issues, quality)
+            
+            # Reuse a recent result for a near-identical photo of the same pet
+            if config.NEAR_DUPLICATE_ENABLED and pet_id and model_version is not None:
+                duplicate_key = (pet_id, analysis_type.value, model_version)
+                duplicate_results = near_duplicates.find(duplicate_key, phash)
+                if duplicate_results is not None:
+                    logger.info(f"Reusing analysis of a near-duplicate photo - Pet ID: {pet_id}")
+                    return _success_response(
+                        pet_id, analysis_type, duplicate_results, cached=True, model_version=model_version
+                    )
+            
+            # Run the backbone, batched with concurrent requests
+            started = time.perf_counter()
+            features = await batcher.submit(processed_image, priority, deadline)
+            _record_stage(stages, "inference", started)
+        finally:
+            input_buffers.release(pixels)
+        # A reload may have swapped the model while this image waited for its batch
+        model_version = model_loader.version_of(features) or model_version
+        if model_version is not None and features is not None:
+            feature_cache.set(f"{digest}:{model_version}", features)
+        if history is not None and pet_id and features is not None:
+            _record_history(pet_id, features)
+    
+    # Format results
+    started = time.perf_counter()
+    results = _run_heads(features, analysis_type)
+    _record_stage(stages, "results", started)
+    if model_version is not None and features is not None:
+        result_cache.set(AnalysisCache.make_key(contents, model_version, analysis_type.value, digest), results)
+    if duplicate_key is not None:
+        near_duplicates.add(duplicate_key, phash, results)
+    
+    body = _success_response(pet_id, analysis_type, results, model_version=model_version)
+    logger.info(
+        f"Analysis completed successfully - Health Status: {body['results']['health_status']}",
+        extra={"stages": stages}
+    )
+    
+    return body
+
 @router.post("/analyze", response_model=AnalysisResponse)
 async def analyze_pet_health(
+    response: Response,
     image: UploadFile = File(...),
     pet_id: Optional[str] = None,
-    analysis_type: AnalysisType = Query(default=AnalysisType.GENERAL)
+    analysis_type: AnalysisType = Query(default=AnalysisType.GENERAL),
+    x_request_id: Optional[str] = Header(default=None),
+    x_priority: Optional[str] = Header(default=None),
+    x_deadline_ms: Optional[float] = Header(default=None)
 ):
     """
     Analyze pet health from uploaded image
@@ -29,50 +393,275 @@ async def analyze_pet_health(
     - image: Pet photo to analyze
     - pet_id: Optional ID of the pet
     - analysis_type: Type of analysis to perform
+    - X-Priority header: high, normal (default) or low; higher classes are served first
+    - X-Deadline-Ms header: time budget for the request; work that cannot finish
+      within it is dropped with 503
     
     Returns:
     - Analysis results including health status, conditions, and recommendations
     """
-    try:
-        logger.info(f"Starting health analysis - Type: {analysis_type}, Pet ID: {pet_id}")
-        
-        # Read and validate image
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents))
-        
-        # Check for image issues
-        issues = detect_image_issues(img)
-        if issues:
-            logger.warning(f"Image quality issues detected: {issues}")
-            return {
-                "status": "error",
-                "message": "Image quality issues detected",
-                "issues": issues
-            }
-        
-        # Preprocess image
-        processed_image = preprocess_image(img)
-        
-        # Run analysis
-        raw_results = model_loader.analyze_health(processed_image)
-        
-        # Format results
-        results = format_results(raw_results)
-        
-        logger.info(f"Analysis completed successfully - Health Status: {results['health_status']}")
+    set_request_context(x_request_id or uuid.uuid4().hex, pet_id)
+    request_started = time.perf_counter()
+    priority, deadline = _scheduling(x_priority, x_deadline_ms)
+    stages = {}
+    
+    # Read in chunks; oversized, undecodable or unsuitable images stop at the header
+    contents, issues = await _read_image(image)
+    _record_stage(stages, "upload_read", request_started)
+    if issues:
+        raise HTTPException(status_code=422, detail=_issues_response(issues))
+    
+    # Identical uploads are answered from the cache without decoding or inference
+    digest, cached_results = await _lookup_cache(contents, analysis_type)
+    if cached_results is not None:
+        logger.info(f"Serving cached analysis - Type: {analysis_type}, Pet ID: {pet_id}")
+        _finish_timing(response, stages, request_started)
+        return _success_response(pet_id, analysis_type, cached_results, cached=True)
+    
+    with _admit():
+        try:
+            logger.info(f"Starting health analysis - Type: {analysis_type}, Pet ID: {pet_id}")
+            body = await _analyze_contents(contents, pet_id, analysis_type, digest, stages, priority, deadline)
         
-        return {
-            "status": "success",
-            "pet_id": pet_id,
-            "analysis_type": analysis_type,
-            "results": results
-        }
+        except DeadlineExceeded as e:
+            raise _shed(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error processing image: {str(e)}"
+            )
+    
+    # Quality issues found after decoding are reported like header issues
+    if body["status"] == "error":
+        raise HTTPException(status_code=422, detail=body)
+    _finish_timing(response, stages, request_started)
+    return body
+
+def _check_member(filename, contents, error):
+    """Apply the upload header checks to an image extracted from a zip archive"""
+    if contents is None:
+        return filename, None, error
+    try:
+        issues = check_image_header(contents, config.MAX_IMAGE_PIXELS, config.ALLOWED_IMAGE_FORMATS)
+    except UploadRejected as e:
+        return filename, None, e.detail
+    if issues:
+        return filename, None, _issues_response(issues)
+    return filename, contents, None
+
+async def _stream_batch(uploads, pet_id, analysis_type: AnalysisType, admission,
+                        priority=PRIORITIES["normal"], deadline=None):
+    """Analyze uploads concurrently and yield one NDJSON line per image as it finishes"""
+    semaphore = asyncio.Semaphore(config.BATCH_ENDPOINT_CONCURRENCY)
     
+    async def analyze_item(index, filename, contents, error):
+        item = {"index": index, "filename": filename}
+        if error is not None:
+            # Either a message or an issues response found before analysis
+            item.update(error if isinstance(error, dict) else {"status": "error", "message": error})
+            return item
+        async with semaphore:
+            try:
+                digest, cached_results = await _lookup_cache(contents, analysis_type)
+                if cached_results is not None:
+                    item.update(_success_response(pet_id, analysis_type, cached_results, cached=True))
+                else:
+                    item.update(await _analyze_contents(
+                        contents, pet_id, analysis_type, digest, priority=priority, deadline=deadline
+                    ))
+            except DeadlineExceeded:
+                item.update({"status": "error", "message": "Deadline cannot be met"})
+            except Exception as e:
+                item.update({"status": "error", "message": f"Error processing image: {str(e)}"})
+        return item
+    
+    tasks = [
+        asyncio.ensure_future(analyze_item(index, *upload))
+        for index, upload in enumerate(uploads)
+    ]
+    try:
+        for next_item in asyncio.as_completed(tasks):
+            item = await next_item
+            yield json.dumps(item, default=str) + "\n"
+    finally:
+        # Client went away: stop work that has not started yet
+        for task in tasks:
+            task.cancel()
+        admission.release()
+
+@router.post("/analyze/batch")
+async def analyze_pet_health_batch(
+    images: List[UploadFile] = File(...),
+    pet_id: Optional[str] = None,
+    analysis_type: AnalysisType = Query(default=AnalysisType.GENERAL),
+    x_request_id: Optional[str] = Header(default=None),
+    x_priority: Optional[str] = Header(default=None),
+    x_deadline_ms: Optional[float] = Header(default=None)
+):
+    """
+    Analyze many pet photos in one request
+    
+    Parameters:
+    - images: Pet photos to analyze; zip archives of photos are expanded
+    - pet_id: Optional ID of the pet
+    - analysis_type: Type of analysis to perform
+    - X-Priority header: high, normal (default) or low
+    - X-Deadline-Ms header: optional time budget for the whole batch; images
+      that cannot be analyzed within it are reported as errors
+    
+    Returns:
+    - NDJSON stream with one line per image, in completion order. Each line
+      carries the image index and filename plus either the analysis results
+      or an error, so one bad image does not fail the rest.
+    """
+    set_request_context(x_request_id or uuid.uuid4().hex, pet_id)
+    # The default per-request deadline is meant for single images, not whole batches
+    priority, deadline = _scheduling(x_priority, x_deadline_ms if x_deadline_ms is not None else 0)
+    admission = _admit()
+    try:
+        uploads = []
+        for upload in images:
+            try:
+                contents, issues = await _read_image(upload, allow_archive=True)
+            except HTTPException as e:
+                # One bad upload does not fail the rest
+                uploads.append((upload.filename, None, e.detail))
+                continue
+            if issues:
+                uploads.append((upload.filename, None, _issues_response(issues)))
+            elif is_zip_archive(contents):
+                members = await worker_pool.run(
+                    extract_zip_images, contents,
+                    config.BATCH_ENDPOINT_MAX_IMAGES - len(uploads) + 1,
+                    config.MAX_UPLOAD_BYTES
+                )
+                del contents
+                uploads.extend(_check_member(*member) for member in members)
+            else:
+                uploads.append((upload.filename, contents, None))
+            if len(uploads) > config.BATCH_ENDPOINT_MAX_IMAGES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Too many images, at most {config.BATCH_ENDPOINT_MAX_IMAGES} per request"
+                )
+    except HTTPException:
+        admission.release()
+        raise
     except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error processing image: {str(e)}"
+        admission.release()
+        raise HTTPException(status_code=400, detail=f"Error reading uploads: {str(e)}")
+    
+    logger.info(f"Starting batch health analysis - {len(uploads)} images, Type: {analysis_type}, Pet ID: {pet_id}")
+    return StreamingResponse(
+        _stream_batch(uploads, pet_id, analysis_type, admission, priority, deadline),
+        media_type="application/x-ndjson",
+        # Also frees the slot if the stream never started
+        background=BackgroundTask(admission.release)
+    )
+
+@router.get("/history/{pet_id}", response_model=HistoryResponse)
+async def get_pet_history(pet_id: str, limit: int = Query(default=50, ge=1, le=1000)):
+    """
+    Health trend of a pet and its change since earlier analyses
+    
+    Computed from the stored embeddings and head outputs of past analyses,
+    without decoding or re-running the model on old photos.
+    
+    Parameters:
+    - pet_id: ID the analyses were submitted with
+    - limit: Number of most recent analyses in the trend
+    
+    Returns:
+    - Latest analysis, change from the previous and first ones, and the trend
+    """
+    if history is None:
+        raise HTTPException(status_code=404, detail="Analysis history is not enabled")
+    
+    records = await asyncio.get_running_loop().run_in_executor(similar_cases_executor, history.history, pet_id)
+    comparison = compare_history(
+        records, HEALTH_STATUSES, CONDITIONS,
+        condition_threshold=config.HISTORY_CONDITION_THRESHOLD, limit=limit
+    )
+    if comparison is None:
+        raise HTTPException(status_code=404, detail=f"No analyses recorded for pet {pet_id}")
+    return {"status": "success", "pet_id": pet_id, **comparison}
+
+async def _full_embedding(contents: bytes):
+    """(full-model embedding, model version) of an upload, from the feature cache when possible"""
+    model_version = model_loader.model_version
+    digest = AnalysisCache.content_digest(contents)
+    features = feature_cache.get(f"{digest}:{model_version}") if model_version is not None else None
+    if model_loader.answered_by(features) == "full":
+        return model_loader.embedding(features), model_version
+    
+    pixels, (issues, processed_image, _, quality) = await _prepare(contents)
+    try:
+        if issues:
+            raise HTTPException(status_code=422, detail=_issues_response(issues, quality))
+        features = await batcher.submit(processed_image)
+        if features is None:
+            raise HTTPException(status_code=503, detail="Model is not available")
+        if model_loader.answered_by(features) == "fast":
+            # The index holds full-model embeddings; run the full backbone on the inference thread
+            features = await asyncio.get_running_loop().run_in_executor(
+                batcher.executor, model_loader.full_features, processed_image, features.model
+            )
+    finally:
+        input_buffers.release(pixels)
+    return model_loader.embedding(features), model_loader.version_of(features)
+
+@router.post("/similar", response_model=SimilarCasesResponse)
+async def find_similar_cases(
+    image: UploadFile = File(...),
+    pet_id: Optional[str] = None,
+    k: int = Query(default=10, ge=1, le=100),
+    nprobe: Optional[int] = Query(default=None, ge=1),
+    x_request_id: Optional[str] = Header(default=None)
+):
+    """
+    Find the previously analyzed cases most similar to a photo
+    
+    Parameters:
+    - image: Pet photo to compare
+    - pet_id: Optional ID of the pet, to flag its own earlier analyses
+    - k: Number of cases to return
+    - nprobe: Index cells to search; more is slower and more accurate
+    
+    Returns:
+    - Nearest cases by embedding distance, with their recorded outcome
+    """
+    set_request_context(x_request_id or uuid.uuid4().hex, pet_id)
+    if similar_cases is None:
+        raise HTTPException(status_code=404, detail="Similar-case retrieval is not enabled")
+    
+    contents, issues = await _read_image(image)
+    if issues:
+        raise HTTPException(status_code=422, detail=_issues_response(issues))
+    
+    with _admit():
+        embedding, model_version = await _full_embedding(contents)
+        space = f"{model_version}/full"
+        started = time.perf_counter()
+        ids, distances, records = await asyncio.get_running_loop().run_in_executor(
+            similar_cases_executor, similar_cases.search, embedding, space, k, nprobe
         )
+        STAGE_SECONDS.observe(time.perf_counter() - started, "similar_search")
+    
+    pet_key = history.pet_key(pet_id) if pet_id else None
+    threshold = config.HISTORY_CONDITION_THRESHOLD
+    cases = []
+    for case_id, distance, record in zip(ids.tolist(), distances.tolist(), records):
+        status_idx = int(record["health"].argmax())
+        cases.append({
+            "case_id": case_id,
+            "timestamp": float(record["timestamp"]),
+            "distance": distance,
+            "health_status": HEALTH_STATUSES[status_idx],
+            "confidence": float(record["health"][status_idx]),
+            "conditions": [CONDITIONS[j] for j in (record["conditions"] > threshold).nonzero()[0]],
+            "same_pet": None if pet_key is None else bool(record["pet"] == pet_key),
+        })
+    return {"status": "success", "pet_id": pet_id, "cases": cases}
 
 @router.get("/analysis-types", response_model=AnalysisTypesResponse)
 async def get_analysis_types():
@@ -108,6 +697,11 @@ async def get_analysis_types():
                 id=AnalysisType.MOUTH,
                 name="Oral Health",
                 description="Teeth, gums, oral hygiene"
+            ),
+            AnalysisTypeInfo(
+                id=AnalysisType.ALL,
+                name="Full Check",
+                description="Every analysis above from a single pass"
             )
         ]
     }
@@ -0,0 +1,161 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Header, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+import asyncio
+import json
+import time
+import uuid
+from app import config
+from app.models.batching import PRIORITIES
+from app.routers.health_analysis import _analyze_contents, _issues_response, _lookup_cache, _read_image, _success_response
+from app.schemas.health import AnalysisType, JobStatus, JobSubmitted
+from app.utils.job_queue import FINISHED, QUEUED, JobQueue, JobRunner
+from app.utils.logging import get_logger, set_request_context
+from app.utils.metrics import REGISTRY
+
+router = APIRouter()
+job_queue = JobQueue(
+    config.JOBS_DB_PATH,
+    lease_seconds=config.JOBS_LEASE_SECONDS,
+    max_attempts=config.JOBS_MAX_ATTEMPTS,
+    result_ttl_seconds=config.JOBS_RESULT_TTL_SECONDS,
+) if config.JOBS_DB_PATH else None
+logger = get_logger("jobs")
+
+# Seconds between SSE keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = 15
+
+async def _run_job(job):
+    """Analyze a claimed job like a synchronous /analyze request; returns (body, failed)"""
+    set_request_context(job["id"], job["pet_id"])
+    analysis_type = AnalysisType(job["analysis_type"])
+    digest, cached_results = await _lookup_cache(job["payload"], analysis_type)
+    if cached_results is not None:
+        return _success_response(job["pet_id"], analysis_type, cached_results, cached=True), False
+
+    logger.info(f"Starting job {job['id']} (attempt {job['attempts']}) - Type: {analysis_type}")
+    # Queued jobs already waited; they yield the model to interactive requests but never expire
+    body = await _analyze_contents(
+        job["payload"], job["pet_id"], analysis_type, digest, priority=PRIORITIES["low"]
+    )
+    return body, body["status"] == "error"
+
+job_runner = JobRunner(
+    job_queue, _run_job, workers=config.JOBS_WORKERS, poll_seconds=config.JOBS_POLL_SECONDS
+) if job_queue is not None else None
+
+# Scrapes run on the event loop, so they read the counts the job runner keeps fresh
+REGISTRY.callback(
+    "pet_health_jobs", "Asynchronous jobs by status",
+    lambda: {(status,): count for status, count in job_queue.cached_counts().items()} if job_queue else {},
+    ("status",)
+)
+
+def _require_jobs():
+    if job_queue is None:
+        raise HTTPException(status_code=404, detail="Asynchronous jobs are not enabled")
+
+async def _read_job(job_id: str) -> Optional[dict]:
+    # Off the event loop: the read may wait on the queue's lock behind a synced commit
+    return await asyncio.get_running_loop().run_in_executor(None, job_queue.get, job_id)
+
+async def _get_job(job_id: str) -> dict:
+    job = await _read_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.post("", response_model=JobSubmitted, status_code=202)
+async def submit_job(
+    request: Request,
+    response: Response,
+    image: UploadFile = File(...),
+    pet_id: Optional[str] = None,
+    analysis_type: AnalysisType = Query(default=AnalysisType.GENERAL),
+    x_request_id: Optional[str] = Header(default=None)
+):
+    """
+    Queue a pet health analysis and return at once
+
+    Parameters:
+    - image: Pet photo to analyze
+    - pet_id: Optional ID of the pet
+    - analysis_type: Type of analysis to perform
+
+    Returns:
+    - Job id, and URLs to poll the job or follow it as Server-Sent Events
+    """
+    _require_jobs()
+    set_request_context(x_request_id or uuid.uuid4().hex, pet_id)
+
+    # Reject bad uploads now rather than after they waited in the queue
+    contents, issues = await _read_image(image)
+    if issues:
+        raise HTTPException(status_code=422, detail=_issues_response(issues))
+
+    loop = asyncio.get_running_loop()
+    if (await loop.run_in_executor(None, job_queue.counts))[QUEUED] >= config.JOBS_MAX_QUEUED:
+        logger.warning("Rejecting job, queue is full")
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full, please retry later",
+            headers={"Retry-After": str(config.RETRY_AFTER_SECONDS)}
+        )
+    job_id = await loop.run_in_executor(None, job_queue.submit, contents, pet_id, analysis_type.value)
+    job_runner.notify()
+    logger.info(f"Queued job {job_id} - Type: {analysis_type}, Pet ID: {pet_id}")
+
+    status_url = str(request.url_for("get_job", job_id=job_id))
+    response.headers["Location"] = status_url
+    return {
+        "job_id": job_id,
+        "status": QUEUED,
+        "status_url": status_url,
+        "events_url": str(request.url_for("job_events", job_id=job_id)),
+    }
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """
+    Status of an analysis job, with its result once finished
+    """
+    _require_jobs()
+    return await _get_job(job_id)
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Follow an analysis job as Server-Sent Events
+
+    Sends an event named after the job's status each time it changes
+    (queued, running, done or failed) with the job as JSON data, and ends
+    the stream once the job has finished.
+    """
+    _require_jobs()
+    await _get_job(job_id)
+
+    async def stream():
+        last = None
+        idle_since = time.monotonic()
+        while True:
+            job = await _read_job(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job expired'})}\n\n"
+                return
+            state = (job["status"], job.get("position"), job["attempts"])
+            if state != last:
+                last = state
+                idle_since = time.monotonic()
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                if job["status"] in FINISHED:
+                    return
+            elif time.monotonic() - idle_since >= KEEPALIVE_SECONDS:
+                idle_since = time.monotonic()
+                yield ": keep-alive\n\n"
+            await job_runner.wait_for_change(config.JOBS_POLL_SECONDS)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
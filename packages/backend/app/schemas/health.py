@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from enum import Enum
 
 class AnalysisType(str, Enum):
@@ -8,6 +8,7 @@ class AnalysisType(str, Enum):
     EYES = "eyes"
     EARS = "ears"
     MOUTH = "mouth"
+    ALL = "all"
 
 class Condition(BaseModel):
     condition: str
@@ -18,12 +19,16 @@ class AnalysisResult(BaseModel):
     confidence: float = Field(..., ge=0.0, le=1.0)
     conditions_detected: List[Condition] = []
     recommendations: List[str]
+    stage: Optional[str] = None  # cascade stage that answered: "fast" or "full"
 
 class AnalysisResponse(BaseModel):
     status: str
     pet_id: Optional[str]
     analysis_type: AnalysisType
     results: AnalysisResult
+    results_by_type: Optional[Dict[str, AnalysisResult]] = None
+    cached: bool = False
+    model_version: Optional[str] = None
 
 class AnalysisTypeInfo(BaseModel):
     id: str
@@ -32,3 +37,79 @@ class AnalysisTypeInfo(BaseModel):
 
 class AnalysisTypesResponse(BaseModel):
     analysis_types: List[AnalysisTypeInfo]
+
+class HistoryPoint(BaseModel):
+    timestamp: float
+    health_status: str
+    confidence: float
+    health_score: float  # 1 = certainly healthy, 0 = certainly an emergency
+    conditions: List[str] = []
+    embedding_distance: Optional[float] = None  # cosine distance to the latest analysis
+
+class HistoryChange(BaseModel):
+    timestamp: float
+    previous_health_status: str
+    health_status_changed: bool
+    health_score_delta: float
+    new_conditions: List[str] = []
+    resolved_conditions: List[str] = []
+    embedding_distance: Optional[float] = None  # None when taken by another model version
+
+class HistoryTrend(BaseModel):
+    health_score_slope_per_day: Optional[float] = None
+    points: List[HistoryPoint]
+
+class HistoryResponse(BaseModel):
+    status: str
+    pet_id: str
+    analyses: int
+    latest: HistoryPoint
+    change_from_previous: Optional[HistoryChange] = None
+    change_from_first: Optional[HistoryChange] = None
+    trend: HistoryTrend
+
+class SimilarCase(BaseModel):
+    case_id: int
+    timestamp: float
+    distance: float  # cosine distance between embeddings
+    health_status: str
+    confidence: float
+    conditions: List[str] = []
+    same_pet: Optional[bool] = None  # only when the query gave a pet_id
+
+class SimilarCasesResponse(BaseModel):
+    status: str
+    pet_id: Optional[str]
+    cases: List[SimilarCase]
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    events_url: str
+
+class JobStatus(BaseModel):
+    id: str
+    status: str  # queued, running, done or failed
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    pet_id: Optional[str] = None
+    analysis_type: AnalysisType
+    attempts: int = 0
+    position: Optional[int] = None  # jobs ahead of this one while queued
+    result: Optional[Dict[str, Any]] = None  # the /analyze response body, or its error body
+    error: Optional[str] = None
+
+class ShadowReport(BaseModel):
+    candidate_version: str
+    batches: int  # sampled batches run through both models
+    images: int
+    agreement: Optional[float] = None  # fraction with the same health status and conditions
+    active_batch_ms: Optional[float] = None
+    candidate_batch_ms: Optional[float] = None
+
+class ModelStatus(BaseModel):
+    model_version: Optional[str]
+    reloading: bool
+    candidate: Optional[ShadowReport] = None
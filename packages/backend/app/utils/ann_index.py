@@ -0,0 +1,368 @@
+"""
+Approximate nearest neighbour search over embeddings: an inverted file
+with product quantization (IVF-PQ) in NumPy.
+
+Vectors are L2-normalized, so squared distances order results the same way
+as cosine distance (reported as squared distance / 2). A coarse k-means
+quantizer splits the space into ``nlist`` cells; the residual of each
+vector from its cell centroid is split into ``m`` sub-vectors, each stored
+as one byte naming the nearest of 256 sub-centroids. A query only visits
+the ``nprobe`` nearest cells and scores their codes with a per-cell lookup
+table, so it reads ``m`` bytes per candidate instead of the full vector.
+"""
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+_CODEBOOK_SIZE = 256  # one byte per sub-vector
+# Rows per block in k-means and encoding, bounding temporary distance matrices
+_BLOCK = 16384
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray, centroid_norms: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for each vector, in blocks"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _BLOCK):
+        block = vectors[start:start + _BLOCK]
+        # ||x - c||^2 without the ||x||^2 term, which doesn't change the argmin
+        distances = centroid_norms - 2.0 * block @ centroids.T
+        assignments[start:start + _BLOCK] = distances.argmin(axis=1)
+    return assignments
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random vectors"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) < k:
+        raise ValueError(f"Need at least {k} training vectors, got {len(vectors)}")
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = _nearest(vectors, centroids, (centroids ** 2).sum(axis=1))
+        counts = np.bincount(assignments, minlength=k)
+        empty = counts == 0
+        # Sum each cluster's members in one pass over the vectors sorted by cluster
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[~empty]
+        centroids[~empty] = np.add.reduceat(vectors[order], starts, axis=0) / counts[~empty, None]
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class _InvertedList:
+    """Codes and ids of one cell, grown by doubling; may start as views into memory-mapped arrays"""
+
+    def __init__(self, m: int, codes=None, ids=None):
+        self._codes = np.empty((0, m), dtype=np.uint8) if codes is None else codes
+        self._ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self.size = len(self._ids)
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[:self.size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self.size]
+
+    def extend(self, codes: np.ndarray, ids: np.ndarray):
+        needed = self.size + len(ids)
+        if needed > len(self._ids) or not self._ids.flags.writeable:
+            # Copies memory-mapped lists into memory on their first insert
+            capacity = max(needed, 2 * len(self._ids), 16)
+            grown_codes = np.empty((capacity, self._codes.shape[1]), dtype=np.uint8)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_codes[:self.size] = self.codes
+            grown_ids[:self.size] = self.ids
+            self._codes, self._ids = grown_codes, grown_ids
+        self._codes[self.size:needed] = codes
+        self._ids[self.size:needed] = ids
+        self.size = needed
+
+
+class IVFPQIndex:
+    """
+    IVF-PQ index with incremental inserts and memory-mapped persistence.
+
+    Until ``train_size`` vectors have been added, vectors are kept as they
+    are and searched exhaustively; the index then trains its quantizers on
+    them in a background thread and, once trained, encodes everything added
+    from then on. ``search`` can re-rank the best candidates with exact
+    distances when given a function that returns the original vectors for
+    a list of ids.
+
+    All methods are thread-safe. Training holds no lock while it runs, so
+    inserts and (exhaustive) searches go on until the trained quantizers
+    are swapped in.
+    """
+
+    def __init__(self, dim: int, nlist: int = 1024, m: int = 32, nprobe: int = 64,
+                 train_size: Optional[int] = None, space: Optional[str] = None):
+        if dim % m:
+            raise ValueError(f"Dimension {dim} is not divisible into {m} sub-vectors")
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        # ~40 training vectors per cell (and per sub-centroid) keeps k-means stable
+        self.train_size = train_size or 40 * max(nlist, _CODEBOOK_SIZE)
+        if self.train_size < max(nlist, _CODEBOOK_SIZE):
+            raise ValueError(f"Need a train_size of at least {max(nlist, _CODEBOOK_SIZE)}, got {self.train_size}")
+        # Free-form tag of the embedding space (e.g. model version) the index holds
+        self.space = space
+        self.centroids = None
+        self.codebooks = None
+        self._codebook_norms = None
+        self._lists = []
+        self._pending = []
+        self._pending_ids = []
+        self._max_id = -1
+        self._lock = threading.RLock()
+        # One training at a time; the background one started by add() while it runs
+        self._train_lock = threading.Lock()
+        self._trainer: Optional[threading.Thread] = None
+        self._save_lock = threading.Lock()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def max_id(self) -> int:
+        """Largest id added so far, -1 when empty"""
+        return self._max_id
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(v) for v in self._pending) + sum(l.size for l in self._lists)
+
+    def add(self, vectors, ids):
+        """Add vectors under integer ids; ids need not be contiguous"""
+        vectors = _normalize(vectors)
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if vectors.shape != (len(ids), self.dim):
+            raise ValueError(f"Expected {len(ids)} vectors of dimension {self.dim}, got {vectors.shape}")
+        with self._lock:
+            if len(ids):
+                self._max_id = max(self._max_id, int(ids.max()))
+            if self.is_trained:
+                self._encode_into_lists(vectors, ids)
+                return
+            self._pending.append(vectors)
+            self._pending_ids.append(ids)
+            if self._trainer is None and sum(len(v) for v in self._pending) >= self.train_size:
+                self._trainer = threading.Thread(target=self._train_in_background, name="ann-train", daemon=True)
+                self._trainer.start()
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a training started by add() to finish; returns is_trained"""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+        return self.is_trained
+
+    def train(self, vectors=None):
+        """
+        Train the quantizers, by default on the vectors added so far, and
+        encode those. The quantizers are built on a copy of the index and
+        swapped in at the end, together with vectors added meanwhile.
+        """
+        with self._train_lock:
+            # Already trained by add() in the background
+            if vectors is None and self.is_trained:
+                return
+            with self._lock:
+                taken = len(self._pending)
+                pending = np.concatenate(self._pending) if taken else np.empty((0, self.dim), np.float32)
+                pending_ids = np.concatenate(self._pending_ids) if taken else np.empty(0, np.int64)
+            sample = pending if vectors is None else _normalize(vectors)
+            if len(sample) > self.train_size:
+                sample = sample[np.random.default_rng(0).choice(len(sample), self.train_size, replace=False)]
+
+            trained = IVFPQIndex(self.dim, self.nlist, self.m, self.nprobe, self.train_size, self.space)
+            trained.centroids = kmeans(sample, self.nlist)
+            residuals = sample - trained.centroids[trained._assign(sample)]
+            dsub = self.dim // self.m
+            trained.codebooks = np.stack([
+                kmeans(np.ascontiguousarray(residuals[:, i * dsub:(i + 1) * dsub]), _CODEBOOK_SIZE, seed=i + 1)
+                for i in range(self.m)
+            ])
+            trained._codebook_norms = (trained.codebooks ** 2).sum(axis=2)
+            trained._lists = [_InvertedList(self.m) for _ in range(self.nlist)]
+            if len(pending_ids):
+                trained._encode_into_lists(pending, pending_ids)
+
+            with self._lock:
+                added = list(zip(self._pending[taken:], self._pending_ids[taken:]))
+                self.centroids, self.codebooks = trained.centroids, trained.codebooks
+                self._codebook_norms, self._lists = trained._codebook_norms, trained._lists
+                self._pending, self._pending_ids = [], []
+                for added_vectors, added_ids in added:
+                    self._encode_into_lists(added_vectors, added_ids)
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        finally:
+            with self._lock:
+                self._trainer = None
+
+    def search(self, queries, k: int = 10, nprobe: Optional[int] = None,
+               refine: Optional[Callable[[np.ndarray], np.ndarray]] = None, refine_factor: int = 4):
+        """
+        The k nearest ids for each query as (distances, ids), both (n_queries, k).
+
+        Distances are cosine distances. Missing results are padded with id -1
+        and distance inf. With refine, the best k * refine_factor candidates
+        are re-scored exactly on the vectors refine(ids) returns.
+        """
+        queries = _normalize(queries)
+        candidates = k * refine_factor if refine is not None else k
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        with self._lock:
+            for row, query in enumerate(queries):
+                found_distances, found_ids = self._search_one(query, candidates, nprobe or self.nprobe)
+                if refine is not None and len(found_ids):
+                    exact = _normalize(refine(found_ids))
+                    found_distances = ((exact - query) ** 2).sum(axis=1)
+                    order = np.argsort(found_distances)[:k]
+                    found_distances, found_ids = found_distances[order], found_ids[order]
+                found = min(k, len(found_ids))
+                distances[row, :found] = found_distances[:found] / 2.0
+                ids[row, :found] = found_ids[:found]
+        return distances, ids
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return _nearest(vectors, self.centroids, (self.centroids ** 2).sum(axis=1))
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        dsub = self.dim // self.m
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for i, codebook in enumerate(self.codebooks):
+            codes[:, i] = _nearest(
+                np.ascontiguousarray(residuals[:, i * dsub:(i + 1) * dsub]), codebook, self._codebook_norms[i]
+            )
+        return codes
+
+    def _encode_into_lists(self, vectors: np.ndarray, ids: np.ndarray):
+        for start in range(0, len(vectors), _BLOCK):
+            block, block_ids = vectors[start:start + _BLOCK], ids[start:start + _BLOCK]
+            cells = self._assign(block)
+            codes = self._encode(block - self.centroids[cells])
+            order = np.argsort(cells, kind="stable")
+            bounds = np.searchsorted(cells[order], np.arange(self.nlist + 1))
+            for cell in np.flatnonzero(np.diff(bounds)):
+                rows = order[bounds[cell]:bounds[cell + 1]]
+                self._lists[cell].extend(codes[rows], block_ids[rows])
+
+    def _search_one(self, query: np.ndarray, k: int, nprobe: int):
+        if not self.is_trained:
+            if not self._pending:
+                return np.empty(0, np.float32), np.empty(0, np.int64)
+            # Exact search until there is enough data to train on
+            vectors, ids = np.concatenate(self._pending), np.concatenate(self._pending_ids)
+            distances = ((vectors - query) ** 2).sum(axis=1)
+        else:
+            cells = np.argsort(((self.centroids - query) ** 2).sum(axis=1))[:nprobe]
+            dsub = self.dim // self.m
+            offsets = np.arange(self.m) * _CODEBOOK_SIZE
+            parts, part_ids = [], []
+            for cell in cells:
+                inverted = self._lists[cell]
+                if inverted.size == 0:
+                    continue
+                # Squared distance from the query residual to every sub-centroid, (m, 256),
+                # as ||r||^2 + ||c||^2 - 2 r.c with one batched matrix product
+                residual = query - self.centroids[cell]
+                products = np.matmul(self.codebooks, residual.reshape(self.m, dsub, 1))[..., 0]
+                table = (self._codebook_norms - 2.0 * products).ravel()
+                parts.append(table[inverted.codes.astype(np.intp) + offsets].sum(axis=1) + residual @ residual)
+                part_ids.append(inverted.ids)
+            if not parts:
+                return np.empty(0, np.float32), np.empty(0, np.int64)
+            distances, ids = np.concatenate(parts), np.concatenate(part_ids)
+
+        if len(ids) > k:
+            best = np.argpartition(distances, k)[:k]
+            distances, ids = distances[best], ids[best]
+        order = np.argsort(distances)
+        return distances[order], ids[order]
+
+    def save(self, directory):
+        """
+        Write the index as .npy files plus meta.json. They are written to a
+        temporary directory that then takes the place of directory, so a
+        reader sees either the old index or the new one, never a mix.
+        """
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            arrays = {}
+            if self.is_trained:
+                sizes = np.array([l.size for l in self._lists], dtype=np.int64)
+                arrays["centroids"] = self.centroids
+                arrays["codebooks"] = self.codebooks
+                arrays["offsets"] = np.concatenate([[0], np.cumsum(sizes)])
+                arrays["codes"] = np.concatenate([l.codes for l in self._lists])
+                arrays["ids"] = np.concatenate([l.ids for l in self._lists])
+            else:
+                arrays["pending"] = np.concatenate(self._pending) if self._pending else np.empty((0, self.dim), np.float32)
+                arrays["pending_ids"] = np.concatenate(self._pending_ids) if self._pending_ids else np.empty(0, np.int64)
+            meta = {
+                "dim": self.dim, "nlist": self.nlist, "m": self.m, "nprobe": self.nprobe,
+                "train_size": self.train_size, "space": self.space, "max_id": self._max_id,
+                "trained": self.is_trained,
+            }
+        # The arrays are copies or never change once trained, so writing needs no lock
+        with self._save_lock:
+            tmp = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            for name, array in arrays.items():
+                np.save(tmp / f"{name}.npy", array)
+            (tmp / "meta.json").write_text(json.dumps(meta))
+            # A directory can't be renamed over a non-empty one: move the old one aside first.
+            # Memory-mapped files of the old index stay readable after it is removed.
+            old = directory.with_name(f"{directory.name}.{os.getpid()}.old")
+            if directory.exists():
+                os.replace(directory, old)
+            os.replace(tmp, directory)
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap: bool = True) -> "IVFPQIndex":
+        """Open a saved index; with mmap the codes stay on disk until a cell gets new inserts"""
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text())
+        index = cls(meta["dim"], meta["nlist"], meta["m"], meta["nprobe"], meta["train_size"], meta["space"])
+        index._max_id = meta["max_id"]
+        if meta["trained"]:
+            index.centroids = np.load(directory / "centroids.npy")
+            index.codebooks = np.load(directory / "codebooks.npy")
+            index._codebook_norms = (index.codebooks ** 2).sum(axis=2)
+            offsets = np.load(directory / "offsets.npy")
+            # Empty arrays can't be memory-mapped
+            mode = "r" if mmap and offsets[-1] else None
+            codes = np.load(directory / "codes.npy", mmap_mode=mode)
+            ids = np.load(directory / "ids.npy", mmap_mode=mode)
+            index._lists = [
+                _InvertedList(index.m, codes[offsets[i]:offsets[i + 1]], ids[offsets[i]:offsets[i + 1]])
+                for i in range(index.nlist)
+            ]
+        else:
+            pending = np.load(directory / "pending.npy")
+            if len(pending):
+                index._pending = [pending]
+                index._pending_ids = [np.load(directory / "pending_ids.npy")]
+        return index
@@ -0,0 +1,62 @@
+import threading
+from contextlib import contextmanager
+from typing import Sequence
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    Preallocated fixed-shape arrays lent out and given back.
+
+    All ``size`` buffers are slots of one array allocated up front, so the
+    steady state never allocates or frees them and resident memory stays
+    flat. When every slot is lent out ``acquire()`` falls back to a fresh
+    array, counted in ``misses``, rather than blocking; ``release()`` ignores
+    arrays the pool did not lend, so callers can release whatever they got.
+    """
+
+    def __init__(self, shape: Sequence[int], dtype=np.uint8, size: int = 32):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        self._buffers = np.zeros((size, *self.shape), dtype=self.dtype)
+        # The same view objects are lent every time, so release() can find their slot by id
+        self._slots = list(self._buffers)
+        self._slot_of = {id(slot): index for index, slot in enumerate(self._slots)}
+        self._free = list(range(size - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.misses = 0
+
+    @property
+    def in_use(self) -> int:
+        return self.size - len(self._free)
+
+    def acquire(self) -> np.ndarray:
+        """A buffer of the pool's shape and dtype; its contents are undefined"""
+        with self._lock:
+            if self._free:
+                return self._slots[self._free.pop()]
+            self.misses += 1
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def release(self, buffer: np.ndarray):
+        """Give a buffer back; safe to call more than once and with arrays from elsewhere"""
+        index = self._slot_of.get(id(buffer))
+        if index is None or self._slots[index] is not buffer:
+            return
+        with self._lock:
+            if index not in self._free:
+                self._free.append(index)
+
+    @contextmanager
+    def borrow(self):
+        """Lend a buffer for the duration of a with block"""
+        buffer = self.acquire()
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
+
+    def stats(self) -> dict:
+        return {"size": self.size, "in_use": self.in_use, "misses": self.misses}
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+class AnalysisCache:
+    """
+    Cache of analysis results (or backbone features) keyed by upload content.
+
+    An in-memory LRU bounded by entry count and TTL sits in front of an
+    optional SQLite tier, so results survive restarts when ``disk_path`` is set.
+    Values must be JSON serializable when the disk tier is enabled.
+
+    Writes to the disk tier are queued and committed together by a
+    background thread at most every ``disk_flush_seconds``; ``flush()``
+    writes what is queued at once. On the event loop use ``get_async()``,
+    which reads the disk tier in the default executor.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 disk_path: Optional[str] = None, max_disk_entries: int = 100000,
+                 disk_flush_seconds: float = 0.5):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.disk_flush_seconds = disk_flush_seconds
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # The connection has its own lock, so memory hits never wait on disk I/O
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        self._pending = []
+        # (thread, event that stops it) while the background writer runs
+        self._writer = None
+        self._wakeup = threading.Event()
+        if disk_path:
+            self._db = self._open_db(Path(disk_path))
+
+    @staticmethod
+    def content_digest(contents: bytes) -> str:
+        return hashlib.sha256(contents).hexdigest()
+
+    @staticmethod
+    def make_key(contents: bytes, model_version: str, analysis_type: str, digest: Optional[str] = None) -> str:
+        """
+        Build a cache key from the upload bytes, model version and analysis type.
+        Pass a precomputed content_digest to avoid hashing the upload again.
+        """
+        digest = digest or AnalysisCache.content_digest(contents)
+        return f"{digest}:{model_version}:{analysis_type}"
+
+    def get(self, key: str):
+        """Return the cached value for key, or None"""
+        value = self._get_memory(key)
+        if value is None:
+            value = self._get_disk(key)
+        return value
+
+    async def get_async(self, key: str):
+        """get() without blocking the event loop on the disk tier"""
+        value = self._get_memory(key)
+        if value is None:
+            if self._db is None:
+                return self._get_disk(key)
+            value = await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key)
+        return value
+
+    def set(self, key: str, value):
+        """Store a value in memory and, when enabled, queue it for the disk"""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is None:
+                return
+            self._pending.append((key, value, expires_at))
+            if self._writer is None:
+                closing = threading.Event()
+                thread = threading.Thread(target=self._write_behind, args=(closing,), name="cache-writer", daemon=True)
+                self._writer = (thread, closing)
+                thread.start()
+        self._wakeup.set()
+
+    def flush(self):
+        """Write queued entries to the disk tier in one transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        rows = [(key, json.dumps(value), expires_at) for key, value, expires_at in pending]
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)", rows
+            )
+            # Pruned about every 256 writes
+            if (self._disk_writes + len(rows)) // 256 > self._disk_writes // 256:
+                self._prune_disk()
+            self._disk_writes += len(rows)
+            self._db.commit()
+
+    def close(self):
+        """Stop the background writer after writing what is queued; set() starts it again"""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            thread, closing = writer
+            closing.set()
+            self._wakeup.set()
+            thread.join()
+        if self._db is not None:
+            self.flush()
+
+    def clear(self):
+        """Drop every in-memory entry, e.g. embeddings of a model that was swapped out"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def _get_memory(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _get_disk(self, key):
+        row = None
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+        value = json.loads(row[0]) if row is not None and row[1] > time.time() else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self._store(key, value, row[1])
+            self.disk_hits += 1
+            return value
+
+    def _write_behind(self, closing):
+        while not closing.is_set():
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # Gives set() calls in the meantime a ride on the same commit
+            closing.wait(self.disk_flush_seconds)
+            self.flush()
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY expires_at LIMIT ?)",
+                (count - self.max_disk_entries,)
+            )
+
+    @staticmethod
+    def _open_db(path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS results_expires_at ON results (expires_at)")
+        db.commit()
+        return db
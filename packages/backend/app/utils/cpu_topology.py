@@ -0,0 +1,203 @@
+import fcntl
+import math
+import os
+import tempfile
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence
+
+
+# Lock files of claimed CPU sets, open for the life of the process
+_claimed_locks = []
+
+
+class WorkerPlan(NamedTuple):
+    """How to split the host between server processes"""
+    workers: int
+    threads: int  # torch intra-op threads per worker
+    interop_threads: int
+    cpu_sets: List[List[int]]  # one CPU set per worker, for pinning
+
+    def describe(self) -> str:
+        sets = " ".join(format_cpu_list(cpus) for cpus in self.cpu_sets)
+        return f"{self.workers} workers x {self.threads} threads (interop {self.interop_threads}), CPUs {sets}"
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """CPUs from a kernel-style list such as "0-3,8,10-11" """
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpu_list(cpus: Sequence[int]) -> str:
+    """Inverse of parse_cpu_list, collapsing consecutive CPUs into ranges"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on, which can be fewer than the host has (taskset, cpuset cgroups)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def _read_quota(path: Path) -> Optional[float]:
+    """Cores allowed by a cgroup v2 cpu.max file, or a v1 cfs_quota_us beside cfs_period_us"""
+    try:
+        if path.name == "cpu.max":
+            # "<quota> <period>" in microseconds, or "max <period>"
+            fields = path.read_text().split()
+            return None if fields[0] == "max" else int(fields[0]) / int(fields[1])
+        quota = int(path.read_text())
+        period = int((path.parent / "cpu.cfs_period_us").read_text())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_cpu_limit(root="/sys/fs/cgroup", proc_cgroup="/proc/self/cgroup") -> Optional[float]:
+    """
+    CPU quota of this process's cgroup in cores (e.g. 1.5 for a
+    docker --cpus=1.5 container), or None when unlimited. The tightest
+    limit along the cgroup path counts, as the kernel enforces all of them.
+    """
+    root = Path(root)
+    try:
+        lines = Path(proc_cgroup).read_text().splitlines()
+    except OSError:
+        lines = []
+    candidates = []
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        path = path.strip("/")
+        if controllers == "":
+            # cgroup v2: the quota of every ancestor applies
+            parts = path.split("/") if path else []
+            candidates += [root.joinpath(*parts[:depth], "cpu.max") for depth in range(len(parts), -1, -1)]
+        elif "cpu" in controllers.split(","):
+            # cgroup v1; inside a container the hierarchy is usually mounted at its own cgroup
+            for mount in (controllers, "cpu"):
+                candidates += [root / mount / path / "cpu.cfs_quota_us", root / mount / "cpu.cfs_quota_us"]
+    quotas = [quota for quota in map(_read_quota, dict.fromkeys(candidates)) if quota is not None]
+    return min(quotas) if quotas else None
+
+
+def cpu_budget(cpus: Optional[Sequence[int]] = None, quota: Optional[float] = None) -> int:
+    """
+    Cores the server may keep busy: the CPUs it can run on, capped by the
+    cgroup quota. Rounds the quota down, since exceeding it gets the whole
+    cgroup throttled until the end of the period, which is far worse for
+    tail latency than leaving part of a core idle.
+    """
+    cpus = available_cpus() if cpus is None else cpus
+    budget = len(cpus)
+    if quota is not None:
+        budget = min(budget, max(1, math.floor(quota)))
+    return max(1, budget)
+
+
+def _core_key(cpu: int, sysfs: Path):
+    topology = sysfs / f"cpu{cpu}" / "topology"
+    try:
+        return (int((topology / "physical_package_id").read_text()), int((topology / "core_id").read_text()), cpu)
+    except (OSError, ValueError):
+        return (0, cpu, cpu)
+
+
+def split_cpus(cpus: Sequence[int], groups: int, sysfs="/sys/devices/system/cpu") -> List[List[int]]:
+    """
+    Split CPUs into contiguous groups of nearly equal size, ordered by
+    socket and physical core so hyperthread siblings share a group. With
+    more groups than CPUs, groups share CPUs round-robin.
+    """
+    ordered = [key[2] for key in sorted(_core_key(cpu, Path(sysfs)) for cpu in cpus)]
+    if groups >= len(ordered):
+        return [[ordered[i % len(ordered)]] for i in range(groups)]
+    size, extra = divmod(len(ordered), groups)
+    result, start = [], 0
+    for i in range(groups):
+        end = start + size + (1 if i < extra else 0)
+        result.append(sorted(ordered[start:end]))
+        start = end
+    return result
+
+
+def plan_workers(workers: Optional[int] = None, threads: Optional[int] = None, interop_threads: int = 1,
+                 cpus: Optional[Sequence[int]] = None, quota: Optional[float] = None,
+                 sysfs="/sys/devices/system/cpu") -> WorkerPlan:
+    """
+    Worker count and torch threads per worker that fill the CPU budget
+    without oversubscribing it. By default about sqrt(budget) workers:
+    intra-op scaling of one forward pass flattens out with more threads,
+    while extra workers keep cores busy during the Python-bound stages
+    (upload parsing, decode, formatting) one process cannot overlap.
+    """
+    cpus = available_cpus() if cpus is None else list(cpus)
+    if quota is None:
+        quota = cgroup_cpu_limit()
+    budget = cpu_budget(cpus, quota)
+    workers = workers or max(1, round(math.sqrt(budget)))
+    threads = threads or max(1, budget // workers)
+    return WorkerPlan(workers, threads, interop_threads, split_cpus(cpus, workers, sysfs))
+
+
+def candidate_plans(cpus: Optional[Sequence[int]] = None, quota: Optional[float] = None,
+                    sysfs="/sys/devices/system/cpu") -> List[WorkerPlan]:
+    """Plans worth calibrating: power-of-two worker counts, plus the default, splitting the budget evenly"""
+    cpus = available_cpus() if cpus is None else list(cpus)
+    if quota is None:
+        quota = cgroup_cpu_limit()
+    budget = cpu_budget(cpus, quota)
+    counts = {2 ** i for i in range(budget.bit_length()) if 2 ** i <= budget}
+    counts.add(plan_workers(cpus=cpus, quota=quota, sysfs=sysfs).workers)
+    return [plan_workers(workers, cpus=cpus, quota=quota, sysfs=sysfs) for workers in sorted(counts)]
+
+
+def claim_cpu_set(cpu_sets: Sequence[Sequence[int]], lock_dir=None) -> Optional[int]:
+    """
+    Claim one of cpu_sets for this process and pin every thread of it there.
+
+    Server workers are started identically, so each takes the first set
+    whose lock file it can lock; the lock is held for the life of the
+    process, so a restarted worker takes over the set of the one that
+    died. Locks live in lock_dir, by default one per parent process (the
+    uvicorn supervisor). Returns the claimed index, or None when all sets
+    are taken.
+    """
+    lock_dir = Path(lock_dir or Path(tempfile.gettempdir()) / f"pet-health-cpus-{os.getppid()}")
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    for index, cpus in enumerate(cpu_sets):
+        handle = open(lock_dir / f"slot-{index}.lock", "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        # Kept open, and locked, until the process exits
+        _claimed_locks.append(handle)
+        pin_process(cpus)
+        return index
+    return None
+
+
+def pin_process(cpus: Sequence[int]):
+    """Restrict every existing thread of this process, and the threads they start, to cpus"""
+    cpus = set(cpus)
+    for task in Path("/proc/self/task").iterdir():
+        try:
+            os.sched_setaffinity(int(task.name), cpus)
+        except (ProcessLookupError, OSError):
+            # The thread exited meanwhile
+            pass
+    os.sched_setaffinity(0, cpus)
@@ -0,0 +1,219 @@
+import fcntl
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+_MAGIC = b"PHEMB1\0\0"
+_HEADER = struct.Struct("<8sIII")
+# Rows start at a fixed offset so the file can be memory-mapped as one record array
+_HEADER_SIZE = 64
+
+
+def _key(value: str) -> bytes:
+    """Fixed-width key for a pet id or embedding space"""
+    # numpy drops trailing NULs from "S" fields, so keys never carry them
+    return hashlib.blake2b(value.encode(), digest_size=16).digest().rstrip(b"\0")
+
+
+class EmbeddingStore:
+    """
+    Append-only history of backbone embeddings and general head outputs, per pet.
+
+    Rows live in one binary file: a small header, then fixed-size records
+    (pet key, embedding space, timestamp, health and condition
+    probabilities, embedding). Appends go to the end of the file under an
+    exclusive lock, so several worker processes can share one store; reads
+    memory-map the file and only copy the rows of the pet asked for. A
+    per-pet index of row numbers is kept in memory and extended when the
+    file has grown.
+
+    Embeddings are only comparable within one space (model version and
+    cascade stage). Shorter embeddings, e.g. from the cascade's first stage,
+    are zero-padded to ``dim``, which leaves distances unchanged.
+    """
+
+    def __init__(self, path, dim: int = 1280, num_health_classes: int = 5, num_conditions: int = 10):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists() and self.path.stat().st_size >= _HEADER_SIZE:
+            with open(self.path, "rb") as f:
+                magic, dim, num_health_classes, num_conditions = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{self.path} is not an embedding store")
+        else:
+            with open(self.path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, dim, num_health_classes, num_conditions).ljust(_HEADER_SIZE, b"\0"))
+        self.dim = dim
+        self.dtype = np.dtype([
+            ("pet", "S16"),
+            ("space", "S16"),
+            ("timestamp", "<f8"),
+            ("health", "<f4", (num_health_classes,)),
+            ("conditions", "<f4", (num_conditions,)),
+            ("embedding", "<f4", (dim,)),
+        ])
+        self._rows = None
+        self._count = 0
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._count
+
+    def append(self, pet_id: str, space: str, embedding, health_probs, condition_probs,
+               timestamp: Optional[float] = None) -> int:
+        """Add one analysis to the pet's history; returns its row number, a stable id for the record"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        if embedding.size > self.dim:
+            raise ValueError(f"Embedding of size {embedding.size} exceeds store dimension {self.dim}")
+        row = np.zeros(1, dtype=self.dtype)
+        row["pet"] = _key(pet_id)
+        row["space"] = _key(space)
+        row["timestamp"] = time.time() if timestamp is None else timestamp
+        row["health"] = health_probs
+        row["conditions"] = condition_probs
+        row["embedding"][0, :embedding.size] = embedding
+
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(row.tobytes())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return (offset - _HEADER_SIZE) // self.dtype.itemsize
+
+    def history(self, pet_id: str, space: Optional[str] = None) -> np.ndarray:
+        """The pet's records in timestamp order, optionally only those in one embedding space"""
+        with self._lock:
+            self._refresh()
+            rows = self._index.get(_key(pet_id))
+            if not rows:
+                return np.zeros(0, dtype=self.dtype)
+            records = self._rows[np.asarray(rows)]
+        if space is not None:
+            records = records[records["space"] == _key(space)]
+        return records[np.argsort(records["timestamp"], kind="stable")]
+
+    def rows(self, ids) -> np.ndarray:
+        """Records by row number, in the order given"""
+        with self._lock:
+            self._refresh()
+            return self._rows[np.asarray(ids, dtype=np.int64)]
+
+    def scan(self, start: int = 0, space: Optional[str] = None, block: int = 65536):
+        """Yield (row numbers, records) from row start on, in blocks, optionally only one embedding space"""
+        with self._lock:
+            self._refresh()
+            rows, count = self._rows, self._count
+        for begin in range(start, count, block):
+            records = rows[begin:begin + block]
+            ids = np.arange(begin, begin + len(records))
+            if space is not None:
+                keep = records["space"] == _key(space)
+                records, ids = records[keep], ids[keep]
+            if len(ids):
+                yield ids, records
+
+    @staticmethod
+    def pet_key(pet_id: str) -> bytes:
+        """The key records store for pet_id"""
+        return _key(pet_id)
+
+    def _refresh(self):
+        """Map rows appended since the last read, by any process, and index them"""
+        count = (os.path.getsize(self.path) - _HEADER_SIZE) // self.dtype.itemsize
+        if count == self._count:
+            return
+        self._rows = np.memmap(self.path, dtype=self.dtype, mode="r", offset=_HEADER_SIZE, shape=(count,))
+        new_pets = self._rows["pet"][self._count:count]
+        for offset, pet in enumerate(new_pets.tolist(), start=self._count):
+            self._index.setdefault(pet, []).append(offset)
+        self._count = count
+
+
+def health_scores(health_probs: np.ndarray) -> np.ndarray:
+    """Expected health on a 0-1 scale: 1 when certainly healthy, 0 when certainly an emergency"""
+    severity = np.arange(health_probs.shape[-1], dtype=np.float32)
+    return 1.0 - health_probs @ severity / (health_probs.shape[-1] - 1)
+
+
+def _cosine_distances(embeddings: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference)
+    similarity = (embeddings @ reference) / np.maximum(norms, np.finfo(np.float32).tiny)
+    return np.clip(1.0 - similarity, 0.0, 2.0)
+
+
+def compare_history(records: np.ndarray, health_labels, condition_labels,
+                    condition_threshold: float = 0.5, limit: int = 50) -> Optional[dict]:
+    """
+    Trend and change of a pet's history, from stored vectors alone.
+
+    Compares the latest analysis with the previous and the first ones:
+    health score change, health status change, conditions that appeared or
+    resolved, and embedding cosine distance where both analyses share an
+    embedding space. The trend is the least-squares slope of the health
+    score per day plus the last ``limit`` points, each with its embedding
+    drift from the latest analysis.
+    """
+    if len(records) == 0:
+        return None
+
+    scores = health_scores(records["health"])
+    status_idx = records["health"].argmax(axis=1)
+    detected = records["conditions"] > condition_threshold
+    latest = len(records) - 1
+
+    # One matrix-vector product gives every distance to the latest embedding
+    same_space = records["space"] == records["space"][latest]
+    distances = np.full(len(records), np.nan, dtype=np.float32)
+    distances[same_space] = _cosine_distances(
+        records["embedding"][same_space], records["embedding"][latest]
+    )
+
+    def point(i):
+        return {
+            "timestamp": float(records["timestamp"][i]),
+            "health_status": health_labels[status_idx[i]],
+            "confidence": float(records["health"][i, status_idx[i]]),
+            "health_score": float(scores[i]),
+            "conditions": [condition_labels[j] for j in np.flatnonzero(detected[i])],
+            "embedding_distance": None if np.isnan(distances[i]) else float(distances[i]),
+        }
+
+    def change(i):
+        if i == latest:
+            return None
+        return {
+            "timestamp": float(records["timestamp"][i]),
+            "previous_health_status": health_labels[status_idx[i]],
+            "health_status_changed": bool(status_idx[i] != status_idx[latest]),
+            "health_score_delta": float(scores[latest] - scores[i]),
+            "new_conditions": [condition_labels[j] for j in np.flatnonzero(detected[latest] & ~detected[i])],
+            "resolved_conditions": [condition_labels[j] for j in np.flatnonzero(detected[i] & ~detected[latest])],
+            "embedding_distance": None if np.isnan(distances[i]) else float(distances[i]),
+        }
+
+    slope = None
+    days = (records["timestamp"] - records["timestamp"][0]) / 86400.0
+    if len(records) > 1 and days[-1] > 0:
+        slope = float(np.polyfit(days, scores, 1)[0])
+
+    return {
+        "analyses": len(records),
+        "latest": point(latest),
+        "change_from_previous": change(latest - 1) if latest > 0 else None,
+        "change_from_first": change(0) if latest > 0 else None,
+        "trend": {
+            "health_score_slope_per_day": slope,
+            "points": [point(i) for i in range(max(0, len(records) - limit), len(records))],
+        },
+    }
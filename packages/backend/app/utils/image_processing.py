@@ -1,78 +1,202 @@
+import io
+import zipfile
+from pathlib import PurePosixPath
 import numpy as np
 from PIL import Image
+from app.utils.metrics import stage_timer, timed
 
-def preprocess_image(image: Image.Image, target_size=(380, 380)):
+# Input resolution of the health model
+MODEL_INPUT_SIZE = (224, 224)
+
+def decode_image(contents: bytes, target_size=MODEL_INPUT_SIZE) -> Image.Image:
+    """
+    Open an uploaded image, letting JPEGs decode at a reduced scale.
+
+    JPEG draft mode picks the largest DCT scaling (1/2, 1/4 or 1/8) that keeps
+    the image at least target_size, so large phone photos are never decoded
+    at full resolution. Palette images (every GIF, some PNGs) are expanded to
+    RGB, or RGBA when they carry transparency; other formats are left untouched.
+    """
+    image = Image.open(io.BytesIO(contents))
+    image.draft("RGB", target_size)
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image
+
+def preprocess_image(image: Image.Image, target_size=MODEL_INPUT_SIZE, out=None):
     """
     Preprocess image for model input
+
+    Resizes once, straight to the model input size, and returns an
+    HxWx3 uint8 array; normalization happens when the tensor is built.
+    With out, e.g. a slot of a BufferPool, the pixels are written there
+    and out is returned.
     """
-    # Resize image
-    image = image.resize(target_size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
     
-    # Convert to array and normalize
-    img_array = np.array(image)
-    img_array = img_array.astype(np.float32) / 255.0
+    if image.size != target_size:
+        image = image.resize(target_size, Image.Resampling.BILINEAR)
     
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, axis=0)
-    
-    return img_array
+    if out is None:
+        return np.asarray(image, dtype=np.uint8)
+    np.copyto(out, image)
+    return out
 
-def detect_image_issues(image: Image.Image) -> list:
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
     """
-    Check for common image issues
+    Difference hash of an image as a hash_size**2-bit integer.
+
+    Each bit records whether a pixel is brighter than its right neighbour on a
+    (hash_size + 1) x hash_size grayscale thumbnail, so the hash is stable
+    under re-encoding and resizing. Cheap on an already draft-decoded image.
+    """
+    thumbnail = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def header_issues(size, mode) -> list:
+    """
+    Issues detectable from the image header alone, before any pixels are decoded
     """
     issues = []
     
     # Check image size
-    if image.size[0] < 200 or image.size[1] < 200:
+    if size[0] < 200 or size[1] < 200:
         issues.append("Image resolution too low")
     
-    # Check image mode/channels
-    if image.mode not in ['RGB', 'RGBA']:
+    # Check image mode/channels; palette images are expanded by decode_image
+    if mode not in ['RGB', 'RGBA', 'P']:
         issues.append("Image format not supported")
     
-    # Check image brightness
-    img_array = np.array(image)
-    brightness = np.mean(img_array)
-    if brightness < 30:
+    return issues
+
+# Quality gate thresholds, on the 0-255 luma of the model-sized image
+MIN_BRIGHTNESS = 30
+MAX_BRIGHTNESS = 240
+# Photos on white or black backdrops legitimately clip a large share of pixels
+MAX_CLIPPED_FRACTION = 0.9
+# Laplacian variance below this means blurry; a 1px Gaussian blur at 224x224 scores ~20
+MIN_SHARPNESS = 10.0
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def assess_quality(pixels: np.ndarray, min_sharpness: float = MIN_SHARPNESS):
+    """
+    Exposure and blur scores of an HxWx3 uint8 image, plus issue strings.
+
+    Meant for the model-sized image, so it costs the same at any upload
+    resolution. Scores:
+    - brightness: mean luma (0-255)
+    - contrast: luma standard deviation
+    - dark_clipped / bright_clipped: fraction of pixels at the ends of the histogram
+    - sharpness: variance of the 4-neighbour Laplacian of luma
+    """
+    luma = pixels.reshape(-1, 3).dot(_LUMA_WEIGHTS).reshape(pixels.shape[:2])
+    laplacian = (
+        luma[1:-1, :-2] + luma[1:-1, 2:] + luma[:-2, 1:-1] + luma[2:, 1:-1]
+        - 4 * luma[1:-1, 1:-1]
+    )
+    scores = {
+        "brightness": float(luma.mean()),
+        "contrast": float(luma.std()),
+        "dark_clipped": float(np.count_nonzero(luma <= 5) / luma.size),
+        "bright_clipped": float(np.count_nonzero(luma >= 250) / luma.size),
+        "sharpness": float(laplacian.var()),
+    }
+    
+    issues = []
+    if scores["brightness"] < MIN_BRIGHTNESS or scores["dark_clipped"] > MAX_CLIPPED_FRACTION:
         issues.append("Image too dark")
-    elif brightness > 240:
+    elif scores["brightness"] > MAX_BRIGHTNESS or scores["bright_clipped"] > MAX_CLIPPED_FRACTION:
         issues.append("Image too bright")
+    if scores["sharpness"] < min_sharpness:
+        issues.append("Image too blurry")
+    
+    return scores, issues
+
+def detect_image_issues(image: Image.Image) -> list:
+    """
+    Check for common image issues
+    """
+    issues = header_issues(image.size, image.mode)
+    
+    # Exposure and blur, on the downscaled image rather than full resolution
+    issues.extend(assess_quality(preprocess_image(image))[1])
     
     return issues
 
+def prepare_image(contents: bytes, min_sharpness: float = MIN_SHARPNESS, out=None):
+    """
+    Decode uploaded bytes, check for issues and preprocess for the model.
+
+    Module-level so it can run on a thread or process pool.
+    Returns (issues, processed_image, perceptual_hash, quality_scores);
+    processed_image and perceptual_hash are None when issues were found, and
+    quality_scores is None when the header alone was enough to reject it.
+    processed_image is written to out when given (thread pools only).
+    """
+    with stage_timer("decode"):
+        image = decode_image(contents)
+        issues = header_issues(image.size, image.mode)
+        if issues:
+            return issues, None, None, None
+        image.load()
+    
+    with stage_timer("preprocess"):
+        processed = preprocess_image(image, out=out)
+    
+    # The quality gate runs on the model input, which is needed anyway
+    with stage_timer("quality"):
+        quality, issues = assess_quality(processed, min_sharpness)
+    if issues:
+        return issues, None, None, quality
+    
+    with stage_timer("dhash"):
+        phash = dhash(image)
+    
+    return [], processed, phash, quality
+
+def is_zip_archive(contents: bytes) -> bool:
+    """Check for the zip local file header signature"""
+    return contents[:4] == b"PK\x03\x04"
+
+def extract_zip_images(contents: bytes, max_images: int, max_image_bytes: int) -> list:
+    """
+    Expand a zip archive of photos into (filename, contents, error) tuples.
+
+    At most max_images members are read. Members larger than max_image_bytes
+    (uncompressed) are not inflated and get an error message instead.
+    """
+    uploads = []
+    with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+        for info in archive.infolist():
+            name = PurePosixPath(info.filename)
+            if info.is_dir() or name.name.startswith(".") or "__MACOSX" in name.parts:
+                continue
+            if len(uploads) >= max_images:
+                break
+            if info.file_size > max_image_bytes:
+                uploads.append((info.filename, None, "Image file too large"))
+            else:
+                uploads.append((info.filename, archive.read(info), None))
+    return uploads
+
+@timed("format_results")
 def format_results(model_outputs: dict) -> dict:
     """
     Format model outputs into user-friendly results
+
+    Expects the labelled result of PetHealthPredictor.postprocess and adds
+    recommendations.
     """
-    health_status_map = {
-        0: "healthy",
-        1: "minor_issues",
-        2: "attention_needed",
-        3: "requires_vet",
-        4: "emergency"
-    }
-    
-    # Convert predictions to human-readable format
     formatted_results = {
-        "health_status": health_status_map[np.argmax(model_outputs['health_status'])],
-        "confidence": float(np.max(model_outputs['health_status'])),
-        "conditions_detected": [],
+        "health_status": model_outputs['health_status'],
+        "confidence": float(model_outputs['confidence']),
+        "conditions_detected": list(model_outputs['conditions_detected']),
         "recommendations": []
     }
     
-    # Add conditions if detected
-    if 'conditions' in model_outputs:
-        condition_scores = model_outputs['conditions']
-        threshold = 0.5  # Confidence threshold
-        
-        for idx, score in enumerate(condition_scores):
-            if score > threshold:
-                formatted_results['conditions_detected'].append({
-                    "condition": f"condition_{idx}",  # Replace with actual condition names
-                    "confidence": float(score)
-                })
-    
     # Generate recommendations based on health status
     if formatted_results['health_status'] == "healthy":
         formatted_results['recommendations'].append(
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+
+class JobQueue:
+    """
+    Durable queue of analysis jobs in SQLite.
+
+    Submitted jobs keep their upload in the database until they finish, so
+    queued work survives a restart. ``claim`` takes the oldest queued job
+    under a lease, which its worker ``renew``s while it runs; a job whose
+    lease runs out (its worker died) is handed out again, up to
+    ``max_attempts`` times, which also makes the queue safe to share
+    between several server processes. Every claim carries a fresh token,
+    and finishing, releasing or requeueing a job only takes effect with
+    the token of its current claim, so a worker that lost its lease cannot
+    overwrite the attempt that replaced it. Finished jobs keep their result
+    for ``result_ttl_seconds``.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 60, max_attempts: int = 3,
+                 result_ttl_seconds: float = 86400):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.result_ttl_seconds = result_ttl_seconds
+        self._lock = threading.Lock()
+        self._db = self._open_db(Path(path))
+        self._writes = 0
+        self._counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+    def submit(self, payload: bytes, pet_id: Optional[str], analysis_type: str) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created, pet_id, analysis_type, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, time.time(), pet_id, analysis_type, payload)
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """Lease the oldest runnable job to the caller: {id, token, pet_id, analysis_type, payload, attempts}"""
+        now = time.time()
+        with self._lock:
+            # Jobs that used up their attempts on expired leases fail instead of running again
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = ?, payload = NULL "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, "Job did not finish after repeated attempts", RUNNING, now, self.max_attempts)
+            )
+            # One statement, so two processes can never claim the same job
+            row = self._db.execute(
+                "UPDATE jobs SET status = ?, started = ?, lease_until = ?, token = ?, attempts = attempts + 1 "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                "ORDER BY created LIMIT 1) "
+                "RETURNING id, token, pet_id, analysis_type, payload, attempts",
+                (RUNNING, now, now + self.lease_seconds, uuid.uuid4().hex, QUEUED, RUNNING, now)
+            ).fetchone()
+            self._db.commit()
+        if row is None:
+            return None
+        return dict(zip(("id", "token", "pet_id", "analysis_type", "payload", "attempts"), row))
+
+    def renew(self, job_id: str, token: str) -> bool:
+        """Extend the lease of a running job; False once the claim was lost"""
+        with self._lock:
+            renewed = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND token = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, token, RUNNING)
+            ).rowcount
+            self._db.commit()
+        return renewed == 1
+
+    def finish(self, job_id: str, token: str, result: dict, failed: bool = False) -> bool:
+        """Store a job's result and drop its upload; False if the claim was lost"""
+        with self._lock:
+            finished = self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, result = ?, payload = NULL, lease_until = NULL "
+                "WHERE id = ? AND token = ? AND status = ?",
+                (FAILED if failed else DONE, time.time(), json.dumps(result), job_id, token, RUNNING)
+            ).rowcount
+            self._writes += 1
+            if self._writes % 256 == 0:
+                self._prune()
+            self._db.commit()
+        return finished == 1
+
+    def release(self, job_id: str, token: str, error: str) -> bool:
+        """Give up on an attempt: requeue the job, or fail it once out of attempts; False if the claim was lost"""
+        with self._lock:
+            released = self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "finished = CASE WHEN attempts >= ? THEN ? END, "
+                "payload = CASE WHEN attempts >= ? THEN NULL ELSE payload END, "
+                "error = ?, lease_until = NULL WHERE id = ? AND token = ? AND status = ?",
+                (self.max_attempts, FAILED, QUEUED, self.max_attempts, time.time(), self.max_attempts,
+                 error, job_id, token, RUNNING)
+            ).rowcount
+            self._db.commit()
+        return released == 1
+
+    def requeue(self, job_id: str, token: str):
+        """Put an interrupted job back at its place in the queue without using up an attempt"""
+        with self._lock:
+            # The interrupted attempt may already have stored its result
+            self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts - 1, lease_until = NULL "
+                "WHERE id = ? AND token = ? AND status = ?",
+                (QUEUED, job_id, token, RUNNING)
+            )
+            self._db.commit()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Status of a job, with its position in the queue while queued and its result once finished"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, created, started, finished, pet_id, analysis_type, attempts, result, error "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(
+                ("id", "status", "created", "started", "finished", "pet_id", "analysis_type",
+                 "attempts", "result", "error"), row
+            ))
+            if job["status"] == QUEUED:
+                job["position"] = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, job["created"])
+                ).fetchone()[0]
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def counts(self) -> dict:
+        """Number of jobs in each status"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        self._counts = {**{status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}, **dict(rows)}
+        return self._counts
+
+    def cached_counts(self) -> dict:
+        """The counts as of the last counts() call, without touching the database"""
+        return dict(self._counts)
+
+    def _prune(self):
+        self._db.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+            (*FINISHED, time.time() - self.result_ttl_seconds)
+        )
+
+    @staticmethod
+    def _open_db(path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # An accepted job is a promise to the client, so every commit is synced
+        db.execute("PRAGMA synchronous=FULL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, "
+            "started REAL, finished REAL, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "pet_id TEXT, analysis_type TEXT NOT NULL, payload BLOB, result TEXT, error TEXT, token TEXT)"
+        )
+        # Databases from before claims carried a token
+        if "token" not in [column[1] for column in db.execute("PRAGMA table_info(jobs)")]:
+            db.execute("ALTER TABLE jobs ADD COLUMN token TEXT")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+        db.commit()
+        return db
+
+
+class JobRunner:
+    """
+    Fixed pool of asyncio workers draining a JobQueue through an async handler.
+
+    ``handler(job)`` returns ``(result, failed)``; an exception requeues the
+    job for another attempt. While the handler runs, its job's lease is
+    renewed every third of ``lease_seconds``, so long analyses are not
+    handed out again. Workers sleep until ``notify()`` or, to pick
+    up jobs submitted by other processes, ``poll_seconds``. Watchers can
+    ``await wait_for_change()`` to be woken whenever a job changes state.
+    The queue's counts are refreshed every ``poll_seconds`` in the default
+    executor, so ``queue.cached_counts()`` is never older than that.
+    """
+
+    def __init__(self, queue: JobQueue, handler, workers: int = 4, poll_seconds: float = 1.0):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self._tasks = []
+        self._wakeup = None
+        self._changed = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Condition()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._refresh_counts()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after a submit"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait_for_change(self, timeout: float):
+        """Wait until any job changes state in this process, or timeout"""
+        if self._changed is None:
+            await asyncio.sleep(timeout)
+            return
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _announce(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(None, self.queue.claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._announce()
+            heartbeat = asyncio.ensure_future(self._heartbeat(job))
+            try:
+                result, failed = await self.handler(job)
+                await loop.run_in_executor(None, self.queue.finish, job["id"], job["token"], result, failed)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back for the next start
+                self.queue.requeue(job["id"], job["token"])
+                raise
+            except Exception as e:
+                await loop.run_in_executor(None, self.queue.release, job["id"], job["token"], str(e))
+            finally:
+                heartbeat.cancel()
+            await self._announce()
+
+    async def _refresh_counts(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.queue.counts)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def _heartbeat(self, job):
+        """Keep renewing a running job's lease until cancelled or the claim is lost"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await loop.run_in_executor(None, self.queue.renew, job["id"], job["token"]):
+                return
@@ -1,37 +1,144 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
 from pathlib import Path
-from datetime import datetime
+
+from app import config
 
 # Configure logging
-log_dir = Path(__file__).parent.parent / 'logs'
-log_dir.mkdir(exist_ok=True)
+log_dir = Path(config.LOG_DIR) if config.LOG_DIR else Path(__file__).parent.parent / 'logs'
+log_dir.mkdir(parents=True, exist_ok=True)
+
+# Request id and pet id of the request being served, attached to every record
+_request_context = contextvars.ContextVar("request_context", default={})
+
+def set_request_context(request_id=None, pet_id=None):
+    """Tag log records from the current request (or task) with its ids"""
+    _request_context.set({"request_id": request_id, "pet_id": pet_id})
+
+class ContextFilter(logging.Filter):
+    """Copies the request context onto records while still on the calling task"""
+
+    def filter(self, record):
+        # Already set when the record went through the queue handler
+        if not hasattr(record, "request_id"):
+            context = _request_context.get()
+            record.request_id = context.get("request_id")
+            record.pet_id = context.get("pet_id")
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line. Adds request_id and pet_id when set, and
+    per-stage timings passed as ``extra={"stages": {"decode_ms": ...}}``.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in ("request_id", "pet_id", "stages"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the message on the caller; records stay in
+    # process, so pass them through and let the listener do all formatting.
+    # Extras such as stages may still be changed by the caller after logging,
+    # so the queued record gets copies of the mutable ones.
+    def prepare(self, record):
+        record = copy.copy(record)
+        for name, value in vars(record).items():
+            if isinstance(value, (dict, list, set)):
+                setattr(record, name, copy.copy(value))
+        return record
+
+context_filter = ContextFilter()
 
 # Create formatters and handlers
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+if config.LOG_FORMAT == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+def log_file(name: str) -> Path:
+    """
+    Path of a log file. Each handler rotates its own file, so with several
+    server processes every one of them gets its own, tagged with its pid.
+    """
+    if config.LOG_PER_PROCESS:
+        name = f"{name}.{os.getpid()}"
+    return log_dir / f"{name}.log"
+
+def _file_handler(path: Path) -> logging.Handler:
+    """Size-rotated when LOG_MAX_BYTES is set, time-rotated otherwise"""
+    # Opened on the first record, so processes that never log leave no file behind
+    if config.LOG_MAX_BYTES > 0:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=config.LOG_MAX_BYTES, backupCount=config.LOG_BACKUP_COUNT, delay=True
+        )
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            path, when=config.LOG_ROTATE_WHEN, backupCount=config.LOG_BACKUP_COUNT, delay=True
+        )
+    handler.setFormatter(formatter)
+    handler.addFilter(context_filter)
+    return handler
 
 # File handler for all logs
-file_handler = logging.FileHandler(
-    log_dir / f'api_{datetime.now().strftime("%Y%m%d")}.log'
-)
-file_handler.setFormatter(formatter)
+file_handler = _file_handler(log_file('api'))
 
 # Error handler for error logs only
-error_handler = logging.FileHandler(
-    log_dir / f'error_{datetime.now().strftime("%Y%m%d")}.log'
-)
-error_handler.setFormatter(formatter)
+error_handler = _file_handler(log_file('error'))
 error_handler.setLevel(logging.ERROR)
 
+# The request path only enqueues; the listener thread formats and writes
+log_queue = queue.SimpleQueue()
+queue_handler = _QueueHandler(log_queue)
+queue_handler.addFilter(context_filter)
+listener = logging.handlers.QueueListener(
+    log_queue, file_handler, error_handler, respect_handler_level=True
+)
+
+def start_logging():
+    """Start the background writer; safe to call more than once"""
+    if config.LOG_ASYNC and listener._thread is None:
+        listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    if listener._thread is not None:
+        listener.stop()
+
+atexit.register(stop_logging)
+
 def get_logger(name: str) -> logging.Logger:
     """Get a logger with the specified name"""
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     # Add handlers if they haven't been added already
     if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(error_handler)
-    
+        if config.LOG_ASYNC:
+            start_logging()
+            logger.addHandler(queue_handler)
+        else:
+            logger.addHandler(file_handler)
+            logger.addHandler(error_handler)
+
     return logger
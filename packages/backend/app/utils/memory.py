@@ -0,0 +1,66 @@
+import os
+import resource
+import sys
+from pathlib import Path
+
+# Fields of /proc/<pid>/smaps_rollup worth reporting, in kB
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def process_memory(pid="self") -> dict:
+    """
+    Resident memory of a process in MiB.
+
+    PSS splits each shared page between the processes mapping it, so summing
+    PSS over all workers gives their real combined footprint. Falls back to
+    peak RSS from getrusage where /proc is unavailable.
+    """
+    rollup = Path(f"/proc/{pid}/smaps_rollup")
+    if rollup.exists():
+        values = {}
+        for line in rollup.read_text().splitlines():
+            key, _, rest = line.partition(":")
+            if key in _SMAPS_FIELDS:
+                values[key.lower()] = int(rest.split()[0]) / 1024
+        values["pid"] = os.getpid() if pid == "self" else int(pid)
+        return values
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"pid": os.getpid(), "max_rss": max_rss / scale}
+
+
+def descendant_pids(pid: int) -> list:
+    """All child processes of pid, e.g. the uvicorn workers of serve.py"""
+    pids = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        children = task / "children"
+        if children.exists():
+            for child in map(int, children.read_text().split()):
+                pids.append(child)
+                pids.extend(descendant_pids(child))
+    return pids
+
+
+def report(pids) -> str:
+    lines = [f"{'pid':>8s} {'rss MiB':>9s} {'pss MiB':>9s} {'shared MiB':>11s} {'private MiB':>12s}"]
+    totals = {"rss": 0.0, "pss": 0.0}
+    for pid in pids:
+        memory = process_memory(pid)
+        shared = memory.get("shared_clean", 0) + memory.get("shared_dirty", 0)
+        private = memory.get("private_clean", 0) + memory.get("private_dirty", 0)
+        totals["rss"] += memory.get("rss", 0)
+        totals["pss"] += memory.get("pss", 0)
+        lines.append(
+            f"{pid:>8d} {memory.get('rss', 0):9.1f} {memory.get('pss', 0):9.1f} {shared:11.1f} {private:12.1f}"
+        )
+    lines.append(f"{'total':>8s} {totals['rss']:9.1f} {totals['pss']:9.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Per-worker RSS/PSS of a serve.py launcher and its workers:
+    #   python -m app.utils.memory <launcher pid>
+    parent = int(sys.argv[1])
+    print(report([parent] + descendant_pids(parent)))
@@ -0,0 +1,181 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Histograms and counters are cheap enough to leave on: an observation is a
+bisect over the bucket bounds and two additions under a lock (~1 us).
+Values owned by other components (queue depths, cache statistics, model
+load time) are registered as callbacks and read only when /metrics is
+scraped.
+"""
+import bisect
+import functools
+import threading
+import time
+
+# Seconds; from sub-millisecond postprocessing up to slow cold requests
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), then sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                label_text = _format_labels(self.labelnames, labels, ("le", bound))
+                yield f"{self.name}_bucket{label_text} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class CallbackMetric:
+    """Gauge or counter whose samples come from fn() at scrape time, as {labels_tuple: value}"""
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        try:
+            samples = self.fn()
+        except Exception:
+            # A broken callback must not take /metrics down with it
+            return
+        for labels, value in sorted(samples.items()):
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # Re-registering (e.g. a module reloaded in tests) replaces the old metric
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def callback(self, name, documentation, fn, labelnames=(), kind="gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, fn, labelnames, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "pet_health_stage_seconds", "Time spent in each stage of the analysis pipeline", ("stage",)
+)
+BATCH_SIZE = REGISTRY.histogram(
+    "pet_health_inference_batch_size", "Images per backbone batch", buckets=BATCH_SIZE_BUCKETS
+)
+
+
+class stage_timer:
+    """Record the duration of the with-block under stage"""
+
+    # A plain class rather than @contextmanager: half the overhead per block
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
+
+
+def timed(stage: str):
+    """Decorator form of stage_timer"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+        return wrapper
+    return decorator
@@ -0,0 +1,126 @@
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Hashable, Optional
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    Recent analyses indexed by perceptual hash, per pet.
+
+    Uses multi-index hashing: each 64-bit hash is split into ``num_blocks``
+    chunks and every chunk is a key into the pet's table, tagged with its
+    block number so one dict per pet serves all blocks. Two hashes within
+    ``max_distance`` bits must agree to within ``max_distance // num_blocks``
+    bits on at least one chunk, so a lookup only probes those neighbouring
+    chunk values and verifies the few candidates it finds. Entries expire
+    after ``ttl_seconds`` and the oldest are evicted past ``max_entries``.
+    """
+
+    def __init__(self, max_distance: int = 6, ttl_seconds: float = 600,
+                 max_entries: int = 100000, hash_bits: int = 64, num_blocks: int = 4):
+        if hash_bits % num_blocks:
+            raise ValueError("hash_bits must be divisible by num_blocks")
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.num_blocks = num_blocks
+        self.block_bits = hash_bits // num_blocks
+        self._block_mask = (1 << self.block_bits) - 1
+        self._probes = self._probe_masks(self.block_bits, max_distance // num_blocks)
+        self._tables = {}
+        self._entries = {}
+        self._order = deque()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, pet_id: Hashable, phash: int, value, now: Optional[float] = None):
+        """Record the result of analysing an image with hash phash"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (pet_id, phash, now + self.ttl_seconds, value)
+            self._order.append(entry_id)
+            table = self._tables.setdefault(pet_id, {})
+            for key in self._keys(phash):
+                table.setdefault(key, []).append(entry_id)
+            self._evict(now)
+
+    def find(self, pet_id: Hashable, phash: int, now: Optional[float] = None):
+        """Return the value of the closest live entry within max_distance, or None"""
+        now = time.time() if now is None else now
+        best_value = None
+        best_distance = self.max_distance + 1
+        with self._lock:
+            table = self._tables.get(pet_id, {})
+            seen = set()
+            for key in self._keys(phash):
+                for probe in self._probes:
+                    for entry_id in table.get(key ^ probe, ()):
+                        if entry_id in seen:
+                            continue
+                        seen.add(entry_id)
+                        _, other, expires_at, value = self._entries[entry_id]
+                        if expires_at <= now:
+                            continue
+                        distance = hamming_distance(phash, other)
+                        if distance < best_distance:
+                            best_distance = distance
+                            best_value = value
+
+            if best_value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best_value
+
+    def _keys(self, phash: int):
+        # Chunk value in the low bits, block number above it
+        return [
+            (block << self.block_bits) | ((phash >> (block * self.block_bits)) & self._block_mask)
+            for block in range(self.num_blocks)
+        ]
+
+    @staticmethod
+    def _probe_masks(bits: int, radius: int) -> list:
+        """XOR masks for every chunk value within radius bits of a chunk"""
+        masks = []
+        for distance in range(radius + 1):
+            for positions in itertools.combinations(range(bits), distance):
+                mask = 0
+                for position in positions:
+                    mask |= 1 << position
+                masks.append(mask)
+        return masks
+
+    def _evict(self, now: float):
+        # Entries are appended in time order, so expired ones sit at the front
+        while self._order:
+            entry_id = self._order[0]
+            expires_at = self._entries[entry_id][2]
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._order.popleft()
+            self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        pet_id, phash, _, _ = self._entries.pop(entry_id)
+        table = self._tables[pet_id]
+        for key in self._keys(phash):
+            ids = table[key]
+            ids.remove(entry_id)
+            if not ids:
+                del table[key]
+        if not table:
+            del self._tables[pet_id]
@@ -0,0 +1,85 @@
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.utils.ann_index import IVFPQIndex
+from app.utils.embedding_store import EmbeddingStore
+
+
+class SimilarCases:
+    """
+    Nearest previously analyzed cases for an embedding.
+
+    An IVF-PQ index over the embeddings in the history store, keyed by
+    store row number, so a hit is read back from the store (outcome,
+    timestamp, pet) and re-ranked on its exact embedding without any
+    inference. The index holds one embedding space (model version and
+    stage); when that changes it is rebuilt from the store's records in
+    the new space. On open, rows appended since the index was last saved
+    are added from the store, so saving is only a startup shortcut.
+    """
+
+    def __init__(self, store: EmbeddingStore, path, nlist: int = 1024, m: int = 32,
+                 nprobe: int = 64, refine_factor: int = 8, save_every: int = 10000):
+        self.store = store
+        self.path = Path(path)
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.refine_factor = refine_factor
+        self.save_every = save_every
+        self.index: Optional[IVFPQIndex] = None
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+    def open(self, space: str, dim: int) -> IVFPQIndex:
+        """The index for space, loaded from disk or rebuilt, and caught up with the store"""
+        with self._lock:
+            if self.index is not None and self.index.space == space:
+                return self.index
+            index = None
+            if (self.path / "meta.json").exists():
+                index = IVFPQIndex.load(self.path)
+                if index.space != space or index.dim != dim:
+                    index = None
+                else:
+                    index.nprobe = self.nprobe
+            if index is None:
+                index = IVFPQIndex(dim, self.nlist, self.m, self.nprobe, space=space)
+            for ids, records in self.store.scan(index.max_id + 1, space=space):
+                index.add(records["embedding"][:, :dim], ids)
+                self._unsaved += len(ids)
+            self.index = index
+            return index
+
+    def add(self, case_id: int, embedding, space: str):
+        """Index a case the store has just recorded under case_id"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        index = self.open(space, embedding.size)
+        # Opening may already have caught up with this row from the store
+        if case_id > index.max_id:
+            index.add(embedding, [case_id])
+            self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def search(self, embedding, space: str, k: int = 10, nprobe: Optional[int] = None):
+        """(case ids, cosine distances, store records) of the k nearest cases, nearest first"""
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        index = self.open(space, embedding.size)
+        dim = embedding.size
+        distances, ids = index.search(
+            embedding, k, nprobe,
+            refine=lambda candidates: self.store.rows(candidates)["embedding"][:, :dim],
+            refine_factor=self.refine_factor,
+        )
+        found = ids[0] >= 0
+        ids, distances = ids[0][found], distances[0][found]
+        return ids, distances, self.store.rows(ids)
+
+    def save(self):
+        if self.index is not None:
+            self.index.save(self.path)
+            self._unsaved = 0
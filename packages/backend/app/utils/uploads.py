@@ -0,0 +1,130 @@
+import io
+import warnings
+from typing import Iterable, Optional
+
+from PIL import Image
+
+from app.utils.image_processing import header_issues, is_zip_archive
+
+# Uploads are read this many bytes at a time
+CHUNK_SIZE = 64 * 1024
+# JPEG metadata (EXIF thumbnail, ICC profile, XMP) sits before the frame header
+MAX_HEADER_BYTES = 512 * 1024
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before it is decoded"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ImageHeaderParser:
+    """
+    Incremental image header parser.
+
+    Bytes are fed as they arrive and the header is parsed once enough of them
+    are buffered. Only the header is read: unlike ``PIL.ImageFile.Parser`` no
+    decoder is set up and no pixel buffer is allocated, so a small file that
+    declares huge dimensions costs nothing. At most ``MAX_HEADER_BYTES`` are
+    buffered while looking for the header.
+    """
+
+    def __init__(self, max_pixels: int, allowed_formats: Optional[Iterable[str]] = None):
+        self.max_pixels = max_pixels
+        self.allowed_formats = set(allowed_formats) if allowed_formats else None
+        self.format = None
+        self.size = None
+        self.mode = None
+        self._buffer = bytearray()
+
+    @property
+    def done(self) -> bool:
+        return self.format is not None
+
+    def feed(self, data: bytes) -> bool:
+        """Add data; returns True once the header has been parsed"""
+        if self.done:
+            return True
+        self._buffer += data[:MAX_HEADER_BYTES - len(self._buffer)]
+        try:
+            with warnings.catch_warnings():
+                # Oversized images are rejected below with our own limit
+                warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                with Image.open(io.BytesIO(self._buffer)) as image:
+                    self.format, self.size, self.mode = image.format, image.size, image.mode
+        except Image.DecompressionBombError:
+            raise UploadRejected(413, "Image dimensions too large")
+        except (OSError, SyntaxError, ValueError):
+            # Not enough data yet, or not an image at all
+            if len(self._buffer) >= MAX_HEADER_BYTES:
+                self.close()
+            return False
+
+        self._buffer = bytearray()
+        self._check()
+        return True
+
+    def close(self):
+        """Signal end of data; raises if no header was ever found"""
+        if not self.done:
+            raise UploadRejected(400, "Unsupported or corrupt image file")
+
+    def issues(self) -> list:
+        return header_issues(self.size, self.mode)
+
+    def _check(self):
+        if self.allowed_formats is not None and self.format not in self.allowed_formats:
+            raise UploadRejected(415, f"Image format {self.format} not supported")
+        width, height = self.size
+        if width * height > self.max_pixels:
+            raise UploadRejected(413, "Image dimensions too large")
+
+
+def check_image_header(contents: bytes, max_pixels: int, allowed_formats=None) -> list:
+    """Header checks for bytes already in memory, e.g. zip members; returns issues"""
+    parser = ImageHeaderParser(max_pixels, allowed_formats)
+    parser.feed(contents)
+    parser.close()
+    return parser.issues()
+
+
+async def read_upload(upload, max_bytes: int, max_pixels: int, allowed_formats=None,
+                      max_archive_bytes: Optional[int] = None, chunk_size: int = CHUNK_SIZE):
+    """
+    Read an UploadFile in chunks, validating the image header on the way.
+
+    Never holds more than max_bytes of the upload (max_archive_bytes for zip
+    archives, which are only accepted when max_archive_bytes is given).
+    Returns (contents, issues): when the header alone shows issues, reading
+    stops early and contents is None. Raises UploadRejected for uploads that
+    are too large, too many pixels, of a disallowed format or not an image.
+    """
+    parser = ImageHeaderParser(max_pixels, allowed_formats)
+    limit = max_bytes
+    archive = False
+    contents = bytearray()
+
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        if len(contents) + len(chunk) > limit:
+            raise UploadRejected(413, f"Upload too large, at most {limit} bytes")
+        contents += chunk
+
+        if archive or parser.done:
+            continue
+        if max_archive_bytes is not None and len(contents) >= 4 and is_zip_archive(contents):
+            archive = True
+            limit = max_archive_bytes
+        elif parser.feed(chunk):
+            issues = parser.issues()
+            if issues:
+                return None, issues
+
+    if not archive:
+        parser.close()
+    return bytes(contents), []
@@ -0,0 +1,92 @@
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+
+class ServerBusy(Exception):
+    """Raised when the admission queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Admission:
+    def __init__(self, pool: "WorkerPool"):
+        self._pool = pool
+        self._released = False
+
+    def release(self):
+        """Free the slot; safe to call more than once"""
+        if not self._released:
+            self._released = True
+            self._pool._pending -= 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class WorkerPool:
+    """
+    Thread or process pool for CPU-bound request stages.
+
+    ``admit()`` bounds how many requests may be in flight at once, so the
+    server sheds load with ``ServerBusy`` instead of queueing without limit.
+    Admission is tracked on the event loop thread and needs no locking.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: Optional[int] = None,
+        max_pending: int = 32,
+        retry_after: int = 1,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown worker pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._pending = 0
+        self._executor = None
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def executor(self):
+        # Created lazily so importing the app never forks worker processes
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="cpu-worker"
+                )
+        return self._executor
+
+    def admit(self) -> _Admission:
+        """Reserve a slot for a request, raising ServerBusy when full"""
+        if self._pending >= self.max_pending:
+            raise ServerBusy(self.retry_after)
+        self._pending += 1
+        return _Admission(self)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn on the pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
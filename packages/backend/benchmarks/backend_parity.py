@@ -0,0 +1,122 @@
+"""
+Accuracy parity and latency of the inference backends against eager fp32.
+
+Runs every backend on a fixed image set and compares health status and
+detected conditions with the eager fp32 reference. Exits non-zero when
+agreement drops below --min-agreement. Refuses to run without trained
+weights: an untrained backbone gives near-identical outputs for every image,
+which any backend "agrees" with.
+
+Run from packages/backend:
+    python -m benchmarks.backend_parity [--images DIR] [--backends eager torchscript int8]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.models.backends import INFERENCE_BACKENDS, configure_threads, synthetic_calibration_images
+from app.models.model_loader import PetHealthModelLoader
+from app.utils.image_processing import decode_image, preprocess_image
+
+
+def load_image_set(directory, count):
+    """Photos from directory, or a fixed synthetic set plus the API test image"""
+    if directory:
+        paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        return [preprocess_image(decode_image(p.read_bytes())) for p in paths[:count]]
+    images = synthetic_calibration_images(count=count - 1, seed=1234)
+    test_image = Path(__file__).parent.parent / "tests" / "test_data" / "images" / "test_pet.jpg"
+    images.append(preprocess_image(Image.open(test_image)))
+    return images
+
+
+def run_backend(predictor, images, analysis_types, batch_size):
+    features = np.concatenate([
+        predictor.extract_features_batch(images[i:i + batch_size]).cpu().numpy()
+        for i in range(0, len(images), batch_size)
+    ])
+    results = {
+        analysis_type: predictor.predict_from_features(torch.from_numpy(features), analysis_type)
+        for analysis_type in analysis_types
+    }
+    return features, results
+
+
+def time_backend(predictor, images, batch_size, repeats):
+    batch = images[:batch_size]
+    predictor.extract_features_batch(batch)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predictor.extract_features_batch(batch)
+    return (time.perf_counter() - start) / (repeats * len(batch)) * 1000
+
+
+def compare(reference, candidate):
+    status_agree, condition_agree, confidence_diffs = [], [], []
+    for ref_results, cand_results in zip(reference.values(), candidate.values()):
+        for ref, cand in zip(ref_results, cand_results):
+            status_agree.append(ref["health_status"] == cand["health_status"])
+            confidence_diffs.append(abs(ref["confidence"] - cand["confidence"]))
+            condition_agree.append(
+                {c["condition"] for c in ref["conditions_detected"]}
+                == {c["condition"] for c in cand["conditions_detected"]}
+            )
+    return float(np.mean(status_agree)), float(np.mean(condition_agree)), float(np.mean(confidence_diffs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="directory of photos; a fixed synthetic set is used otherwise")
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--backends", nargs="+", default=list(INFERENCE_BACKENDS), choices=INFERENCE_BACKENDS)
+    parser.add_argument("--model-dir", help="directory with pet_health_model.pt or .pth")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    loader = PetHealthModelLoader(model_dir=args.model_dir)
+    predictor = loader.predictor
+    if predictor is None:
+        sys.exit("Model failed to load")
+    if loader.active.source is None or loader.model_version == "untrained":
+        sys.exit(f"No trained weights in {loader.model_dir}; parity on an untrained model is meaningless")
+    images = load_image_set(args.images, args.count)
+    analysis_types = ("general", "skin", "eyes", "ears", "mouth")
+    print(f"Model {loader.model_version}, {len(images)} images, batch size {args.batch_size}")
+
+    # Reference: eager fp32 in the default contiguous layout
+    predictor.set_backend("eager", channels_last=False)
+    ref_features, reference = run_backend(predictor, images, analysis_types, args.batch_size)
+    spread = float(np.abs(ref_features - ref_features.mean(axis=0)).mean() / (np.abs(ref_features).mean() + 1e-12))
+    if spread < 1e-3:
+        sys.exit(f"Features barely depend on the image (relative spread {spread:.1e}); is the model trained?")
+    ref_ms = {bs: time_backend(predictor, images, bs, args.repeats) for bs in (1, args.batch_size)}
+    print(f"{'backend':12s} {'ms/img bs1':>10s} {'ms/img bsN':>10s} {'speedup':>8s} "
+          f"{'status':>7s} {'conds':>7s} {'|dconf|':>8s} {'feat err':>9s}")
+    print(f"{'fp32 ref':12s} {ref_ms[1]:10.2f} {ref_ms[args.batch_size]:10.2f} {1.0:8.2f}")
+
+    failed = False
+    for name in args.backends:
+        predictor.set_backend(name)
+        features, results = run_backend(predictor, images, analysis_types, args.batch_size)
+        ms = {bs: time_backend(predictor, images, bs, args.repeats) for bs in (1, args.batch_size)}
+        status, conditions, confidence = compare(reference, results)
+        feature_error = float(np.abs(features - ref_features).mean() / (np.abs(ref_features).mean() + 1e-12))
+        print(f"{name:12s} {ms[1]:10.2f} {ms[args.batch_size]:10.2f} "
+              f"{ref_ms[args.batch_size] / ms[args.batch_size]:8.2f} "
+              f"{status:7.1%} {conditions:7.1%} {confidence:8.4f} {feature_error:9.4f}")
+        failed |= min(status, conditions) < args.min_agreement
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Recall and query latency of the IVF-PQ similar-case index against brute force.
+
+Builds the index incrementally over --count synthetic embeddings (clustered,
+with low-rank variation, like pooled backbone features), keeping the raw
+vectors in a memory-mapped scratch file that serves as both the brute-force
+baseline and the re-ranking source. For each --nprobe it reports recall@k
+with and without exact re-ranking, and query latency percentiles; brute-force
+latency over the same vectors is shown for comparison. Exits non-zero when
+refined recall at the default nprobe falls below --min-recall.
+
+Run from packages/backend (the default 1M x 1280 run needs ~5 GB of scratch disk):
+    python -m benchmarks.bench_ann_index [--count 1000000] [--dim 1280] [--nprobe 16 64 128]
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.ann_index import IVFPQIndex
+
+BLOCK = 50000
+
+
+def write_vectors(path, count, dim, clusters, seed=0):
+    """Unit vectors around cluster centres, with variation along a few shared directions"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    basis = rng.normal(size=(16, dim)).astype(np.float32)
+    vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, BLOCK):
+        n = min(BLOCK, count - start)
+        block = centres[rng.integers(0, clusters, n)]
+        block += 0.15 * rng.normal(size=(n, 16)).astype(np.float32) @ basis
+        block += 0.05 * rng.standard_normal((n, dim), dtype=np.float32)
+        vectors[start:start + n] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    vectors.flush()
+    return vectors
+
+
+def brute_force(vectors, queries, k):
+    """Exact top-k by cosine similarity, one block of the database at a time"""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(vectors), BLOCK):
+        scores = queries @ vectors[start:start + BLOCK].T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_ids = np.concatenate([best_ids, ids], axis=1)
+        top = np.argpartition(-merged_scores, k, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def query_latencies(index, queries, k, nprobe, refine=None, refine_factor=4):
+    found, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query, k, nprobe, refine=refine, refine_factor=refine_factor)
+        samples.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    return found, np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=1280, help="1280 for EfficientNet-B0 features")
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--m", type=int, default=32, help="sub-vectors (bytes) per code")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[16, 64, 128])
+    parser.add_argument("--default-nprobe", type=int, default=64, help="nprobe the recall gate applies to")
+    parser.add_argument("--refine-factor", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--workdir", help="scratch directory (default: a temporary one)")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="ann-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    try:
+        start = time.perf_counter()
+        # One extra block of queries from the same distribution, kept out of the index
+        vectors = write_vectors(workdir / "vectors.npy", args.count + args.queries, args.dim, args.clusters)
+        queries = np.array(vectors[args.count:])
+        vectors = vectors[:args.count]
+        print(f"generated {args.count} x {args.dim} vectors in {time.perf_counter() - start:.1f}s")
+
+        truth = brute_force(vectors, queries, args.k)
+        # A linear scan per query, as a request would run it
+        start = time.perf_counter()
+        for query in queries[:3]:
+            brute_force(vectors, query[None], args.k)
+        brute_ms = (time.perf_counter() - start) / 3 * 1000
+        print(f"brute force: {brute_ms:.1f} ms/query")
+
+        index = IVFPQIndex(args.dim, nlist=args.nlist, m=args.m)
+        start = time.perf_counter()
+        for begin in range(0, args.count, BLOCK):
+            block = np.asarray(vectors[begin:begin + BLOCK])
+            index.add(block, np.arange(begin, begin + len(block)))
+        # Trains on what was added if add() didn't reach train_size, else waits for its training
+        index.train()
+        build = time.perf_counter() - start
+        print(f"built index in {build:.1f}s ({args.count / build:.0f} vectors/s incl. training), "
+              f"{args.count * args.m / 2 ** 20:.0f} MiB of codes vs {vectors.nbytes / 2 ** 20:.0f} MiB raw")
+
+        start = time.perf_counter()
+        index.save(workdir / "index")
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        index = IVFPQIndex.load(workdir / "index")
+        print(f"saved in {saved:.2f}s, memory-mapped load in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        print(f"{'nprobe':>6s} {'recall@' + str(args.k):>10s} {'p50 ms':>8s} {'p99 ms':>8s}"
+              f" {'refined':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'speedup':>8s}")
+        gate_recall = None
+        for nprobe in args.nprobe:
+            found, p50, p99 = query_latencies(index, queries, args.k, nprobe)
+            # Re-rank on the raw vectors, read from the memory-mapped file like the history store
+            refined, refined_p50, refined_p99 = query_latencies(
+                index, queries, args.k, nprobe, refine=lambda ids: vectors[ids], refine_factor=args.refine_factor
+            )
+            refined_recall = recall(refined, truth)
+            print(f"{nprobe:6d} {recall(found, truth):10.3f} {p50:8.2f} {p99:8.2f}"
+                  f" {refined_recall:8.3f} {refined_p50:8.2f} {refined_p99:8.2f} {brute_ms / refined_p50:7.0f}x")
+            if nprobe == args.default_nprobe:
+                gate_recall = refined_recall
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if gate_recall is not None and gate_recall < args.min_recall:
+        print(f"FAIL: refined recall {gate_recall:.3f} at nprobe {args.default_nprobe} below {args.min_recall}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
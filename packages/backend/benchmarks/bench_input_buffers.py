@@ -0,0 +1,60 @@
+"""
+Resident memory and latency of /analyze over a long run, with pooled model inputs.
+
+Drives /analyze in-process over ASGI for --rounds rounds of --requests
+requests each at --concurrency, with the result and feature caches off so
+every request decodes its image and runs the model, and prints RSS, p50/p99
+latency and the input buffer pool's state after each round. RSS should
+level off after the first rounds; --input-buffers 0 turns the pool off for
+comparison.
+
+Run from packages/backend:
+    python -m benchmarks.bench_input_buffers [--rounds 10] [--requests 200] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+
+import numpy as np
+
+from benchmarks.suite import _load, _multipart, make_pet_photo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests per round")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--images", type=int, default=64, help="distinct photos sent in turn")
+    parser.add_argument("--input-buffers", type=int, help="pool size (default: PET_HEALTH_INPUT_BUFFERS)")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    # Before the app reads its configuration
+    os.environ.update({
+        "PET_HEALTH_CACHE_MAX_ENTRIES": "0",
+        "PET_HEALTH_FEATURE_CACHE_MAX_ENTRIES": "0",
+        "PET_HEALTH_NEAR_DUPLICATE_ENABLED": "false",
+        "PET_HEALTH_INFERENCE_THREADS": str(args.threads),
+    })
+    if args.input_buffers is not None:
+        os.environ["PET_HEALTH_INPUT_BUFFERS"] = str(args.input_buffers)
+    from app.routers.health_analysis import input_buffers, model_loader
+    from app.utils.memory import process_memory
+    from main import app
+
+    model_loader.startup()
+    photos = [_multipart(make_pet_photo(640, 480, seed)) for seed in range(args.images)]
+    print(f"{input_buffers.size} pooled input buffers; RSS {process_memory()['rss']:.0f} MiB after loading the model")
+    for round_number in range(1, args.rounds + 1):
+        requests = [photos[i % len(photos)] for i in range(args.requests)]
+        latencies, errors, wall = asyncio.run(_load(app, requests, args.concurrency))
+        stats = input_buffers.stats()
+        print(f"  round {round_number:3d}: RSS {process_memory()['rss']:7.1f} MiB, "
+              f"p50 {np.percentile(latencies, 50):6.1f} ms, p99 {np.percentile(latencies, 99):6.1f} ms, "
+              f"{len(latencies) / wall:5.1f} req/s, {errors} errors, "
+              f"buffers in use {stats['in_use']}, misses {stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
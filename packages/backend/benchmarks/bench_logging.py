@@ -0,0 +1,82 @@
+"""
+Cost of a log call on the request path: direct file handlers vs the queue.
+
+Run from packages/backend:
+    python -m benchmarks.bench_logging [--records 20000] [--threads 8]
+"""
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from app.utils import logging as app_logging
+
+
+def time_calls(logger, records, threads):
+    """Per-call latency samples from concurrent callers"""
+    samples = []
+    lock = threading.Lock()
+
+    def caller(count):
+        local = []
+        for i in range(count):
+            start = time.perf_counter()
+            logger.info(
+                f"Analysis completed successfully - Health Status: healthy ({i})",
+                extra={"stages": {"decode_ms": 1.2, "inference_ms": 35.0, "heads_ms": 0.4}}
+            )
+            local.append(time.perf_counter() - start)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=caller, args=(records // threads,)) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sorted(samples), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    app_logging.set_request_context("bench", "pet-1")
+    with tempfile.TemporaryDirectory() as directory:
+        sync_handler = logging.FileHandler(Path(directory) / "sync.log")
+        sync_handler.setFormatter(app_logging.formatter)
+        sync_handler.addFilter(app_logging.context_filter)
+        direct = logging.getLogger("bench.direct")
+        direct.addHandler(sync_handler)
+        direct.setLevel(logging.INFO)
+        direct.propagate = False
+
+        queued = logging.getLogger("bench.queued")
+        queued.addHandler(app_logging.queue_handler)
+        queued.setLevel(logging.INFO)
+        queued.propagate = False
+        # Point the listener at the temporary directory
+        queued_file = logging.FileHandler(Path(directory) / "queued.log")
+        queued_file.setFormatter(app_logging.formatter)
+        app_logging.listener.handlers = (queued_file,)
+        app_logging.start_logging()
+
+        print(f"{args.records} records from {args.threads} threads, format {type(app_logging.formatter).__name__}")
+        for name, logger in (("file handler", direct), ("queue handler", queued)):
+            samples, wall = time_calls(logger, args.records, args.threads)
+            p50 = samples[len(samples) // 2] * 1e6
+            p99 = samples[int(len(samples) * 0.99)] * 1e6
+            print(f"  {name:14s} p50 {p50:7.2f} us  p99 {p99:8.2f} us  wall {wall:6.2f} s")
+
+        flush_start = time.perf_counter()
+        app_logging.stop_logging()
+        print(f"  listener drained the backlog in {time.perf_counter() - flush_start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Lookup cost of the near-duplicate index at 1M entries.
+
+Run from packages/backend:
+    python -m benchmarks.bench_near_duplicates [--entries 1000000]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.utils.near_duplicates import NearDuplicateIndex
+
+
+def flip_bits(phash: int, count: int, rng: random.Random) -> int:
+    for position in rng.sample(range(64), count):
+        phash ^= 1 << position
+    return phash
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(entries: int, pets: int, lookups: int, max_distance: int, seed: int = 0):
+    rng = random.Random(seed)
+    index = NearDuplicateIndex(max_distance=max_distance, max_entries=entries, ttl_seconds=3600)
+    hashes = [(rng.randrange(pets), rng.getrandbits(64)) for _ in range(entries)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for pet_id, phash in hashes:
+        index.add(pet_id, phash, None)
+    insert_seconds = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    def time_lookups(queries):
+        samples = []
+        for pet_id, phash in queries:
+            start = time.perf_counter()
+            index.find(pet_id, phash)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    near = [
+        (pet_id, flip_bits(phash, rng.randint(0, max_distance), rng))
+        for pet_id, phash in rng.sample(hashes, lookups)
+    ]
+    unseen = [(rng.randrange(pets), rng.getrandbits(64)) for _ in range(lookups)]
+    hit_samples = time_lookups(near)
+    miss_samples = time_lookups(unseen)
+
+    print(f"{entries} entries over {pets} pets, max distance {max_distance}")
+    print(f"  insert:       {insert_seconds / entries * 1e6:8.2f} us/entry")
+    print(f"  index memory: {memory / 2**20:8.1f} MiB")
+    for name, samples in (("near-dup hit", hit_samples), ("miss", miss_samples)):
+        print(
+            f"  {name:12s}  p50 {percentile(samples, 0.5) * 1e6:8.2f} us"
+            f"  p99 {percentile(samples, 0.99) * 1e6:8.2f} us"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+
+    # Typical: many pets with a short history each. Worst case: one pet owns every entry.
+    for pets in (args.entries // 10, 1):
+        run(args.entries, pets, args.lookups, args.max_distance)
+
+
+if __name__ == "__main__":
+    main()
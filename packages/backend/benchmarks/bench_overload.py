@@ -0,0 +1,113 @@
+"""
+Goodput of the inference batcher under overload, with and without deadline shedding.
+
+Measures the batcher's capacity on a synthetic batch function with the
+cost shape of the model (fixed per-batch overhead plus a per-item cost),
+then offers Poisson traffic at --load times that capacity, every request
+carrying a --deadline-ms budget and a priority drawn from --mix. Goodput
+counts only responses that arrived within their deadline; without
+shedding the queue grows without bound and almost every response is late.
+
+Run from packages/backend:
+    python -m benchmarks.bench_overload [--load 2.0] [--deadline-ms 500] [--seconds 10]
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import numpy as np
+
+from app.models.batching import PRIORITIES, DeadlineExceeded, InferenceBatcher
+
+
+def make_batch_fn(overhead_ms, item_ms):
+    def batch_fn(items):
+        time.sleep((overhead_ms + item_ms * len(items)) / 1000)
+        return items
+    return batch_fn
+
+
+async def capacity(batch_fn, batch_size, seconds=2.0):
+    """Requests/s with the batcher kept full"""
+    batcher = InferenceBatcher(batch_fn, max_batch_size=batch_size)
+    loop = asyncio.get_running_loop()
+    done = 0
+    stop = loop.time() + seconds
+
+    async def client():
+        nonlocal done
+        while loop.time() < stop:
+            await batcher.submit(0)
+            done += 1
+
+    start = loop.time()
+    await asyncio.gather(*(client() for _ in range(batch_size * 2)))
+    rate = done / (loop.time() - start)
+    await batcher.close()
+    return rate
+
+
+async def overload(batch_fn, batch_size, rate, seconds, deadline, mix, shed, seed=0):
+    """Per-priority counts of on-time, late and shed requests for Poisson arrivals at rate"""
+    rng = np.random.default_rng(seed)
+    batcher = InferenceBatcher(batch_fn, max_batch_size=batch_size, shed=shed)
+    loop = asyncio.get_running_loop()
+    outcomes = Counter()
+    names = list(mix)
+    weights = np.array([mix[name] for name in names], dtype=float)
+    weights /= weights.sum()
+
+    async def request(priority):
+        submitted = loop.time()
+        try:
+            await batcher.submit(0, PRIORITIES[priority], submitted + deadline)
+        except DeadlineExceeded:
+            outcomes[priority, "shed"] += 1
+            return
+        outcomes[priority, "on time" if loop.time() <= submitted + deadline else "late"] += 1
+
+    tasks = []
+    start = loop.time()
+    arrival = start
+    while arrival < start + seconds:
+        arrival += rng.exponential(1 / rate)
+        await asyncio.sleep(max(0.0, arrival - loop.time()))
+        tasks.append(asyncio.ensure_future(request(rng.choice(names, p=weights))))
+    await asyncio.gather(*tasks)
+    await batcher.close()
+    return outcomes, len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--load", type=float, default=2.0, help="offered load as a multiple of capacity")
+    parser.add_argument("--deadline-ms", type=float, default=500)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--overhead-ms", type=float, default=20, help="fixed cost of a batch")
+    parser.add_argument("--item-ms", type=float, default=10, help="cost of each item in a batch")
+    parser.add_argument("--mix", default="high=0.2,normal=0.6,low=0.2", help="share of each priority")
+    args = parser.parse_args()
+
+    mix = {name: float(share) for name, share in (part.split("=") for part in args.mix.split(","))}
+    batch_fn = make_batch_fn(args.overhead_ms, args.item_ms)
+    rate = asyncio.run(capacity(batch_fn, args.batch_size))
+    offered = rate * args.load
+    print(f"Capacity {rate:.1f} req/s; offering {offered:.1f} req/s ({args.load:.1f}x) "
+          f"for {args.seconds:.0f} s with a {args.deadline_ms:.0f} ms deadline")
+
+    for shed in (False, True):
+        outcomes, total = asyncio.run(overload(
+            batch_fn, args.batch_size, offered, args.seconds, args.deadline_ms / 1000, mix, shed
+        ))
+        on_time = sum(count for (_, outcome), count in outcomes.items() if outcome == "on time")
+        print(f"  shedding {'on ' if shed else 'off'}: goodput {on_time / args.seconds:6.1f} req/s "
+              f"({on_time / args.seconds / rate:4.0%} of capacity), {total} offered")
+        for priority in sorted(mix, key=PRIORITIES.get):
+            counts = {outcome: outcomes[priority, outcome] for outcome in ("on time", "late", "shed")}
+            print(f"    {priority:6s} " + "  ".join(f"{outcome} {count:5d}" for outcome, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
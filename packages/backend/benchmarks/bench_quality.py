@@ -0,0 +1,74 @@
+"""
+Per-image cost of the quality gate at different upload resolutions.
+
+The gate scores the model-sized image, so its cost is flat in the upload
+size; the full-resolution brightness check it replaced is shown for
+comparison. Exits non-zero if the gate exceeds the budget at any size.
+
+Run from packages/backend:
+    python -m benchmarks.bench_quality [--budget-ms 1.0]
+"""
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from app.utils.image_processing import assess_quality, decode_image, preprocess_image
+
+SIZES = ((640, 480), (1920, 1080), (4032, 3024), (8000, 6000))
+
+
+def make_jpeg(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[:height, :width].astype(np.float32)
+    pixels = np.stack([
+        128 + 100 * np.sin(x / (width / 7) + phase) * np.cos(y / (height / 5))
+        for phase in rng.uniform(0, np.pi, 3)
+    ], axis=-1)
+    pixels += rng.normal(0, 6, pixels.shape)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def best_of(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples) * 1000, float(np.median(samples)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=1.0, help="per-image budget for the gate (median)")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'upload':>11s} {'gate min':>9s} {'gate p50':>9s} {'full-res mean':>14s}  (ms)")
+    over_budget = False
+    for width, height in SIZES:
+        contents = make_jpeg(width, height)
+        processed = preprocess_image(decode_image(contents))
+        full = Image.open(io.BytesIO(contents))
+        full.load()
+
+        gate_min, gate_median = best_of(lambda: assess_quality(processed), args.repeats)
+        # The check the gate replaced: a full-resolution array just for the mean
+        _, old_median = best_of(lambda: np.mean(np.array(full)), max(3, args.repeats // 20))
+
+        over_budget |= gate_median > args.budget_ms
+        print(f"{width:>5d}x{height:<5d} {gate_min:9.3f} {gate_median:9.3f} {old_median:14.2f}")
+
+    if over_budget:
+        print(f"FAIL: quality gate over the {args.budget_ms} ms budget")
+        sys.exit(1)
+    print(f"OK: quality gate within {args.budget_ms} ms at every size")
+
+
+if __name__ == "__main__":
+    main()
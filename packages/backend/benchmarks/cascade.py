@@ -0,0 +1,88 @@
+"""
+Agreement and CPU cost of the model cascade against the full model alone.
+
+Runs the full model on every image as the reference, then the cascade at
+each threshold, and reports the escalation rate, CPU time per image and
+how often the cascade's answer matches the full model's (health status and
+detected conditions). Exits non-zero when health status agreement at
+--threshold falls below --min-agreement.
+
+Run from packages/backend with the full and first-stage weights in
+--model-dir (pet_health_model.pt and pet_health_fast.pt):
+    python -m benchmarks.cascade [--images DIR] [--thresholds 0.6 0.7 0.8 0.9]
+"""
+import argparse
+import sys
+import time
+
+from app.models.backends import configure_threads
+from app.models.model_loader import PetHealthModelLoader
+from benchmarks.backend_parity import load_image_set
+
+
+def cpu_ms_per_image(fn, images, batch_size):
+    """CPU time (all threads) per image, plus the collected outputs"""
+    outputs = []
+    start = time.process_time()
+    for i in range(0, len(images), batch_size):
+        outputs.extend(fn(images[i:i + batch_size]))
+    return (time.process_time() - start) / len(images) * 1000, outputs
+
+
+def run(loader, images, batch_size, analysis_type):
+    cpu_ms, features = cpu_ms_per_image(loader.extract_features_batch, images, batch_size)
+    results = [loader.analyze_features(f, analysis_type) for f in features]
+    stages = [loader.answered_by(f) for f in features]
+    return cpu_ms, results, stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="directory of photos (default: synthetic set)")
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--model-dir")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--threshold", type=float, default=0.8, help="threshold the agreement gate applies to")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    parser.add_argument("--analysis-type", default="general")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    images = load_image_set(args.images, args.count)
+
+    full = PetHealthModelLoader(model_dir=args.model_dir)
+    full.warmup(1, args.batch_size)
+    reference_ms, reference, _ = run(full, images, args.batch_size, args.analysis_type)
+    print(f"full model only: {reference_ms:7.2f} ms CPU/image over {len(images)} images")
+    print(f"{'threshold':>9s} {'escalated':>9s} {'CPU ms/img':>10s} {'saving':>7s} {'status agree':>12s} {'cond agree':>10s}")
+
+    gate_agreement = None
+    for threshold in args.thresholds:
+        cascade = PetHealthModelLoader(model_dir=args.model_dir, cascade=True, cascade_threshold=threshold)
+        cascade.warmup(1, args.batch_size)
+        cpu_ms, results, stages = run(cascade, images, args.batch_size, args.analysis_type)
+
+        status_agree = sum(
+            r["health_status"] == e["health_status"] for r, e in zip(results, reference)
+        ) / len(images)
+        condition_agree = sum(
+            {c["condition"] for c in r["conditions_detected"]} == {c["condition"] for c in e["conditions_detected"]}
+            for r, e in zip(results, reference)
+        ) / len(images)
+        escalated = stages.count("full") / len(images)
+        print(
+            f"{threshold:9.2f} {escalated:9.1%} {cpu_ms:10.2f} {1 - cpu_ms / reference_ms:7.1%}"
+            f" {status_agree:12.1%} {condition_agree:10.1%}"
+        )
+        if threshold == args.threshold:
+            gate_agreement = status_agree
+
+    if gate_agreement is not None and gate_agreement < args.min_agreement:
+        print(f"FAIL: agreement {gate_agreement:.1%} at threshold {args.threshold} below {args.min_agreement:.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
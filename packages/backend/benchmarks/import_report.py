@@ -0,0 +1,95 @@
+"""
+Import time and memory of the API process before any model is loaded.
+
+Imports each target in a fresh interpreter with -X importtime and reports
+the wall time, resident memory afterwards, the packages that cost the most
+to import and which model frameworks got pulled in. With --load the model
+is then loaded as the startup hook would, to show what the selected
+framework adds. Exits non-zero when a target imports a module given by
+--forbid, by default every registered framework, since the API should only
+import its framework when the model loads.
+
+Run from packages/backend:
+    python -m benchmarks.import_report [--targets main,serve] [--load] [--forbid torch,tensorflow]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+
+from app.models.frameworks import FRAMEWORKS
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {target}
+seconds = time.perf_counter() - started
+from app.models import frameworks
+from app.utils.memory import process_memory
+result = {{"seconds": seconds, "rss_mib": process_memory().get("rss"), "modules": sorted(sys.modules)}}
+if {load}:
+    from app.routers.health_analysis import model_loader
+    started = time.perf_counter()
+    model_loader.ensure_loaded()
+    result["load_seconds"] = time.perf_counter() - started
+    result["loaded_rss_mib"] = process_memory().get("rss")
+result["frameworks"] = frameworks.import_report()
+print(json.dumps(result))
+"""
+
+
+def probe(target, load):
+    """Import target in a fresh interpreter; returns (result, import time per top-level package in s)"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(target=target, load=load)],
+        capture_output=True, text=True, env={**os.environ, "PYTHONPATH": os.getcwd()}
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {target} failed:\n{process.stderr[-2000:]}")
+    packages = Counter()
+    for line in process.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3:
+            continue
+        self_us, _, name = (field.strip() for field in fields)
+        if self_us.isdigit():
+            packages[name.split(".")[0]] += int(self_us) / 1e6
+    return json.loads(process.stdout.strip().splitlines()[-1]), packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--targets", default="main", help="comma-separated modules to import")
+    parser.add_argument("--load", action="store_true", help="also load the model after importing")
+    parser.add_argument("--forbid", default=",".join(m for f in FRAMEWORKS.values() for m in f.modules),
+                        help="modules that must not be imported by the targets alone")
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    forbidden = [module for module in args.forbid.split(",") if module]
+    failed = False
+    for target in args.targets.split(","):
+        result, packages = probe(target, args.load)
+        print(f"{target}: imported in {result['seconds']:.2f} s, RSS {result['rss_mib']:.0f} MiB")
+        for package, seconds in packages.most_common(args.top):
+            print(f"    {package:24s} {seconds * 1000:8.1f} ms")
+        for name, framework in result["frameworks"].items():
+            state = "imported" if framework["imported"] else "not imported"
+            if framework["import_seconds"] is not None:
+                state += f" in {framework['import_seconds']:.2f} s, +{framework['import_rss_mib'] or 0:.0f} MiB RSS"
+            installed = "" if framework["installed"] else " (not installed)"
+            print(f"  framework {name:10s} {state}{installed}")
+        if args.load:
+            print(f"  model loaded in {result['load_seconds']:.2f} s, RSS {result['loaded_rss_mib']:.0f} MiB")
+        # Modules are listed before --load, which imports the framework on purpose
+        leaked = [module for module in forbidden if module in result["modules"]]
+        if leaked:
+            failed = True
+            print(f"  FAIL: importing {target} imports {', '.join(leaked)}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmark suite for the analysis pipeline, with a regression gate.
+
+Microbenchmarks every pipeline stage on synthetic pet photos at several
+resolutions, then drives /analyze in-process over ASGI at each concurrency
+level and records p50/p95/p99 latency, requests/s and RSS. Results are
+written as JSON; with --baseline the run fails when a median latency,
+throughput, error count or peak RSS is worse than the baseline by more
+than --threshold.
+
+Inputs are fixed (seeded images, fixed thread count, warmup before timing)
+so runs on the same machine are comparable. Baselines are only meaningful
+on the machine that produced them.
+
+Run from packages/backend; store one run as the baseline, then gate later runs on it:
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json [--threshold 0.25]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = ((640, 480), (1920, 1080), (4032, 3024))
+# Metrics where a higher value is better; everything else is a cost
+HIGHER_IS_BETTER = ("rps",)
+# Metrics the regression gate checks; tail percentiles of short runs are too noisy
+GATED = ("p50_ms", "rps", "errors", "peak_rss_mib", "model_load_ms")
+
+
+def make_pet_photo(width, height, seed=0) -> bytes:
+    """
+    JPEG of a pet silhouette with eyes on a light background, like
+    tests/create_test_data.py, scaled to width x height with some texture
+    so every seed gives a distinct image that passes the quality gate.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:height, :width]
+    scale = min(width, height) / 300
+    image = np.empty((height, width, 3), dtype=np.float32)
+    image[:] = rng.uniform(200, 245, size=3)
+
+    cx, cy = width / 2 + rng.uniform(-20, 20) * scale, height / 2 + rng.uniform(-20, 20) * scale
+    body = (x - cx) ** 2 / (100 * scale) ** 2 + (y - cy) ** 2 / (80 * scale) ** 2 <= 1
+    image[body] = rng.uniform(60, 140, size=3)
+    for dx in (-30, 30):
+        eye = (x - (cx + dx * scale)) ** 2 + (y - (cy - 20 * scale)) ** 2 <= (10 * scale) ** 2
+        image[eye] = 255
+
+    image += rng.normal(0, 6, size=image.shape).astype(np.float32)
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def peak_rss_mib() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def time_call(fn, repeats, warmup=3):
+    """Median and p95 in ms over repeats calls, after warmup calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(samples, 50)), "p95_ms": float(np.percentile(samples, 95))}
+
+
+def run_stages(predictor, repeats, batch_size):
+    from app.utils.image_processing import (
+        assess_quality, decode_image, dhash, format_results, prepare_image, preprocess_image
+    )
+
+    stages = {}
+    for width, height in RESOLUTIONS:
+        contents = make_pet_photo(width, height)
+        image = decode_image(contents)
+        image.load()
+        processed = preprocess_image(image)
+        suffix = f"{width}x{height}"
+
+        def decode():
+            decode_image(contents).load()
+
+        stages[f"decode/{suffix}"] = time_call(decode, repeats)
+        stages[f"preprocess/{suffix}"] = time_call(lambda: preprocess_image(image), repeats)
+        stages[f"dhash/{suffix}"] = time_call(lambda: dhash(image), repeats)
+        stages[f"prepare_image/{suffix}"] = time_call(lambda: prepare_image(contents), repeats)
+    stages["quality"] = time_call(lambda: assess_quality(processed), repeats)
+
+    images = [preprocess_image(decode_image(make_pet_photo(640, 480, seed))) for seed in range(batch_size)]
+    stages["tensor/1"] = time_call(lambda: predictor.preprocess_batch(images[:1]), repeats)
+    stages[f"tensor/{batch_size}"] = time_call(lambda: predictor.preprocess_batch(images), repeats)
+    forward_repeats = max(3, repeats // 10)
+    stages["forward/1"] = time_call(lambda: predictor.extract_features_batch(images[:1]), forward_repeats)
+    stages[f"forward/{batch_size}"] = time_call(lambda: predictor.extract_features_batch(images), forward_repeats)
+
+    features = predictor.extract_features_batch(images)
+    outputs = predictor.model.classify(features, "general")
+    stages["classify"] = time_call(lambda: predictor.model.classify(features[:1], "general"), repeats)
+    stages[f"postprocess/{batch_size}"] = time_call(lambda: predictor.postprocess(outputs), repeats)
+    result = predictor.predict_from_features(features[0])[0]
+    stages["format_results"] = time_call(lambda: format_results(result), repeats)
+    return stages
+
+
+def _multipart(contents: bytes, boundary="benchmark-boundary"):
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="photo.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + contents + f"\r\n--{boundary}--\r\n".encode()
+    headers = [
+        (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    return body, headers
+
+
+async def _request(app, body, headers, path=b"/api/v1/health/analyze", query=b"analysis_type=general"):
+    """One POST straight through the ASGI app; returns the status code"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path.decode(), "raw_path": path,
+        "query_string": query, "headers": headers, "server": ("bench", 80),
+        "client": ("bench", 1), "root_path": "",
+    }
+    sent = False
+    status = None
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def _load(app, requests, concurrency):
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def client():
+        nonlocal next_request, errors
+        while next_request < len(requests):
+            body, headers = requests[next_request]
+            next_request += 1
+            start = time.perf_counter()
+            status = await _request(app, body, headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    return latencies, errors, wall
+
+
+def run_load(concurrency_levels, requests_per_level, resolution):
+    from app.utils.memory import process_memory
+    from main import app
+
+    width, height = resolution
+    # Distinct images so neither cache answers for the model
+    seed = 1000
+    results = {}
+    for concurrency in concurrency_levels:
+        requests = []
+        for _ in range(requests_per_level):
+            requests.append(_multipart(make_pet_photo(width, height, seed)))
+            seed += 1
+        latencies, errors, wall = asyncio.run(_load(app, requests, concurrency))
+        results[f"c{concurrency}"] = {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "rps": len(latencies) / wall,
+            "errors": errors,
+            "rss_mib": process_memory().get("rss", peak_rss_mib()),
+        }
+    return results
+
+
+def flatten(results, prefix=""):
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)):
+            metrics[name] = value
+    return metrics
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regressions as (metric, baseline, current, relative change) tuples"""
+    current, reference = flatten(results["metrics"]), flatten(baseline["metrics"])
+    regressions = []
+    for name, old in sorted(reference.items()):
+        new = current.get(name)
+        if new is None or name.rsplit(".", 1)[-1] not in GATED:
+            continue
+        if name.endswith(".errors"):
+            if new > old:
+                regressions.append((name, old, new, float("inf")))
+            continue
+        if old == 0:
+            continue
+        higher_is_better = name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        # Sub-millisecond stages jitter by more than any sensible threshold
+        if name.endswith("_ms") and abs(new - old) < min_delta_ms:
+            continue
+        if change > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="fail when worse than this results file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="ignore latency changes smaller than this")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--load-resolution", default="1920x1080")
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    # Before anything imports torch or builds the app
+    os.environ.setdefault("PET_HEALTH_INFERENCE_THREADS", str(args.threads))
+    os.environ.setdefault("PET_HEALTH_CACHE_DISK_PATH", "")
+    from app.models.backends import configure_threads
+    from app.routers.health_analysis import model_loader
+
+    configure_threads(args.threads)
+    model_loader.startup(warmup_batches=2, warmup_batch_size=args.batch_size)
+    predictor = model_loader.predictor
+
+    import torch
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "threads": args.threads,
+            "backend": predictor.backend.name,
+            "model_version": model_loader.model_version,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": {
+            "model_load_ms": model_loader.load_seconds * 1000,
+            "stages": run_stages(predictor, args.repeats, args.batch_size),
+        },
+    }
+    if not args.skip_load:
+        width, height = map(int, args.load_resolution.split("x"))
+        results["metrics"]["load"] = run_load(args.concurrency, args.requests, (width, height))
+    results["metrics"]["peak_rss_mib"] = peak_rss_mib()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name, value in flatten(results["metrics"]).items():
+        print(f"{name:40s} {value:12.3f}")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers.health_analysis import router as health_router
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import config
+from app.routers.health_analysis import router as health_router, input_buffers, model_loader, result_cache, similar_cases
+from app.routers.jobs import router as jobs_router, job_runner
+from app.routers.admin import router as admin_router, start_weights_watcher, stop_weights_watcher
+from app.models.frameworks import import_report
+from app.utils.cpu_topology import claim_cpu_set, format_cpu_list, parse_cpu_list
+from app.utils.logging import get_logger
+from app.utils.memory import process_memory
+from app.utils.metrics import REGISTRY
 
 app = FastAPI(title="Pet Health AI API")
+logger = get_logger("main")
+# Why loading the model in the background failed, reported by /ready
+model_startup_error = None
 
 # Add CORS middleware
 app.add_middleware(
@@ -15,7 +28,100 @@ app.add_middleware(
 
 # Include routers
 app.include_router(health_router, prefix="/api/v1/health", tags=["health"])
+app.include_router(jobs_router, prefix="/api/v1/jobs", tags=["jobs"])
+app.include_router(admin_router, prefix="/api/v1/admin", tags=["admin"])
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to Pet Health AI API"}
+
+@app.on_event("startup")
+async def pin_worker():
+    # Before the model loads, so torch's thread pools start on the claimed CPUs
+    if config.CPU_SETS:
+        cpu_sets = [parse_cpu_list(cpus) for cpus in config.CPU_SETS.split(";")]
+        index = claim_cpu_set(cpu_sets, config.CPU_LOCK_DIR)
+        if index is None:
+            logger.warning(f"All CPU sets in {config.CPU_SETS} are taken, running unpinned")
+        else:
+            logger.info(f"Worker pinned to CPUs {format_cpu_list(cpu_sets[index])}")
+
+@app.on_event("startup")
+async def load_model():
+    # Missing weights the configuration needs fail startup rather than the first requests
+    model_loader.check_weights()
+    # Load and warm up in the background so the server starts accepting
+    # connections at once; /ready reports when the model can take traffic
+    if config.MODEL_PRELOAD:
+        loop = asyncio.get_running_loop()
+        startup = loop.run_in_executor(
+            None,
+            model_loader.startup,
+            config.MODEL_WARMUP_BATCHES,
+            config.MODEL_WARMUP_BATCH_SIZE
+        )
+        startup.add_done_callback(_model_started)
+    else:
+        model_loader.ready = True
+
+def _model_started(startup):
+    global model_startup_error
+    if startup.cancelled() or startup.exception() is None:
+        return
+    error = startup.exception()
+    model_startup_error = f"{type(error).__name__}: {error}"
+    logger.error(f"Loading the model failed: {model_startup_error}", exc_info=error)
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Jobs queued before a restart are picked up again here
+    if job_runner is not None:
+        job_runner.start()
+
+@app.on_event("startup")
+async def watch_model_weights():
+    # New weights written to the model directory are loaded without a restart
+    start_weights_watcher()
+
+@app.on_event("shutdown")
+async def stop_watching_model_weights():
+    await stop_weights_watcher()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    # Jobs interrupted mid-analysis go back to the queue
+    if job_runner is not None:
+        await job_runner.stop()
+
+@app.on_event("shutdown")
+async def flush_result_cache():
+    # Results still queued for the disk tier
+    await asyncio.get_running_loop().run_in_executor(None, result_cache.close)
+
+@app.on_event("shutdown")
+async def save_similar_cases():
+    # The index catches up from the history store on startup; saving makes that quick
+    if similar_cases is not None:
+        similar_cases.save()
+
+@app.get("/ready")
+async def ready():
+    if model_startup_error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": model_startup_error})
+    if not model_loader.ready:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {
+        "status": "ready",
+        "model_version": model_loader.model_version,
+        "load_seconds": model_loader.load_seconds
+    }
+
+@app.get("/memory")
+async def memory():
+    """RSS/PSS of the worker serving this request in MiB, its imported model frameworks and pooled input buffers"""
+    return {**process_memory(), "frameworks": import_report(), "input_buffers": input_buffers.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latencies, batch sizes, queue depths, cache hits and model load time for Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
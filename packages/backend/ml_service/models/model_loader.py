@@ -1,9 +1,7 @@
-import tensorflow as tf
-import tensorflow_hub as hub
-from tensorflow.keras.applications import EfficientNetB4, ResNet50V2
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
-import torch
-from torchvision.models import efficientnet_b4
+from app.models.frameworks import import_framework
+
+# TensorFlow is imported by the methods that use it, so importing this
+# module (e.g. through the framework registry) stays cheap
 
 class PetHealthModelLoader:
     def __init__(self):
@@ -11,6 +9,12 @@ class PetHealthModelLoader:
         
     def load_base_models(self):
         """Load pre-trained models for different aspects of analysis"""
+        import_framework("tensorflow")
+        import tensorflow as tf
+        import tensorflow_hub as hub
+        from tensorflow.keras.applications import EfficientNetB4, ResNet50V2
+        from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
+        
         # 1. Pet Detection & Breed Recognition
         self.models['pet_detector'] = hub.load('https://tfhub.dev/google/pets/1')
         
@@ -25,6 +29,7 @@ class PetHealthModelLoader:
         
     def preprocess_image(self, image):
         """Preprocess image for model input"""
+        import tensorflow as tf
         image = tf.image.resize(image, (380, 380))
         image = tf.cast(image, tf.float32) / 255.0
         return image
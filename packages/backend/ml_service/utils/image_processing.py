@@ -1,6 +1,5 @@
 import numpy as np
 from PIL import Image
-import tensorflow as tf
 
 def preprocess_image(image: Image.Image, target_size=(380, 380)):
     """
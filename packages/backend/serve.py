@@ -0,0 +1,287 @@
+"""
+Multi-worker launcher that shares model weights between uvicorn workers
+and splits the CPUs between them.
+
+The model is written once as a self-contained bundle to shared memory
+(/dev/shm where available). Every worker memory-maps that file instead of
+loading its own copy, so the weight pages are held once in the page cache
+and shared read-only by all workers. Sharing needs torch 2.1 or newer (as
+pinned in requirements.txt) for memory-mapped, in-place loading; older
+versions give every worker a private copy and say so at startup. It applies
+to the eager backend; torchscript and int8 build private copies of the
+weights. New weights are still watched for in the model directory
+(PET_HEALTH_MODEL_DIR, by default app/models/pretrained); a reload
+re-exports them to shared memory first.
+
+Unless given, the worker count and torch threads per worker are derived
+from the CPUs this process may use and the cgroup CPU quota, so that
+workers x threads never oversubscribes the host. With --pin every worker
+is pinned to its own set of cores. --calibrate measures each candidate
+split under load and launches the one with the best throughput whose p99
+stays within --target-p99-ms.
+
+    python serve.py --port 8000                       # automatic split
+    python serve.py --workers 4 --threads 2 --pin
+    python serve.py --calibrate --target-p99-ms 500
+    python serve.py --dry-run                         # print the split and exit
+
+Per-worker RSS/PSS: python -m app.utils.memory <launcher pid>, or GET /memory.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+
+from app.utils.cpu_topology import available_cpus, candidate_plans, cgroup_cpu_limit, format_cpu_list, plan_workers
+
+
+def _export_bundle(source_dir, shared_dir):
+    from app import config
+    from app.models.model_loader import PetHealthModelLoader
+
+    # Configured like the workers, so the cascade's first stage is exported too,
+    # and the way their reloads export, so they know these weights are current
+    loader = PetHealthModelLoader(
+        model_dir=shared_dir,
+        source_dir=source_dir,
+        lazy=True,
+        cascade=config.CASCADE_ENABLED,
+        cascade_threshold=config.CASCADE_THRESHOLD,
+        cascade_escalate_on_conditions=config.CASCADE_ESCALATE_ON_CONDITIONS,
+    )
+    loader.export_from_source(allow_untrained=True)
+    print(f"Shared model bundle written to {loader.bundle_path}")
+
+
+def export_shared_bundle(shared_dir: Path, source_dir: Path):
+    """
+    Write the model bundle to shared_dir from a short-lived child process,
+    so the launcher itself never holds torch or the weights.
+    """
+    shared_dir.mkdir(parents=True, exist_ok=True)
+    process = multiprocessing.get_context("spawn").Process(
+        target=_export_bundle, args=(str(source_dir), str(shared_dir))
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError("Exporting the shared model bundle failed")
+
+
+def default_shared_dir() -> Path:
+    shm = Path("/dev/shm")
+    base = shm if shm.is_dir() else Path(tempfile.gettempdir())
+    return base / f"pet-health-{os.getpid()}"
+
+
+def plan_environment(plan, pin: bool, lock_dir: Path) -> dict:
+    """Environment that makes every worker of the server follow plan"""
+    environment = {
+        "PET_HEALTH_INFERENCE_THREADS": str(plan.threads),
+        "PET_HEALTH_INFERENCE_INTEROP_THREADS": str(plan.interop_threads),
+        # For OpenMP pools started before torch.set_num_threads runs
+        "OMP_NUM_THREADS": str(plan.threads),
+        # Decoding threads, one per core of a worker's share
+        "PET_HEALTH_WORKER_POOL_SIZE": str(max(1, len(plan.cpu_sets[0]))),
+    }
+    if pin:
+        environment["PET_HEALTH_CPU_SETS"] = ";".join(format_cpu_list(cpus) for cpus in plan.cpu_sets)
+        environment["PET_HEALTH_CPU_LOCK_DIR"] = str(lock_dir)
+    return environment
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(port, workers, timeout=300):
+    """Wait until /ready answers 200 often enough in a row that every worker has loaded the model"""
+    deadline = time.monotonic() + timeout
+    in_a_row = 0
+    while in_a_row < workers * 4:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server on port {port} did not become ready")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/ready")
+            status = connection.getresponse().status
+            connection.close()
+        except OSError:
+            status = None
+        in_a_row = in_a_row + 1 if status == 200 else 0
+        time.sleep(0.05 if status == 200 else 0.5)
+
+
+def _multipart(photo: bytes):
+    boundary = "pet-health-calibration"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"pet.jpg\"\r\n"
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + photo + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def drive(port, photos, concurrency, seconds):
+    """Closed-loop load on /analyze; returns (latencies in s, errors, elapsed s)"""
+    requests = [_multipart(photo) for photo in photos]
+    latencies, errors = [], []
+    stop = time.monotonic() + seconds
+
+    def client(offset):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        sent = offset
+        while time.monotonic() < stop:
+            body, headers = requests[sent % len(requests)]
+            sent += concurrency
+            started = time.perf_counter()
+            try:
+                connection.request("POST", "/api/v1/health/analyze", body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                ok = False
+            (latencies if ok else errors).append(time.perf_counter() - started)
+        connection.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.monotonic() - started
+
+
+def measure_plan(plan, pin, environment, target_p99_ms, seconds, max_concurrency, photos):
+    """
+    Run a server following plan and ramp up closed-loop concurrency until
+    p99 exceeds the target. Returns one row per concurrency level.
+    """
+    import numpy as np
+
+    port = _free_port()
+    lock_dir = Path(tempfile.mkdtemp(prefix="pet-health-cpus-"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(plan.workers), "--log-level", "warning"],
+        env={**environment, **plan_environment(plan, pin, lock_dir)},
+    )
+    rows = []
+    try:
+        _wait_ready(port, plan.workers)
+        drive(port, photos, max_concurrency, min(seconds, 2.0))  # warm up every worker
+        concurrency = 1
+        while concurrency <= max_concurrency:
+            latencies, errors, elapsed = drive(port, photos, concurrency, seconds)
+            p99_ms = float(np.percentile(latencies, 99)) * 1000 if latencies else float("inf")
+            rows.append({"concurrency": concurrency, "rps": len(latencies) / elapsed, "p99_ms": p99_ms, "errors": errors})
+            print(f"    concurrency {concurrency:3d}: {rows[-1]['rps']:7.1f} req/s, p99 {p99_ms:7.1f} ms, {errors} errors")
+            if p99_ms > target_p99_ms:
+                break
+            concurrency *= 2
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(lock_dir, ignore_errors=True)
+    return rows
+
+
+def calibrate(plans, pin, environment, target_p99_ms, seconds, max_concurrency):
+    """The plan with the highest error-free throughput at a p99 within target, or None"""
+    from benchmarks.suite import make_pet_photo
+
+    # Distinct photos with the result caches off, so every request runs the model
+    photos = [make_pet_photo(640, 480, seed) for seed in range(64)]
+    environment = {
+        **environment,
+        "PET_HEALTH_CACHE_MAX_ENTRIES": "0",
+        "PET_HEALTH_FEATURE_CACHE_MAX_ENTRIES": "0",
+        "PET_HEALTH_NEAR_DUPLICATE_ENABLED": "false",
+    }
+    best, best_rps = None, 0.0
+    for plan in plans:
+        print(f"Calibrating {plan.describe()}")
+        rows = measure_plan(plan, pin, environment, target_p99_ms, seconds, max_concurrency, photos)
+        rps = max((row["rps"] for row in rows if row["p99_ms"] <= target_p99_ms and not row["errors"]), default=0.0)
+        print(f"  best within target: {rps:.1f} req/s")
+        if rps > best_rps:
+            best, best_rps = plan, rps
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with weights shared across workers")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="server processes (default: from the CPU budget)")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads per worker (default: budget / workers)")
+    parser.add_argument("--interop-threads", type=int, default=1, help="torch inter-op threads per worker")
+    parser.add_argument("--pin", action="store_true", help="pin every worker to its own set of cores")
+    parser.add_argument("--calibrate", action="store_true", help="measure candidate splits and launch the best")
+    parser.add_argument("--target-p99-ms", type=float, default=500, help="latency target for --calibrate")
+    parser.add_argument("--calibrate-seconds", type=float, default=5, help="load duration per concurrency level")
+    parser.add_argument("--max-concurrency", type=int, default=32, help="highest concurrency --calibrate tries")
+    parser.add_argument("--dry-run", action="store_true", help="print the split and exit")
+    parser.add_argument("--shared-dir", type=Path, help="where to put the shared bundle (default: /dev/shm)")
+    args = parser.parse_args()
+
+    quota = cgroup_cpu_limit()
+    plan = plan_workers(args.workers, args.threads, args.interop_threads, quota=quota)
+    print(f"CPUs {format_cpu_list(available_cpus())}, cgroup quota "
+          f"{'none' if quota is None else f'{quota:g} cores'}: {plan.describe()}")
+    if args.dry_run:
+        if args.calibrate:
+            for candidate in candidate_plans(quota=quota):
+                print(f"  candidate: {candidate.describe()}")
+        return
+
+    shared_dir = args.shared_dir or default_shared_dir()
+    source_dir = Path(os.getenv("PET_HEALTH_MODEL_DIR") or Path(__file__).parent / "app" / "models" / "pretrained")
+    export_shared_bundle(shared_dir, source_dir)
+
+    # Workers inherit the environment and load the shared bundle; new weights
+    # are still looked for in the source directory and re-exported on reload
+    os.environ["PET_HEALTH_MODEL_DIR"] = str(shared_dir)
+    os.environ["PET_HEALTH_MODEL_SOURCE_DIR"] = str(source_dir.resolve())
+    # uvicorn re-raises the SIGTERM it stopped on; exit normally so the cleanup below runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    lock_dir = Path(tempfile.mkdtemp(prefix="pet-health-cpus-"))
+    try:
+        if args.calibrate:
+            candidates = [
+                candidate._replace(interop_threads=args.interop_threads) for candidate in candidate_plans(quota=quota)
+            ]
+            best = calibrate(
+                candidates, args.pin, dict(os.environ), args.target_p99_ms,
+                args.calibrate_seconds, args.max_concurrency
+            )
+            if best is None:
+                print(f"No split met p99 <= {args.target_p99_ms:g} ms; using the default")
+            plan = best or plan
+            print(f"Launching {plan.describe()}")
+        os.environ.update(plan_environment(plan, args.pin, lock_dir))
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=plan.workers)
+    finally:
+        shutil.rmtree(lock_dir, ignore_errors=True)
+        if args.shared_dir is None:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,17 @@ setup(
     install_requires=[
         "fastapi",
         "uvicorn",
-        "tensorflow",
-        "tensorflow-hub",
         "torch",
         "torchvision",
         "Pillow",
         "numpy",
         "python-multipart"
     ],
+    extras_require={
+        # TensorFlow models in ml_service (PET_HEALTH_MODEL_FRAMEWORK=tensorflow)
+        "tensorflow": [
+            "tensorflow",
+            "tensorflow-hub"
+        ],
+    },
 )
@@ -0,0 +1,49 @@
+import pytest
+import torch
+from torchvision.models.efficientnet import MBConv
+
+from app.models.backends import synthetic_calibration_images
+from app.models.pet_health_model import PetHealthPredictor
+
+
+def _calibrate_batch_norm(predictor, images):
+    """Set every BatchNorm's running statistics from a forward pass over images"""
+    for module in predictor.model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            module.reset_running_stats()
+            # Cumulative average instead of an exponential one
+            module.momentum = None
+    predictor.model.train()
+    with torch.no_grad():
+        predictor.model(predictor.preprocess_batch(images))
+    predictor.model.eval()
+
+
+@pytest.fixture(scope="session")
+def _predictor_state():
+    # Freshly initialized BatchNorm layers shrink activations layer after
+    # layer, leaving the untrained backbone with embeddings of ~1e-13 that
+    # any two images (or backends) agree on. Seeded weights with calibrated
+    # BatchNorm statistics give embeddings that tell images apart.
+    torch.manual_seed(0)
+    predictor = PetHealthPredictor()
+    # Residual branches scaled down, as in zero-init residual training: a
+    # random network otherwise amplifies small input changes (or int8
+    # rounding) from block to block
+    for module in predictor.model.modules():
+        if isinstance(module, MBConv) and module.use_res_connect:
+            module.block[-1][1].weight.data.mul_(0.1)
+    _calibrate_batch_norm(predictor, synthetic_calibration_images(count=32, seed=1))
+    return {key: value.clone() for key, value in predictor.model.state_dict().items()}
+
+
+@pytest.fixture
+def predictor(_predictor_state):
+    # Untrained but deterministic and non-degenerate; built without downloading anything
+    predictor = PetHealthPredictor()
+    predictor.model.load_state_dict(_predictor_state)
+    features = predictor.extract_features_batch(synthetic_calibration_images(count=2, seed=2))
+    scale = features.abs().mean()
+    assert scale > 1e-2, "the test model's embeddings have collapsed"
+    assert (features[0] - features[1]).abs().mean() > 0.1 * scale, "the test model can't tell images apart"
+    return predictor
@@ -0,0 +1,108 @@
+import numpy as np
+
+from app.utils.ann_index import IVFPQIndex
+from app.utils.embedding_store import EmbeddingStore
+from app.utils.similar_cases import SimilarCases
+
+
+def _clustered(n, dim=64, clusters=50, seed=0):
+    """Unit vectors around a few cluster centres, with low-rank variation like real embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    basis = rng.normal(size=(8, dim))
+    vectors = centres[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, 8)) @ basis
+    vectors += 0.05 * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _recall(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+
+def test_ivfpq_recall_against_brute_force(tmp_path):
+    """Incremental inserts train the index; results survive a memory-mapped save and load"""
+    vectors = _clustered(6050)
+    vectors, queries = vectors[:6000], vectors[6000:]
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+
+    index = IVFPQIndex(64, nlist=32, m=8, nprobe=8, train_size=4000)
+    index.add(vectors[:1000], np.arange(1000))
+    assert not index.is_trained
+    # Exact until trained
+    _, ids = index.search(vectors[:3], k=1)
+    assert ids[:, 0].tolist() == [0, 1, 2]
+    for start in range(1000, 6000, 500):
+        index.add(vectors[start:start + 500], np.arange(start, start + 500))
+    assert index.wait_for_training() and len(index) == 6000
+
+    _, approximate = index.search(queries, k=10)
+    distances, refined = index.search(queries, k=10, refine=lambda ids: vectors[ids])
+    assert _recall(approximate, truth) > 0.5
+    assert _recall(refined, truth) > 0.8
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+    index.save(tmp_path / "index")
+    # Saving again replaces the whole directory at once
+    index.save(tmp_path / "index")
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["index"]
+    loaded = IVFPQIndex.load(tmp_path / "index")
+    np.testing.assert_array_equal(loaded.search(queries, k=10)[1], approximate)
+    # Inserts after loading copy only the touched cells out of the mapped files
+    loaded.add(queries[:1], [6000])
+    assert loaded.search(queries[:1], k=1)[1][0, 0] == 6000 and loaded.max_id == 6000
+    print(f"✅ IVF-PQ recall@10: {_recall(approximate, truth):.2f}, refined {_recall(refined, truth):.2f}")
+
+
+def test_training_runs_beside_inserts_and_searches():
+    """Reaching train_size starts training in the background; vectors added meanwhile end up encoded"""
+    import time
+    from app.utils import ann_index
+
+    vectors = _clustered(5000)
+    index = IVFPQIndex(64, nlist=32, m=8, nprobe=32, train_size=4000)
+    kmeans = ann_index.kmeans
+
+    def slow_kmeans(*args, **kwargs):
+        time.sleep(0.05)
+        return kmeans(*args, **kwargs)
+
+    ann_index.kmeans = slow_kmeans
+    try:
+        started = time.perf_counter()
+        index.add(vectors[:4000], np.arange(4000))
+        assert time.perf_counter() - started < 0.05
+        # Still answered exactly while the quantizers train
+        index.add(vectors[4000:], np.arange(4000, 5000))
+        assert index.search(vectors[4500], k=1)[1][0, 0] == 4500
+        assert index.wait_for_training()
+    finally:
+        ann_index.kmeans = kmeans
+    assert len(index) == 5000
+    _, ids = index.search(vectors[4000:4100], k=10)
+    # Found among their own nearest neighbours, so they were encoded after the swap
+    assert np.mean((ids == np.arange(4000, 4100)[:, None]).any(axis=1)) > 0.9
+    print("✅ IVF-PQ trains in the background")
+
+
+def test_similar_cases_catch_up_from_history(tmp_path):
+    """A saved index picks up cases recorded after the save, and is rebuilt for a new model version"""
+    store = EmbeddingStore(tmp_path / "history.bin", dim=64)
+    vectors = _clustered(30)
+    health, conditions = np.full(5, 0.2), np.zeros(10)
+    for vector in vectors[:20]:
+        store.append("rex", "v1/full", vector, health, conditions)
+
+    cases = SimilarCases(store, tmp_path / "index", nlist=4, m=8)
+    cases.add(0, vectors[0], "v1/full")
+    cases.save()
+    for vector in vectors[20:]:
+        store.append("tom", "v1/full", vector, health, conditions)
+
+    reopened = SimilarCases(store, tmp_path / "index", nlist=4, m=8)
+    ids, distances, records = reopened.search(vectors[25], "v1/full", k=3)
+    assert ids[0] == 25 and distances[0] < 1e-6
+    assert records["pet"][0] == store.pet_key("tom")
+    assert len(reopened.index) == 30
+    # Another model version's embeddings live in another space
+    assert len(reopened.search(vectors[25], "v2/full", k=3)[0]) == 0
+    print("✅ Similar cases catch up from history")
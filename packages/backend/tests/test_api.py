@@ -46,12 +46,41 @@ def test_health_analysis():
     print("✅ Health analysis endpoint working")
     print(f"Analysis result: {json.dumps(result, indent=2)}")
 
+def test_batch_health_analysis():
+    """Test the batch analysis endpoint streams one NDJSON line per image"""
+    test_image_path = Path(__file__).parent / "test_data" / "images" / "test_pet.jpg"
+    
+    if not test_image_path.exists():
+        print("❌ Test image not found")
+        return
+    
+    image_bytes = test_image_path.read_bytes()
+    files = [
+        ("images", ("test_pet.jpg", image_bytes, "image/jpeg")),
+        ("images", ("not_an_image.jpg", b"not an image", "image/jpeg")),
+    ]
+    response = requests.post(
+        "http://localhost:8000/api/v1/health/analyze/batch",
+        files=files
+    )
+    
+    assert response.status_code == 200
+    items = sorted(
+        (json.loads(line) for line in response.text.splitlines()),
+        key=lambda item: item["index"]
+    )
+    assert len(items) == 2
+    assert items[0]["status"] == "success"
+    assert items[1]["status"] == "error"
+    print("✅ Batch health analysis endpoint working")
+
 if __name__ == "__main__":
     print("Running API tests...")
     try:
         test_health_check()
         test_analysis_types()
         test_health_analysis()
+        test_batch_health_analysis()
         print("\n✨ All tests passed!")
     except Exception as e:
         print(f"\n❌ Test failed: {str(e)}")
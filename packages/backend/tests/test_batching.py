@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+from app.models.batching import InferenceBatcher
+
+
+def test_concurrent_requests_are_batched():
+    """Concurrent submissions share forward passes and get their own results"""
+    batch_sizes = []
+
+    def batch_fn(items):
+        batch_sizes.append(len(items))
+        time.sleep(0.01)  # Simulate a forward pass
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = InferenceBatcher(batch_fn, max_batch_size=4, max_wait_ms=5)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+
+    assert results == [i * 2 for i in range(10)]
+    assert sum(batch_sizes) == 10
+    assert max(batch_sizes) <= 4
+    assert len(batch_sizes) < 10
+    print("✅ Concurrent requests batched")
+
+
+def test_batch_errors_reach_every_caller():
+    """A failing batch raises in each waiting caller"""
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    async def run():
+        batcher = InferenceBatcher(batch_fn, max_batch_size=4)
+        results = await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, ValueError) for r in results)
+    print("✅ Batch errors propagated")
+
+
+def test_priorities_and_deadlines():
+    """Higher priorities run first; work that would miss its deadline is shed, not run"""
+    from app.models.batching import PRIORITIES, SHED_REQUESTS, DeadlineExceeded
+
+    batches = []
+
+    def batch_fn(items):
+        batches.append(list(items))
+        # The second batch overruns what the first taught the batcher to expect
+        time.sleep(0.15 if "running" in items else 0.05)
+        return items
+
+    async def run():
+        batcher = InferenceBatcher(batch_fn, max_batch_size=2, max_wait_ms=1)
+        await batcher.submit("warmup")
+        loop = asyncio.get_running_loop()
+        blocker = asyncio.ensure_future(batcher.submit("running"))
+        await asyncio.sleep(0.01)
+        queued = [
+            asyncio.ensure_future(batcher.submit("low", PRIORITIES["low"])),
+            asyncio.ensure_future(batcher.submit("doomed", PRIORITIES["normal"], loop.time() + 0.12)),
+            asyncio.ensure_future(batcher.submit("high", PRIORITIES["high"])),
+        ]
+        await asyncio.sleep(0)
+        # Three batches are ahead of it, so this cannot make a 10 ms deadline
+        try:
+            await batcher.submit("infeasible", PRIORITIES["normal"], loop.time() + 0.01)
+            infeasible = None
+        except DeadlineExceeded as e:
+            infeasible = e.stage
+        results = await asyncio.gather(blocker, *queued, return_exceptions=True)
+        await batcher.close()
+        return infeasible, results
+
+    shed_before = SHED_REQUESTS.value("queue", "normal")
+    infeasible, results = asyncio.run(run())
+
+    assert infeasible == "admission"
+    # "doomed" looked feasible but expired behind the slow batch, so it never reached the model
+    assert isinstance(results[2], DeadlineExceeded) and results[2].stage == "queue"
+    assert SHED_REQUESTS.value("queue", "normal") == shed_before + 1
+    assert batches[2] == ["high", "low"]
+    print("✅ Priority scheduling and deadline shedding")
@@ -0,0 +1,31 @@
+import numpy as np
+
+from app.utils.buffer_pool import BufferPool
+
+
+def test_buffers_are_reused_and_misses_allocated():
+    """Released slots are lent again; an exhausted pool hands out fresh arrays it then ignores"""
+    pool = BufferPool((4, 4, 3), np.uint8, size=2)
+    first, second = pool.acquire(), pool.acquire()
+    assert first.shape == (4, 4, 3) and first.dtype == np.uint8
+    assert not np.shares_memory(first, second)
+    assert pool.in_use == 2
+
+    extra = pool.acquire()
+    assert pool.misses == 1 and pool.in_use == 2
+    pool.release(extra)
+    pool.release(None)
+    assert pool.in_use == 2
+
+    pool.release(first)
+    pool.release(first)
+    assert pool.in_use == 1
+    assert pool.acquire() is first
+    assert pool.acquire() is not second
+
+    pool.release(first)
+    pool.release(second)
+    with pool.borrow() as buffer:
+        assert pool.in_use == 1 and buffer is second
+    assert pool.stats() == {"size": 2, "in_use": 0, "misses": 2}
+    print("✅ Buffer pool reuses its slots")
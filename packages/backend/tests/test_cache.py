@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from app.utils.cache import AnalysisCache
+
+
+def test_lru_eviction_and_ttl():
+    """Least recently used entries are evicted and expired entries miss"""
+    cache = AnalysisCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", {"health_status": "healthy"})
+    cache.set("b", {"health_status": "minor_issues"})
+    assert cache.get("a") is not None  # "a" is now most recently used
+    cache.set("c", {"health_status": "emergency"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"health_status": "healthy"}
+
+    expiring = AnalysisCache(ttl_seconds=0)
+    expiring.set("a", {"health_status": "healthy"})
+    assert expiring.get("a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    print("✅ LRU eviction and TTL")
+
+
+def test_key_depends_on_content_version_and_type():
+    key = AnalysisCache.make_key(b"photo", "v1", "general")
+    assert key == AnalysisCache.make_key(b"photo", "v1", "general")
+    assert key != AnalysisCache.make_key(b"photo", "v2", "general")
+    assert key != AnalysisCache.make_key(b"photo", "v1", "skin")
+    assert key != AnalysisCache.make_key(b"other", "v1", "general")
+    print("✅ Cache keys")
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Entries written to the SQLite tier are found by a fresh cache"""
+    path = tmp_path / "cache.db"
+    first = AnalysisCache(disk_path=str(path))
+    first.set("a", {"health_status": "healthy"})
+    first.close()
+
+    cache = AnalysisCache(disk_path=str(path))
+    assert cache.get("a") == {"health_status": "healthy"}
+    assert cache.stats()["disk_hits"] == 1
+    print("✅ Disk tier persists")
+
+
+def test_disk_writes_are_batched_off_the_caller(tmp_path, monkeypatch):
+    """set() only queues; the writer commits everything queued meanwhile at once"""
+    path = tmp_path / "cache.db"
+    cache = AnalysisCache(disk_path=str(path), disk_flush_seconds=0.2)
+    commits = []
+    monkeypatch.setattr(cache, "_db", _CountingConnection(cache._db, commits))
+    for index in range(50):
+        cache.set(f"key-{index}", {"index": index})
+    assert commits == []
+    for _ in range(100):
+        if commits:
+            break
+        time.sleep(0.02)
+    cache.close()
+    assert len(commits) == 1
+
+    fresh = AnalysisCache(disk_path=str(path))
+    assert asyncio.run(fresh.get_async("key-49")) == {"index": 49}
+    assert asyncio.run(fresh.get_async("missing")) is None
+    assert fresh.stats()["disk_hits"] == 1 and fresh.stats()["misses"] == 1
+    print("✅ Disk writes batched")
+
+
+class _CountingConnection:
+    def __init__(self, db, commits):
+        self._db = db
+        self._commits = commits
+
+    def commit(self):
+        self._commits.append(time.time())
+        self._db.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+def test_memory_hit_is_fast():
+    cache = AnalysisCache()
+    cache.set("a", {"health_status": "healthy"})
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        cache.get("a")
+    per_hit = (time.perf_counter() - start) / 1000
+
+    assert per_hit < 1e-4
+    print(f"✅ Cache hit in {per_hit * 1e6:.1f}us")
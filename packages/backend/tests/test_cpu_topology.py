@@ -0,0 +1,72 @@
+import os
+
+from app.utils import cpu_topology
+from app.utils.cpu_topology import (
+    candidate_plans, cgroup_cpu_limit, claim_cpu_set, format_cpu_list, parse_cpu_list, plan_workers
+)
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_cgroup_cpu_limit(tmp_path):
+    """Quotas are read from cgroup v2 and v1 trees; the tightest one along the path wins"""
+    v2 = tmp_path / "v2"
+    _write(v2 / "cpu.max", "max 100000\n")
+    _write(v2 / "system.slice" / "cpu.max", "250000 100000\n")
+    _write(v2 / "system.slice" / "app.scope" / "cpu.max", "max 100000\n")
+    _write(tmp_path / "v2.cgroup", "0::/system.slice/app.scope\n")
+    assert cgroup_cpu_limit(v2, tmp_path / "v2.cgroup") == 2.5
+
+    v1 = tmp_path / "v1"
+    _write(v1 / "cpu,cpuacct" / "docker" / "abc" / "cpu.cfs_quota_us", "150000\n")
+    _write(v1 / "cpu,cpuacct" / "docker" / "abc" / "cpu.cfs_period_us", "100000\n")
+    _write(tmp_path / "v1.cgroup", "5:memory:/docker/abc\n4:cpu,cpuacct:/docker/abc\n")
+    assert cgroup_cpu_limit(v1, tmp_path / "v1.cgroup") == 1.5
+
+    _write(v1 / "cpu,cpuacct" / "docker" / "abc" / "cpu.cfs_quota_us", "-1\n")
+    assert cgroup_cpu_limit(v1, tmp_path / "v1.cgroup") is None
+    assert cgroup_cpu_limit(tmp_path / "missing", tmp_path / "missing.cgroup") is None
+    print("✅ cgroup CPU quota detected")
+
+
+def test_plans_fill_the_budget_without_oversubscribing(tmp_path):
+    """Workers x threads stays within the CPUs and quota, and hyperthread siblings share a worker"""
+    assert parse_cpu_list("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert format_cpu_list([11, 0, 1, 2, 3, 8, 10]) == "0-3,8,10-11"
+
+    # 4 cores with 2 hyperthreads each, numbered like Intel hosts: CPU n and n + 4 are siblings
+    sysfs = tmp_path / "sysfs"
+    for cpu in range(8):
+        _write(sysfs / f"cpu{cpu}" / "topology" / "physical_package_id", "0\n")
+        _write(sysfs / f"cpu{cpu}" / "topology" / "core_id", f"{cpu % 4}\n")
+    plan = plan_workers(workers=2, cpus=range(8), quota=None, sysfs=sysfs)
+    assert plan.threads == 4
+    assert plan.cpu_sets == [[0, 1, 4, 5], [2, 3, 6, 7]]
+
+    for cpus, quota in ((range(8), None), (range(16), 6.5), (range(2), None), (range(64), 0.5)):
+        budget = len(cpus) if quota is None else max(1, min(len(cpus), int(quota)))
+        for plan in candidate_plans(cpus=cpus, quota=quota, sysfs=sysfs):
+            assert plan.workers * plan.threads <= budget
+            assert len(plan.cpu_sets) == plan.workers
+    assert [plan.workers for plan in candidate_plans(cpus=range(8), quota=8.0)] == [1, 2, 3, 4, 8]
+    print("✅ Worker plans respect the CPU budget")
+
+
+def test_workers_claim_distinct_cpu_sets(tmp_path):
+    """Each claim takes a free set and pins to it; once all are taken, claims fail"""
+    cpus = sorted(os.sched_getaffinity(0))
+    try:
+        first = claim_cpu_set([cpus, cpus], tmp_path)
+        second = claim_cpu_set([cpus, cpus], tmp_path)
+        assert (first, second) == (0, 1)
+        assert claim_cpu_set([cpus, cpus], tmp_path) is None
+        assert sorted(os.sched_getaffinity(0)) == cpus
+    finally:
+        for handle in cpu_topology._claimed_locks:
+            handle.close()
+        cpu_topology._claimed_locks.clear()
+        os.sched_setaffinity(0, cpus)
+    print("✅ CPU sets claimed once each")
@@ -0,0 +1,68 @@
+import numpy as np
+
+from app.utils.embedding_store import EmbeddingStore, compare_history
+
+HEALTH = ("healthy", "minor_issues", "attention_needed", "requires_vet", "emergency")
+CONDITIONS = tuple(f"condition_{i}" for i in range(10))
+
+
+def _probs(status, conditions=()):
+    health = np.full(5, 0.025, dtype=np.float32)
+    health[status] = 0.9
+    detected = np.full(10, 0.1, dtype=np.float32)
+    detected[list(conditions)] = 0.8
+    return health, detected
+
+
+def test_store_appends_and_reopens(tmp_path):
+    """Records come back per pet in timestamp order, also from a second handle on the same file"""
+    path = tmp_path / "history.bin"
+    store = EmbeddingStore(path, dim=8)
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(3, 8)).astype(np.float32)
+
+    store.append("rex", "v1/full", embeddings[1], *_probs(1), timestamp=200.0)
+    store.append("rex", "v1/full", embeddings[0], *_probs(0), timestamp=100.0)
+    store.append("tom", "v1/full", embeddings[2], *_probs(2), timestamp=150.0)
+    # Shorter embeddings (first cascade stage) are zero-padded
+    store.append("rex", "v1/fast", embeddings[2][:4], *_probs(0), timestamp=300.0)
+
+    rex = store.history("rex")
+    assert rex["timestamp"].tolist() == [100.0, 200.0, 300.0]
+    np.testing.assert_array_equal(rex["embedding"][0], embeddings[0])
+    np.testing.assert_array_equal(rex["embedding"][2][4:], 0)
+    assert len(store.history("rex", space="v1/full")) == 2
+    assert len(store.history("nobody")) == 0
+
+    other = EmbeddingStore(path)
+    assert other.dim == 8 and len(other) == 4
+    store.append("tom", "v1/full", embeddings[0], *_probs(0), timestamp=400.0)
+    # Rows appended through another handle show up on the next read
+    assert other.history("tom")["timestamp"].tolist() == [150.0, 400.0]
+    print("✅ Embedding store append and reopen")
+
+
+def test_compare_history_from_stored_vectors(tmp_path):
+    """Change and trend come from stored probabilities and embeddings alone"""
+    store = EmbeddingStore(tmp_path / "history.bin", dim=4)
+    day = 86400.0
+    store.append("rex", "v1/full", [1, 0, 0, 0], *_probs(0), timestamp=0.0)
+    store.append("rex", "v2/full", [0, 1, 0, 0], *_probs(1, [3]), timestamp=day)
+    store.append("rex", "v2/full", [0, 1, 1, 0], *_probs(3, [3, 5]), timestamp=2 * day)
+
+    comparison = compare_history(store.history("rex"), HEALTH, CONDITIONS, limit=2)
+
+    assert comparison["analyses"] == 3
+    assert comparison["latest"]["health_status"] == "requires_vet"
+    assert comparison["latest"]["conditions"] == ["condition_3", "condition_5"]
+    previous = comparison["change_from_previous"]
+    assert previous["health_status_changed"] and previous["previous_health_status"] == "minor_issues"
+    assert previous["new_conditions"] == ["condition_5"] and previous["resolved_conditions"] == []
+    assert previous["health_score_delta"] < 0
+    assert abs(previous["embedding_distance"] - (1 - 1 / np.sqrt(2))) < 1e-6
+    # Embeddings from another model version are not comparable
+    assert comparison["change_from_first"]["embedding_distance"] is None
+    assert comparison["trend"]["health_score_slope_per_day"] < 0
+    assert [p["timestamp"] for p in comparison["trend"]["points"]] == [day, 2 * day]
+    assert compare_history(store.history("nobody"), HEALTH, CONDITIONS) is None
+    print("✅ History comparison")
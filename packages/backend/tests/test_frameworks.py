@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.models import frameworks
+
+
+def test_api_imports_no_framework_until_the_model_loads():
+    """Importing the app leaves torch and TensorFlow unimported; loading the model imports torch only"""
+    probe = (
+        "import sys, main\n"
+        "before = [m for m in ('torch', 'torchvision', 'tensorflow') if m in sys.modules]\n"
+        "from app.models.frameworks import import_framework\n"
+        "import_framework('torch')\n"
+        "print(before, 'torch' in sys.modules, 'tensorflow' in sys.modules)\n"
+    )
+    backend = Path(__file__).resolve().parent.parent
+    output = subprocess.run(
+        [sys.executable, "-c", probe], cwd=backend, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    assert output == "[] True False"
+    print("✅ Frameworks imported lazily")
+
+
+def test_registry_selects_loaders_by_name():
+    """Loaders are looked up without importing their framework and checked against the serving interface"""
+    from app.models.model_loader import PetHealthModelLoader
+
+    assert frameworks.loader_class("torch") is PetHealthModelLoader
+    loader = frameworks.create_model_loader("torch", lazy=True)
+    assert isinstance(loader, PetHealthModelLoader) and loader.predictor is None
+
+    # The TensorFlow prototype in ml_service loads without TensorFlow, but cannot serve the API
+    assert frameworks.loader_class("tensorflow").__module__ == "ml_service.models.model_loader"
+    with pytest.raises(ValueError, match="cannot serve"):
+        frameworks.create_model_loader("tensorflow")
+    with pytest.raises(ValueError, match="Unknown model framework"):
+        frameworks.create_model_loader("jax")
+    if not frameworks.is_available("tensorflow"):
+        with pytest.raises(ImportError, match=r"pet-health-ai\[tensorflow\]"):
+            frameworks.import_framework("tensorflow")
+    print("✅ Framework registry")
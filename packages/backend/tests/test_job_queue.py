@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from app.utils.job_queue import JobQueue, JobRunner
+
+
+def test_queued_jobs_survive_restart_and_expired_leases(tmp_path):
+    """Jobs outlive the queue object, and a job whose worker died is handed out again until out of attempts"""
+    path = tmp_path / "jobs.db"
+    queue = JobQueue(path, lease_seconds=60, max_attempts=2)
+    first = queue.submit(b"first", "rex", "general")
+    second = queue.submit(b"second", None, "skin")
+    assert queue.get(second)["position"] == 1
+
+    # A new process sees the same queue, oldest job first
+    queue = JobQueue(path, lease_seconds=0.01, max_attempts=2)
+    job = queue.claim()
+    assert (job["id"], job["payload"], job["attempts"]) == (first, b"first", 1)
+    time.sleep(0.02)
+    # The lease ran out without a result, so the job is claimable again
+    retry = queue.claim()
+    assert retry["id"] == first and retry["token"] != job["token"]
+    # The first worker lost its claim, so its late result and renewals are ignored
+    assert not queue.finish(first, job["token"], {"status": "stale"})
+    assert not queue.renew(first, job["token"])
+    assert queue.get(first)["status"] == "running"
+    time.sleep(0.02)
+    last = queue.claim()
+    assert last["id"] == second
+    assert queue.get(first)["status"] == "failed"
+
+    assert queue.finish(second, last["token"], {"status": "success"})
+    done = queue.get(second)
+    assert done["status"] == "done" and done["result"] == {"status": "success"}
+    assert queue.counts() == {"queued": 0, "running": 0, "done": 1, "failed": 1}
+    print("✅ Job queue durability and leases")
+
+
+def test_runner_drains_queue_and_requeues_failures(tmp_path):
+    """Workers run jobs through the handler; a handler exception costs one attempt"""
+    queue = JobQueue(tmp_path / "jobs.db", max_attempts=2)
+    calls = []
+
+    async def handler(job):
+        calls.append(job["id"])
+        if job["payload"] == b"flaky" and job["attempts"] == 1:
+            raise RuntimeError("transient")
+        return {"echo": job["payload"].decode()}, job["payload"] == b"bad"
+
+    async def run():
+        runner = JobRunner(queue, handler, workers=2, poll_seconds=0.05)
+        runner.start()
+        ids = [queue.submit(payload, None, "general") for payload in (b"ok", b"bad", b"flaky")]
+        runner.notify()
+        for _ in range(100):
+            if all(queue.get(job_id)["status"] in ("done", "failed") for job_id in ids):
+                break
+            await runner.wait_for_change(0.05)
+        await runner.stop()
+        return ids
+
+    ok, bad, flaky = asyncio.run(run())
+    # Refreshed by the runner, read without a query
+    assert sum(queue.cached_counts().values()) == 3
+    assert queue.get(ok)["result"] == {"echo": "ok"}
+    assert queue.get(bad)["status"] == "failed"
+    assert queue.get(flaky)["status"] == "done" and queue.get(flaky)["attempts"] == 2
+    assert calls.count(flaky) == 2
+    print("✅ Job runner")
+
+
+def test_runner_renews_leases_of_long_jobs(tmp_path):
+    """A job outliving its lease stays with its worker instead of being handed out again"""
+    path = tmp_path / "jobs.db"
+    queue = JobQueue(path, lease_seconds=0.3)
+    other_process = JobQueue(path, lease_seconds=0.3)
+    stolen = []
+
+    async def handler(job):
+        for _ in range(6):
+            await asyncio.sleep(0.1)
+            stolen.append(other_process.claim())
+        return {"done": True}, False
+
+    async def run():
+        runner = JobRunner(queue, handler, workers=1, poll_seconds=0.05)
+        runner.start()
+        job_id = queue.submit(b"slow", None, "general")
+        runner.notify()
+        for _ in range(100):
+            if queue.get(job_id)["status"] == "done":
+                break
+            await runner.wait_for_change(0.05)
+        await runner.stop()
+        return job_id
+
+    job_id = asyncio.run(run())
+    assert stolen == [None] * 6
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["attempts"] == 1
+    print("✅ Job leases renewed")
@@ -0,0 +1,55 @@
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+
+from app.utils.logging import JsonFormatter, _QueueHandler, context_filter, set_request_context
+
+
+def test_json_lines_carry_request_context_and_stages():
+    """Records pick up the request context on the calling side and render as one JSON line"""
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(context_filter)
+    logger = logging.getLogger("test.json_lines")
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    set_request_context("req-1", "pet-7")
+    stages = {"decode_ms": 1.5}
+    logger.warning("analysis of %s done", "photo.jpg", extra={"stages": stages})
+    set_request_context(None, None)
+    # Timings added after the record was queued do not leak into it
+    stages["request_ms"] = 9.0
+
+    record = records.get_nowait()
+    # Nothing was formatted on the caller
+    assert record.msg == "analysis of %s done" and record.args == ("photo.jpg",)
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "analysis of photo.jpg done"
+    assert entry["level"] == "WARNING"
+    assert entry["request_id"] == "req-1" and entry["pet_id"] == "pet-7"
+    assert entry["stages"] == {"decode_ms": 1.5}
+    print("✅ JSON lines with request context")
+
+
+def _log_file_name():
+    from app.utils.logging import log_file
+    return os.getpid(), log_file("api").name
+
+
+def test_worker_processes_log_to_their_own_files(monkeypatch):
+    """Server processes started by a parent each write and rotate their own files"""
+    from app import config
+    from app.utils.logging import log_file
+
+    monkeypatch.setattr(config, "LOG_PER_PROCESS", False)
+    assert log_file("api").name == "api.log"
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        pid, name = pool.apply(_log_file_name)
+    assert name == f"api.{pid}.log"
+    print("✅ Per-process log files")
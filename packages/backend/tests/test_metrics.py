@@ -0,0 +1,31 @@
+from app.utils.metrics import Registry
+
+
+def test_prometheus_text_format():
+    """Histograms render cumulative buckets, sum and count; callbacks are read at scrape time"""
+    registry = Registry()
+    latency = registry.histogram("stage_seconds", "Stage latency", ("stage",), buckets=(0.01, 0.1))
+    latency.observe(0.005, "decode")
+    latency.observe(0.05, "decode")
+    latency.observe(3.0, "decode")
+    requests = registry.counter("requests_total", "Requests", ("status",))
+    requests.inc("ok", amount=2)
+    depth = {"value": 3}
+    registry.callback("queue_depth", "Queue depth", lambda: {(): depth["value"]})
+    registry.callback("broken", "Raises", lambda: 1 / 0)
+
+    depth["value"] = 5
+    lines = registry.render().splitlines()
+
+    assert '# TYPE stage_seconds histogram' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="0.01"} 1' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="0.1"} 2' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'stage_seconds_count{stage="decode"} 3' in lines
+    total = next(line for line in lines if line.startswith('stage_seconds_sum{stage="decode"}'))
+    assert abs(float(total.split()[-1]) - 3.055) < 1e-9
+    assert 'requests_total{status="ok"} 2' in lines
+    assert 'queue_depth 5' in lines
+    # A failing callback only loses its own samples
+    assert '# TYPE broken gauge' in lines
+    print("✅ Prometheus text format")
@@ -0,0 +1,47 @@
+import io
+
+from PIL import Image, ImageFilter
+
+from app.utils.image_processing import decode_image, dhash
+from app.utils.near_duplicates import NearDuplicateIndex, hamming_distance
+
+
+def make_photo():
+    image = Image.new("RGB", (640, 480), (200, 180, 160))
+    image.paste((90, 70, 50), (150, 100, 450, 380))
+    image.paste((250, 250, 250), (220, 170, 260, 210))
+    return image.filter(ImageFilter.GaussianBlur(4))
+
+
+def test_dhash_survives_reencoding_and_resizing():
+    """Re-encoded and resized copies hash within a few bits of the original"""
+    original = make_photo()
+    buffer = io.BytesIO()
+    original.resize((320, 240)).save(buffer, format="JPEG", quality=60)
+
+    distance = hamming_distance(dhash(original), dhash(decode_image(buffer.getvalue())))
+
+    assert distance <= 6
+    print(f"✅ dHash distance after re-encoding: {distance}")
+
+
+def test_index_finds_near_duplicates_per_pet():
+    index = NearDuplicateIndex(max_distance=6, ttl_seconds=60)
+    phash = 0x0F0F_F0F0_1234_5678
+    index.add("pet-1", phash, {"health_status": "healthy"}, now=0)
+
+    assert index.find("pet-1", phash ^ 0b10101, now=1) == {"health_status": "healthy"}
+    assert index.find("pet-1", phash ^ 0xFF, now=1) is None  # 8 bits away
+    assert index.find("pet-2", phash, now=1) is None
+    assert index.find("pet-1", phash, now=61) is None  # expired
+    print("✅ Near-duplicate lookup")
+
+
+def test_index_evicts_oldest_entries():
+    index = NearDuplicateIndex(max_entries=2)
+    for phash in (1, 1 << 20, 1 << 40):
+        index.add("pet-1", phash, phash)
+
+    assert len(index) == 2
+    assert index.find("pet-1", 1 << 40) == 1 << 40
+    print("✅ Near-duplicate eviction")
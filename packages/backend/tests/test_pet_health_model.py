@@ -0,0 +1,282 @@
+import numpy as np
+import torch
+
+from app.models.pet_health_model import ANALYSIS_REGIONS
+
+
+def random_images(count):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def test_heads_on_features_match_full_forward(predictor):
+    """Running heads on extracted embeddings gives the same results as predict_batch"""
+    images = random_images(3)
+
+    features = predictor.extract_features_batch(images)
+    assert features.shape == (3, 1280)
+    # The heads see different embeddings, so matching results mean something
+    health, _ = predictor.probabilities_from_features(features)
+    assert np.abs(health[0] - health[1]).max() > 1e-3
+
+    for analysis_type in ("general",) + ANALYSIS_REGIONS:
+        expected = predictor.predict_batch(images, analysis_type)
+        actual = predictor.predict_from_features(features, analysis_type)
+        for e, a in zip(expected, actual):
+            assert e["health_status"] == a["health_status"]
+            assert abs(e["confidence"] - a["confidence"]) < 1e-6
+    print("✅ Heads reuse backbone embeddings")
+
+
+def test_checkpoint_without_region_heads_loads(predictor, tmp_path):
+    """Older checkpoints load, with region heads starting from the general heads"""
+    state = {
+        key: value for key, value in predictor.model.state_dict().items()
+        if not key.startswith("region_heads.")
+    }
+    state["health_classifier.1.bias"] = torch.full((5,), 0.5)
+    path = tmp_path / "pet_health_model.pth"
+    torch.save(state, path)
+
+    predictor._load_weights(torch.load(path))
+
+    for heads in predictor.model.region_heads.values():
+        assert torch.equal(heads["health_classifier"][1].bias, torch.full((5,), 0.5))
+    print("✅ Legacy checkpoint loaded")
+
+
+def test_model_bundle_round_trip(predictor, tmp_path):
+    """A self-contained bundle loads offline and reproduces the saved model exactly"""
+    from app.models.model_loader import PetHealthModelLoader
+    from app.models.pet_health_model import PetHealthPredictor, load_weights, save_model_bundle
+
+    save_model_bundle(predictor.model, tmp_path / "pet_health_model.pt", version="v-test")
+    bundle = load_weights(tmp_path / "pet_health_model.pt")
+    assert bundle["version"] == "v-test"
+    assert bundle["config"] == {"num_health_classes": 5, "num_conditions": 10, "architecture": "efficientnet_b0"}
+
+    loader = PetHealthModelLoader(model_dir=tmp_path, lazy=True)
+    assert loader.predictor is None and not loader.ready
+    loader.startup(warmup_batches=1, warmup_batch_size=2)
+
+    assert loader.ready
+    assert loader.model_version == "v-test"
+    assert loader.predictor.model.architecture == "efficientnet_b0"
+    expected, actual = predictor.model.state_dict(), loader.predictor.model.state_dict()
+    assert actual.keys() == expected.keys()
+    for key, tensor in expected.items():
+        assert torch.equal(actual[key], tensor), key
+
+    # Another architecture is rebuilt from the recorded config, not the default
+    small = PetHealthPredictor(architecture="mobilenet_v3_small")
+    save_model_bundle(small.model, tmp_path / "small.pt", version="v-small")
+    loaded = PetHealthPredictor(tmp_path / "small.pt")
+    assert loaded.version == "v-small" and loaded.model.architecture == "mobilenet_v3_small"
+    assert all(torch.equal(loaded.model.state_dict()[key], tensor) for key, tensor in small.model.state_dict().items())
+    print(f"✅ Bundle loaded in {loader.load_seconds:.2f}s")
+
+
+def test_optimized_backends_match_eager(predictor):
+    """TorchScript matches eager fp32 to float rounding; int8 embeddings stay recognisably the same"""
+    from app.models.backends import synthetic_calibration_images
+
+    images = synthetic_calibration_images(count=8, seed=2)
+    predictor.set_backend("eager", channels_last=False)
+    expected = predictor.extract_features_batch(images)
+    # Different images must give clearly different features, or no comparison below means anything
+    assert (expected[0] - expected[1]).norm() > 0.2 * expected[0].norm()
+
+    predictor.set_backend("torchscript")
+    actual = predictor.extract_features_batch(images)
+    assert ((actual - expected).norm(dim=1) / expected.norm(dim=1)).max() < 1e-4
+
+    predictor.set_backend("int8", calibration_images=synthetic_calibration_images(count=16, seed=3))
+    actual = predictor.extract_features_batch(images)
+    assert actual.shape == expected.shape and actual.dtype == torch.float32
+    # Compared about the batch mean, so the component all embeddings share doesn't count
+    mean = expected.mean(dim=0)
+    similarity = (
+        torch.nn.functional.normalize(actual - mean, dim=1) @ torch.nn.functional.normalize(expected - mean, dim=1).T
+    )
+    assert similarity.diagonal().min() > 0.7
+    # Every int8 embedding is nearest to the eager embedding of its own image
+    assert torch.equal(similarity.argmax(dim=1), torch.arange(len(images)))
+    print(f"✅ Inference backends (int8 cosine >= {similarity.diagonal().min():.2f})")
+
+
+def test_vectorized_postprocess_matches_per_image_loop(predictor):
+    """Batched thresholding and label mapping agree with a per-element reference"""
+    from app.models.pet_health_model import CONDITIONS, HEALTH_STATUSES
+
+    torch.manual_seed(0)
+    outputs = {"health_status": torch.randn(64, 5) * 3, "conditions": torch.randn(64, 10) * 3}
+    results = predictor.postprocess(outputs)
+
+    health_probs = torch.softmax(outputs["health_status"], dim=1)
+    condition_probs = torch.sigmoid(outputs["conditions"])
+    for i, result in enumerate(results):
+        assert result["health_status"] == HEALTH_STATUSES[int(health_probs[i].argmax())]
+        assert abs(result["confidence"] - float(health_probs[i].max())) < 1e-6
+        expected = {CONDITIONS[j] for j in range(10) if condition_probs[i, j] > 0.5}
+        assert {c["condition"] for c in result["conditions_detected"]} == expected
+        confidences = [c["confidence"] for c in result["conditions_detected"]]
+        assert confidences == sorted(confidences, reverse=True)
+
+    top_1 = predictor.postprocess(outputs, top_k=1)
+    assert all(len(result["conditions_detected"]) <= 1 for result in top_1)
+    print("✅ Vectorized postprocess")
+
+
+def test_cascade_answers_confident_images_with_the_fast_model(predictor, tmp_path):
+    """Images escalate to the full model only below the confidence threshold"""
+    from app.models.model_loader import ModelFeatures, PetHealthModelLoader
+    from app.models.pet_health_model import PetHealthPredictor, save_model_bundle
+
+    save_model_bundle(predictor.model, tmp_path / "pet_health_model.pt", version="full")
+    fast = PetHealthPredictor(architecture="mobilenet_v3_small")
+    save_model_bundle(fast.model, tmp_path / "pet_health_fast.pt", version="fast")
+    images = random_images(3)
+
+    for threshold, stage in ((0.0, "fast"), (1.01, "full")):
+        loader = PetHealthModelLoader(
+            model_dir=tmp_path, cascade=True, cascade_threshold=threshold,
+            cascade_escalate_on_conditions=False
+        )
+        assert loader.model_version == f"full+cascade-fast@{threshold:g}"
+        features = loader.extract_features_batch(images)
+        assert all(isinstance(f, ModelFeatures) for f in features)
+        assert [loader.answered_by(f) for f in features] == [stage] * 3
+
+        answering = loader.fast_predictor if stage == "fast" else loader.predictor
+        expected = answering.predict_batch(images, "skin")
+        for e, f in zip(expected, features):
+            assert abs(loader.analyze_features(f, "skin")["confidence"] - e["confidence"]) < 1e-5
+    print("✅ Cascade stages")
+
+
+def test_cascade_export_writes_both_bundles(predictor, tmp_path, monkeypatch):
+    """The launcher's export carries the first stage, and a cascade without one fails to load"""
+    import pytest
+    import serve
+    from app import config
+    from app.models.model_loader import PetHealthModelLoader
+    from app.models.pet_health_model import PetHealthPredictor, save_model_bundle
+
+    source, shared = tmp_path / "source", tmp_path / "shared"
+    source.mkdir()
+    save_model_bundle(predictor.model, source / "pet_health_model.pt", version="full")
+    fast = PetHealthPredictor(architecture="mobilenet_v3_small")
+    save_model_bundle(fast.model, source / "pet_health_fast.pt", version="fast")
+
+    monkeypatch.setattr(config, "CASCADE_ENABLED", True)
+    serve._export_bundle(str(source), str(shared))
+    assert {"pet_health_fast.pt", "pet_health_model.pt"} <= {path.name for path in shared.iterdir()}
+    exported = PetHealthModelLoader(model_dir=shared, cascade=True, cascade_threshold=config.CASCADE_THRESHOLD)
+    original = PetHealthModelLoader(model_dir=source, cascade=True, cascade_threshold=config.CASCADE_THRESHOLD)
+    assert exported.model_version == original.model_version == f"full+cascade-fast@{config.CASCADE_THRESHOLD:g}"
+
+    (shared / "pet_health_fast.pt").unlink()
+    loader = PetHealthModelLoader(model_dir=shared, lazy=True, cascade=True)
+    with pytest.raises(FileNotFoundError, match="first-stage model"):
+        loader.check_weights()
+    with pytest.raises(FileNotFoundError):
+        loader.ensure_loaded()
+    print("✅ Cascade exported with its first stage")
+
+
+def test_reload_swaps_weights_between_batches(predictor, tmp_path):
+    """New weights load beside the active model, shadow it, then take over without stranding old embeddings"""
+    import time
+    from app.models.model_loader import PetHealthModelLoader
+    from app.models.pet_health_model import PetHealthPredictor, save_model_bundle
+
+    save_model_bundle(predictor.model, tmp_path / "pet_health_model.pt", version="v1")
+    loader = PetHealthModelLoader(model_dir=tmp_path, shadow_sample_rate=1.0)
+    images = random_images(2)
+    old_features = loader.extract_features_batch(images)
+    assert not loader.weights_changed()
+
+    retrained = PetHealthPredictor()
+    with torch.no_grad():
+        retrained.model.health_classifier[1].bias.copy_(torch.tensor([0.0, 0.0, 0.0, 0.0, 9.0]))
+    save_model_bundle(retrained.model, tmp_path / "pet_health_model.pt", version="v2")
+    assert loader.weights_changed()
+
+    # Shadowed: the active model still answers while sampled batches also run on the candidate
+    assert loader.reload(warmup_batches=1, warmup_batch_size=2, shadow=True) == "v2"
+    assert loader.model_version == "v1"
+    loader.extract_features_batch(images)
+    for _ in range(200):
+        if loader.shadow_report()["images"]:
+            break
+        time.sleep(0.05)
+    report = loader.shadow_report()
+    assert report["candidate_version"] == "v2" and report["images"] == 2
+    assert report["agreement"] == 0.0 and report["candidate_batch_ms"] > 0
+
+    # Batches finishing together on several threads start a single shadow run
+    import threading
+    compare, started, release = loader._compare_candidate, [], threading.Event()
+    def held_compare(*args):
+        started.append(args)
+        release.wait()
+        compare(*args)
+    loader._compare_candidate = held_compare
+    workers = [threading.Thread(target=loader.extract_features_batch, args=(images,)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    release.set()
+    for _ in range(200):
+        if loader.shadow_report()["images"] == 4:
+            break
+        time.sleep(0.05)
+    assert len(started) == 1 and loader.shadow_report()["images"] == 4
+
+    assert loader.promote() == "v2"
+    assert loader.model_version == "v2" and loader.shadow_report() is None
+    new_features = loader.extract_features_batch(images)
+    assert loader.version_of(new_features[0]) == "v2"
+    assert loader.analyze_features(new_features[0])["health_status"] == "emergency"
+    # Embeddings from before the swap keep using the heads they were made for
+    expected = predictor.predict_batch(images)[0]
+    assert loader.analyze_features(old_features[0])["health_status"] == expected["health_status"]
+
+    # Unchanged or unusable weights leave the active model alone
+    assert loader.reload(warmup_batches=0) == "v2"
+    # Renamed into place like a deploy would; the active weights are memory-mapped
+    (tmp_path / "broken.pt").write_bytes(b"not a model")
+    (tmp_path / "broken.pt").replace(tmp_path / "pet_health_model.pt")
+    try:
+        loader.reload(warmup_batches=0)
+        raise AssertionError("corrupt weights were loaded")
+    except RuntimeError:
+        pass
+    assert loader.model_version == "v2" and not loader.weights_changed()
+    print("✅ Hot reload and shadow mode")
+
+
+def test_reload_reexports_from_source_dir(predictor, tmp_path):
+    """Workers on an exported snapshot watch the source directory and export new weights once for all"""
+    from app.models.model_loader import PetHealthModelLoader
+    from app.models.pet_health_model import save_model_bundle
+
+    source, shared = tmp_path / "source", tmp_path / "shared"
+    source.mkdir()
+    save_model_bundle(predictor.model, source / "pet_health_model.pt", version="v1")
+    PetHealthModelLoader(model_dir=shared, source_dir=source, lazy=True).export_from_source()
+    workers = [PetHealthModelLoader(model_dir=shared, source_dir=source) for _ in range(2)]
+    assert [worker.model_version for worker in workers] == ["v1", "v1"]
+    assert not any(worker.weights_changed() for worker in workers)
+
+    save_model_bundle(predictor.model, source / "pet_health_model.pt", version="v2")
+    assert all(worker.weights_changed() for worker in workers)
+    assert workers[0].reload(warmup_batches=0) == "v2"
+    exported = (shared / "pet_health_model.pt").stat().st_mtime_ns
+    # The second worker finds the export already done and just loads it
+    assert workers[1].reload(warmup_batches=0) == "v2"
+    assert (shared / "pet_health_model.pt").stat().st_mtime_ns == exported
+    assert not any(worker.weights_changed() for worker in workers)
+    assert not [path for path in shared.iterdir() if path.name.endswith(".tmp")]
+    print("✅ Reload re-exports from the source directory")
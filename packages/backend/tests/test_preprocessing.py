@@ -0,0 +1,133 @@
+import io
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image, ImageEnhance, ImageFilter
+
+from app.utils.buffer_pool import BufferPool
+from app.utils.image_processing import assess_quality, decode_image, prepare_image, preprocess_image
+
+# Transform the predictor used before the single-pass pipeline
+REFERENCE_TRANSFORM = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                         std=[0.229, 0.224, 0.225])
+])
+
+
+def make_photo(width, height):
+    """Smooth synthetic photo, similar to tests/create_test_data.py"""
+    y, x = np.mgrid[:height, :width]
+    image = np.stack([
+        255 * x / width,
+        255 * y / height,
+        128 + 100 * np.sin(x / 40.0) * np.cos(y / 40.0),
+    ], axis=-1).astype(np.uint8)
+    return Image.fromarray(image)
+
+
+def test_tensor_matches_reference_transform(predictor):
+    """Single resize + fused normalization matches Resize/ToTensor/Normalize"""
+    image = make_photo(640, 480)
+
+    expected = REFERENCE_TRANSFORM(image).unsqueeze(0)
+    actual = predictor.preprocess_batch([preprocess_image(image)])
+
+    assert actual.shape == expected.shape
+    assert torch.allclose(actual, expected, atol=1e-5)
+    print("✅ Preprocessing matches reference transform")
+
+
+def test_draft_decode_stays_close_to_full_decode(predictor):
+    """Reduced-scale JPEG decode changes the model input only slightly"""
+    buffer = io.BytesIO()
+    make_photo(4000, 3000).save(buffer, format="JPEG", quality=95)
+    contents = buffer.getvalue()
+
+    drafted = decode_image(contents)
+    assert max(drafted.size) < 4000
+    assert min(drafted.size) >= 224
+
+    expected = REFERENCE_TRANSFORM(Image.open(io.BytesIO(contents)).convert("RGB"))
+    actual = predictor.preprocess_batch([preprocess_image(drafted)])[0]
+
+    assert (actual - expected).abs().mean() < 0.05
+    print("✅ Draft decode within tolerance")
+
+
+def test_quality_gate_flags_blur_and_exposure():
+    """Sharp photos pass; blurred, dark and washed-out ones are flagged with scores"""
+    image = decode_image(open("tests/test_data/images/test_pet.jpg", "rb").read())
+
+    scores, issues = assess_quality(preprocess_image(image))
+    assert issues == []
+    assert set(scores) == {"brightness", "contrast", "dark_clipped", "bright_clipped", "sharpness"}
+
+    blurred = image.filter(ImageFilter.GaussianBlur(4))
+    scores_blurred, issues = assess_quality(preprocess_image(blurred))
+    assert issues == ["Image too blurry"]
+    assert scores_blurred["sharpness"] < scores["sharpness"]
+
+    dark = ImageEnhance.Brightness(image).enhance(0.05)
+    assert "Image too dark" in assess_quality(preprocess_image(dark))[1]
+
+    washed_out = ImageEnhance.Brightness(image).enhance(4.0)
+    assert "Image too bright" in assess_quality(preprocess_image(washed_out))[1]
+    print("✅ Quality gate")
+
+
+def test_pooled_inputs_match_fresh_allocations(predictor):
+    """Decoding into a pool slot and batching into the reused input buffer changes no model input"""
+    contents = open("tests/test_data/images/test_pet.jpg", "rb").read()
+    pool = BufferPool((224, 224, 3), size=2)
+    seen = []
+    backend = predictor.backend
+
+    def recording_backend(x):
+        # What the model is given, copied before the buffer is reused
+        seen.append(x.clone())
+        return backend(x)
+
+    predictor.backend = recording_backend
+    with pool.borrow() as pixels:
+        issues, processed, _, _ = prepare_image(contents, out=pixels)
+        assert not issues and processed is pixels
+        assert np.array_equal(pixels, preprocess_image(decode_image(contents)))
+
+        rng = np.random.default_rng(0)
+        noise = [rng.integers(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(2)]
+        batches = [[pixels, np.flipud(pixels), *noise], [np.fliplr(pixels)], [noise[1], pixels]]
+        for batch in batches:
+            features = predictor.extract_features_batch(batch)
+            assert features.shape[0] == len(batch)
+        input_buffer = predictor._input_buffer
+        # Smaller batches reuse the first rows of the same buffer
+        assert len(input_buffer) == 4
+        predictor.extract_features_batch([pixels])
+        assert predictor._input_buffer is input_buffer
+
+    # Every batch, including the smaller ones after a larger one, saw exactly
+    # its own images: no stale, zeroed or cross-written rows
+    for batch, x in zip(batches + [[pixels]], seen):
+        assert torch.equal(x, predictor.preprocess_batch([np.ascontiguousarray(image) for image in batch]))
+    assert not torch.equal(seen[0][0], seen[0][1])
+    assert pool.in_use == 0
+    print("✅ Pooled buffers give the same model inputs")
+
+
+def test_palette_images_are_accepted():
+    """GIFs decode in palette mode and are expanded to RGB, not rejected as unsupported"""
+    buffer = io.BytesIO()
+    make_photo(640, 480).convert("P", palette=Image.Palette.ADAPTIVE).save(buffer, format="GIF")
+    contents = buffer.getvalue()
+    assert Image.open(io.BytesIO(contents)).mode == "P"
+
+    image = decode_image(contents)
+    assert image.mode == "RGB"
+
+    issues, processed, _, _ = prepare_image(contents)
+    assert issues == []
+    assert processed.shape == (224, 224, 3)
+    print("✅ Palette images accepted")
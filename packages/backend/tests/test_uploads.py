@@ -0,0 +1,97 @@
+import asyncio
+import io
+import struct
+import zlib
+
+import pytest
+from PIL import Image
+
+from app.utils.uploads import ImageHeaderParser, UploadRejected, read_upload
+
+
+class _Upload:
+    """Minimal stand-in for UploadFile that records how much was read"""
+
+    def __init__(self, data: bytes, filename="photo"):
+        self.filename = filename
+        self._stream = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._stream.read(size)
+
+    @property
+    def bytes_read(self):
+        return self._stream.tell()
+
+
+def _encode(size, mode="RGB", fmt="JPEG"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color=128 if mode == "L" else (120, 100, 90)).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _png_declaring(width, height):
+    """A tiny PNG whose header claims width x height pixels"""
+    data = bytearray(_encode((8, 8), fmt="PNG"))
+    ihdr = struct.pack(">II", width, height) + bytes(data[24:29])
+    data[16:29] = ihdr
+    data[29:33] = struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return bytes(data)
+
+
+def test_header_parsed_incrementally():
+    """Format, size and mode are known after the first chunks, before any decode"""
+    data = _encode((640, 480))
+    parser = ImageHeaderParser(max_pixels=10_000_000)
+    fed = 0
+    while not parser.feed(data[fed:fed + 64]):
+        fed += 64
+    assert fed < len(data)
+    assert (parser.format, parser.size, parser.mode) == ("JPEG", (640, 480), "RGB")
+    assert parser.issues() == []
+    print("✅ Incremental header parsing")
+
+
+def test_rejections():
+    """Size, pixel-count, format and garbage uploads are refused"""
+    run = asyncio.run
+
+    with pytest.raises(UploadRejected) as e:
+        run(read_upload(_Upload(_encode((640, 480))), max_bytes=1024, max_pixels=10_000_000, chunk_size=256))
+    assert e.value.status_code == 413
+
+    # A decompression bomb is refused from its 100-byte header
+    bomb = _png_declaring(40000, 40000)
+    with pytest.raises(UploadRejected) as e:
+        run(read_upload(_Upload(bomb), max_bytes=1 << 20, max_pixels=50_000_000))
+    assert e.value.status_code == 413
+
+    with pytest.raises(UploadRejected) as e:
+        run(read_upload(_Upload(_encode((640, 480), fmt="PNG")), max_bytes=1 << 20,
+                        max_pixels=10_000_000, allowed_formats=("JPEG",)))
+    assert e.value.status_code == 415
+
+    with pytest.raises(UploadRejected) as e:
+        run(read_upload(_Upload(b"not an image" * 100), max_bytes=1 << 20, max_pixels=10_000_000))
+    assert e.value.status_code == 400
+    print("✅ Upload rejections")
+
+
+def test_header_issues_stop_reading_early():
+    """Low resolution and grayscale photos are answered without reading the rest"""
+    data = _encode((4000, 100), mode="L")
+    upload = _Upload(data)
+    contents, issues = asyncio.run(read_upload(upload, max_bytes=1 << 24, max_pixels=50_000_000, chunk_size=256))
+    assert contents is None
+    assert issues == ["Image resolution too low", "Image format not supported"]
+    assert upload.bytes_read < len(data)
+
+    data = _encode((640, 480))
+    contents, issues = asyncio.run(read_upload(_Upload(data), max_bytes=1 << 24, max_pixels=50_000_000))
+    assert contents == data and issues == []
+
+    # GIFs are palette images, expanded to RGB when decoded
+    data = _encode((640, 480), fmt="GIF")
+    contents, issues = asyncio.run(read_upload(_Upload(data), max_bytes=1 << 24, max_pixels=50_000_000))
+    assert contents == data and issues == []
+    print("✅ Early header issues")
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from app.utils.workers import WorkerPool, ServerBusy
+
+
+def test_admission_is_bounded():
+    """Requests beyond max_pending are rejected until a slot frees up"""
+    pool = WorkerPool(max_pending=2, retry_after=3)
+
+    first = pool.admit()
+    with pool.admit():
+        with pytest.raises(ServerBusy) as excinfo:
+            pool.admit()
+        assert excinfo.value.retry_after == 3
+
+    with first:
+        assert pool.pending == 1
+    assert pool.pending == 0
+    print("✅ Admission queue bounded")
+
+
+def test_run_uses_pool_thread():
+    """Work submitted to the pool runs off the event loop thread"""
+    import threading
+
+    pool = WorkerPool(kind="thread", max_workers=1)
+
+    async def run():
+        return await pool.run(lambda: threading.current_thread().name)
+
+    name = asyncio.run(run())
+    pool.shutdown()
+
+    assert name.startswith("cpu-worker")
+    print("✅ Work runs on the worker pool")